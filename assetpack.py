@@ -0,0 +1,226 @@
+"""The img/ and grf/ assets bundled into one memory-mapped pack file.
+
+Layout: a fixed header, the asset files back to back, then an index of
+(name, offset, size, mtime) entries that the header points at. Opening a pack
+maps the file and reads the index once; an asset is then a memoryview slice of
+the map, with no file lookups and no copying. Build it with
+
+    python assetpack.py --db all_monsters.db
+
+Every build checks the index of the new pack before it replaces the old one;
+--db also checks that every image the database refers to made it into the
+pack, so missing pictures show up at build time rather than on a click.
+"""
+import argparse
+import io
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import time
+import weakref
+
+DEFAULT_PACK_PATH = 'assets.pack'
+
+# Directories, relative to the app, that are packed (and that pages reference)
+ASSET_DIRS = ('img', 'grf')
+
+MAGIC = b'MPAK'
+VERSION = 1
+HEADER = struct.Struct('<4sIIQ')  # magic, version, entry count, index offset
+ENTRY = struct.Struct('<QQqH')  # offset, size, source mtime_ns, name length
+
+class AssetPackError(Exception):
+    pass
+
+def build_pack(path=DEFAULT_PACK_PATH, root='.', asset_dirs=ASSET_DIRS):
+    """Write every file under the asset directories into a pack at path.
+    Returns the number of assets packed."""
+    entries = []
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'wb') as pack:
+        pack.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        for directory in asset_dirs:
+            source_dir = os.path.join(root, directory)
+            if not os.path.isdir(source_dir):
+                continue
+            for name in sorted(os.listdir(source_dir)):
+                source_path = os.path.join(source_dir, name)
+                if not os.path.isfile(source_path):
+                    continue
+                with open(source_path, 'rb') as source:
+                    data = source.read()
+                entries.append((f'{directory}/{name}', pack.tell(), len(data),
+                                os.stat(source_path).st_mtime_ns))
+                pack.write(data)
+
+        index_offset = pack.tell()
+        for name, offset, size, mtime_ns in entries:
+            encoded = name.encode('utf-8')
+            pack.write(ENTRY.pack(offset, size, mtime_ns, len(encoded)))
+            pack.write(encoded)
+        pack.seek(0)
+        pack.write(HEADER.pack(MAGIC, VERSION, len(entries), index_offset))
+
+    try:
+        written = AssetPack(temporary_path)
+        try:
+            problems = index_problems(written)
+        finally:
+            written.close()
+        if problems or len(written) != len(entries):
+            raise AssetPackError(f"{path} was built with a broken index: "
+                                 + "; ".join(problems or [f"{len(written)} of {len(entries)} entries"]))
+    except Exception:
+        os.remove(temporary_path)
+        raise
+    os.replace(temporary_path, path)
+    return len(entries)
+
+def index_problems(pack):
+    """What is wrong with a pack's index: entries that reach outside the
+    asset data or overlap one another. An empty list for a sound pack."""
+    problems = []
+    end = HEADER.size
+    for name, (offset, size, _) in sorted(pack.entries.items(), key=lambda item: item[1][0]):
+        if offset < end:
+            problems.append(f"{name} at {offset} overlaps the data before it")
+        if offset + size > pack.index_offset:
+            problems.append(f"{name} at {offset} runs {offset + size - pack.index_offset} bytes into the index")
+        end = max(end, offset + size)
+    return problems
+
+class AssetPack:
+    """A pack file opened read-only through mmap.
+
+    Names are app-relative paths such as 'img/beh.gif'; lookups ignore case,
+    and a bare file name finds the asset of that name in any directory.
+    """
+
+    def __init__(self, path=DEFAULT_PACK_PATH):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        # Slices handed out by get(), released on close so the map can be
+        self._views = weakref.WeakSet()
+        magic, version, count, index_offset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise AssetPackError(f"{path} is not a version {VERSION} asset pack")
+        self.index_offset = index_offset
+
+        self.entries = {}
+        self._lookup = {}
+        position = index_offset
+        for _ in range(count):
+            offset, size, mtime_ns, name_length = ENTRY.unpack_from(self.map, position)
+            position += ENTRY.size
+            name = bytes(self.view[position:position + name_length]).decode('utf-8')
+            position += name_length
+            self.entries[name] = (offset, size, mtime_ns)
+            self._lookup[name.lower()] = name
+            self._lookup.setdefault(name.rsplit('/', 1)[-1].lower(), name)
+
+    def resolve(self, name):
+        """The packed name an asset reference stands for, or None."""
+        return self._lookup.get(name.replace('\\', '/').lower())
+
+    def __contains__(self, name):
+        return self.resolve(name) is not None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def names(self):
+        return list(self.entries)
+
+    def mtime_ns(self, name):
+        """The modification time of the file an asset was packed from."""
+        return self.entries[self.resolve(name)][2]
+
+    def get(self, name):
+        """The bytes of an asset as a memoryview into the map, or None."""
+        resolved = self.resolve(name)
+        if resolved is None:
+            return None
+        offset, size, _ = self.entries[resolved]
+        view = self.view[offset:offset + size]
+        self._views.add(view)
+        return view
+
+    def open(self, name):
+        """A read-only file object over a copy of an asset, so it outlives the
+        pack; raises KeyError if it is not packed."""
+        resolved = self.resolve(name)
+        if resolved is None:
+            raise KeyError(name)
+        offset, size, _ = self.entries[resolved]
+        return io.BytesIO(self.map[offset:offset + size])
+
+    def close(self):
+        """Unmap the pack. Views from get() are released and can no longer be
+        read. If a caller still holds a slice of one, the map is dropped
+        instead, and unmapped once the last slice is collected."""
+        for view in list(self._views) + [self.view]:
+            try:
+                view.release()
+            except BufferError:
+                pass  # Exported onwards; the map below stays pinned by it
+        self._views = weakref.WeakSet()
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+        self.view = self.map = None
+
+def open_pack(path=DEFAULT_PACK_PATH):
+    """Open the pack at path, or return None if there is none."""
+    try:
+        return AssetPack(path)
+    except FileNotFoundError:
+        return None
+
+def missing_images(pack, db_path, image_dir='img'):
+    """The images.image_url values in a database with no packed asset under
+    image_dir. Full relative paths are compared: a picture of the same name
+    in another directory, such as grf/, does not count."""
+    conn = sqlite3.connect(db_path)
+    try:
+        urls = [row[0] for row in conn.execute('SELECT DISTINCT image_url FROM images')]
+    finally:
+        conn.close()
+    packed = {name.lower() for name in pack.names()}
+    return [url for url in urls if url and f'{image_dir}/{url}'.replace('\\', '/').lower() not in packed]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack img/ and grf/ into one memory-mapped file.")
+    parser.add_argument('--output', default=DEFAULT_PACK_PATH)
+    parser.add_argument('--root', default='.', help="directory holding img/ and grf/")
+    parser.add_argument('--db', help="check that every image this database refers to is packed")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        count = build_pack(args.output, args.root)
+    except AssetPackError as e:
+        print(e)
+        return 1
+    elapsed = time.perf_counter() - start
+    print(f"Packed {count} assets into {args.output} ({os.path.getsize(args.output):,} bytes) "
+          f"in {elapsed:.2f}s")
+
+    if args.db:
+        pack = AssetPack(args.output)
+        missing = missing_images(pack, args.db)
+        pack.close()
+        for url in missing:
+            print(f"Missing image: {url}")
+        if missing:
+            print(f"{len(missing)} images in {args.db} are not in the pack")
+            return 1
+        print(f"All images in {args.db} are packed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Database size and query latency with full_body inline versus split out and compressed.
+
+Run from the repository root against a populated database:
+
+    python -m benchmarks.body_storage --db all_monsters.db
+
+The database is copied into a scratch directory twice. The "before" copy is
+put back into the original layout: full_body stored uncompressed in the
+monsters table, with rendered pages uncompressed too. The "after" copy is left
+as dbinsert builds it. Both copies are vacuumed before being measured.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import bodystore
+import monsterdb
+
+# Undo the split: put the decompressed pages back into the monsters table
+def inline_bodies(conn):
+    dictionary = conn.execute("SELECT dictionary FROM compression_dictionaries WHERE name = 'pages'").fetchone()
+    dictionary = dictionary[0] if dictionary else None
+    with conn:
+        conn.execute('ALTER TABLE monsters ADD COLUMN full_body TEXT')
+        conn.executemany('UPDATE monsters SET full_body = ? WHERE id = ?', [
+            (bodystore.decompress(body, dictionary), monster_id)
+            for monster_id, body in conn.execute('SELECT monster_id, body FROM monster_bodies').fetchall()
+        ])
+        conn.executemany('UPDATE rendered_pages SET html = ? WHERE monster_id = ?', [
+            (bodystore.decompress(html, dictionary), monster_id)
+            for monster_id, html in conn.execute('SELECT monster_id, html FROM rendered_pages').fetchall()
+        ])
+        conn.execute('DROP TABLE monster_bodies')
+        conn.execute('DELETE FROM compression_dictionaries')
+
+# Time a call `repeat` times and return (median, max) in milliseconds
+def time_call(call, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies), max(latencies)
+
+def run(path, ids, repeat, inline):
+    db = monsterdb.MonsterDB(path)
+    conn = sqlite3.connect(path)
+    choose = random.Random(0).choice
+    results = {
+        'list (title index)': time_call(lambda: conn.execute(monsterdb.QUERIES['list']).fetchall(), repeat),
+        'list (table scan)': time_call(
+            lambda: conn.execute('SELECT id, title FROM monsters NOT INDEXED').fetchall(), repeat),
+        'search': time_call(lambda: db.get_monster_list('dr'), repeat),
+    }
+    if inline:
+        details = lambda: conn.execute('SELECT title, full_body FROM monsters WHERE id = ?',
+                                       (choose(ids),)).fetchone()
+        page = lambda: conn.execute('SELECT html, content_hash FROM rendered_pages WHERE monster_id = ?',
+                                    (choose(ids),)).fetchone()
+    else:
+        # Includes decompressing the page
+        details = lambda: db.get_monster_details(choose(ids))
+        page = lambda: db.get_monster_page(choose(ids))
+    results['details'] = time_call(details, repeat)
+    results['page'] = time_call(page, repeat)
+    conn.close()
+    db.close()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='all_monsters.db')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        paths = {name: os.path.join(scratch, f'{name}.db') for name in ('before', 'after')}
+        for name, path in paths.items():
+            conn = sqlite3.connect(path)
+            with sqlite3.connect(args.db) as source:
+                source.backup(conn)
+            if name == 'before':
+                inline_bodies(conn)
+            conn.execute('VACUUM')
+            conn.close()
+
+        conn = sqlite3.connect(paths['after'])
+        ids = [row[0] for row in conn.execute('SELECT id FROM monsters')]
+        conn.close()
+        if not ids:
+            raise SystemExit(f"{args.db} has no monsters; build it with dbinsert.py first")
+
+        sizes = {name: os.path.getsize(path) for name, path in paths.items()}
+        before = run(paths['before'], ids, args.repeat, inline=True)
+        after = run(paths['after'], ids, args.repeat, inline=False)
+
+    print(f"{len(ids)} monsters, {args.repeat} runs per query (median / max ms)\n")
+    print(f"{'database size':<24}{sizes['before'] / 1e6:>17.2f} MB{sizes['after'] / 1e6:>17.2f} MB\n")
+    print(f"{'query':<24}{'before':>20}{'after':>20}")
+    for name in before:
+        b_median, b_max = before[name]
+        a_median, a_max = after[name]
+        print(f"{name:<24}{b_median:>11.3f} /{b_max:>7.2f}{a_median:>11.3f} /{a_max:>7.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Synthetic ALL_Monsters.json files for benchmarking.
+
+The repository's all_monsters.db is empty and the real compendium is not
+shipped, so the benchmarks ingest a generated one instead. It is the same
+shape as the real file: monsters with one to several statblocks (age
+categories, variants) in the notations the parsers handle, HTML pages with
+stat tables, lore, scripts and comments for the renderer to strip, and
+references to the pictures in img/. Scale 1 is about the size of the real
+compendium; 10 and 100 are for seeing how things grow.
+
+    python -m benchmarks.compendium --scale 10 --output ALL_Monsters_10x.json
+
+Output is deterministic for a given scale and seed, and is written as it is
+generated, so even the 100x file never has to fit in memory.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# Roughly the number of monsters in the real compendium (one picture each in img/)
+REAL_COMPENDIUM_MONSTERS = 2000
+
+# Bumped whenever the output changes, so cached files are regenerated
+GENERATOR_VERSION = 1
+
+SYLLABLES = ['ar', 'bel', 'dra', 'gor', 'kith', 'mor', 'nag', 'ol', 'quel', 'rak', 'sha', 'thri', 'ul',
+             'vex', 'wyr', 'xan', 'zor', 'ith', 'bul', 'cor', 'dim', 'fen', 'gri', 'hoth']
+KINDS = ['Dragon', 'Giant', 'Golem', 'Ghoul', 'Orc', 'Goblin', 'Beholder', 'Elemental', 'Lycanthrope', 'Naga',
+         'Spider', 'Wolf', 'Troll', 'Mephit', 'Undead', 'Beetle', 'Fungus', 'Ooze', 'Sphinx', 'Treant']
+AGE_CATEGORIES = ['Hatchling', 'Very young', 'Young', 'Juvenile', 'Young adult', 'Adult', 'Mature adult',
+                  'Old', 'Very old', 'Venerable', 'Wyrm', 'Great wyrm']
+VARIANTS = ['Lesser', 'Common', 'Greater', 'Elder', 'Chieftain', 'Shaman', 'Warrior']
+SETTINGS = ['Forgotten Realms', 'Greyhawk', 'Dark Sun', 'Ravenloft', 'Spelljammer', 'Planescape',
+            'Dragonlance', 'Mystara', 'Al-Qadim', None]
+SOURCES = ['MC1', 'MC2', 'MC3', 'MC5', 'MC7', 'MC8', 'MC11', 'MC12', 'MC13', 'MC14', 'MM', 'MCA1', 'MCA2']
+
+CLIMATES = ['Tropical', 'Subtropical', 'Temperate', 'Arctic', 'Sub-arctic', 'Any', 'Warm', 'Cold']
+TERRAINS = ['forest', 'jungle', 'hills', 'mountains', 'desert', 'plains', 'swamp', 'subterranean',
+            'ocean', 'rivers', 'ruins', 'land', 'Astral plane', 'urban']
+FREQUENCIES = ['Common', 'Common', 'Uncommon', 'Uncommon', 'Rare', 'Rare', 'Very rare', 'Unique']
+ORGANIZATIONS = ['Solitary', 'Pack', 'Tribe', 'Clan', 'Hive', 'Family', 'Flock', 'Band']
+ACTIVITY_CYCLES = ['Day', 'Night', 'Any', 'Dusk and dawn', 'Nocturnal']
+DIETS = ['Carnivore', 'Omnivore', 'Herbivore', 'Special', 'Nil', 'Life energy']
+INTELLIGENCE = ['Non- (0)', 'Animal (1)', 'Semi- (2-4)', 'Low (5-7)', 'Average (8-10)', 'Very (11-12)',
+                'High (13-14)', 'Exceptional (15-16)', 'Genius (17-18)', 'Supra-genius (19-20)']
+ALIGNMENTS = ['Lawful good', 'Neutral good', 'Chaotic good', 'Lawful neutral', 'Neutral', 'Chaotic neutral',
+              'Lawful evil', 'Neutral evil', 'Chaotic evil']
+MORALES = ['Unreliable (2-4)', 'Unsteady (5-7)', 'Average (8-10)', 'Steady (11-12)', 'Elite (13-14)',
+           'Champion (15-16)', 'Fanatic (17-18)', 'Fearless (19-20)']
+SIZES = ['T (1\' tall)', 'S (3\' tall)', 'M (6\' tall)', 'L (10\' long)', 'H (20\' tall)', 'G (40\' long)',
+         'S-M', 'L-H']
+SPECIAL = ['Nil', 'See below', 'Breath weapon', 'Poison', 'Surprise', 'Level drain', '+1 or better weapon to hit',
+           'Immune to sleep and charm', 'Spell use', 'Regeneration']
+
+WORDS = ('the a of and in its lair creature hunts prey beneath ancient ruins dwell tribe often young hoard '
+         'treasure guards sacred grove undead giant dragon magic spells attack fearsome claws venom night '
+         'villages travellers rarely speak common tongue servants master deep caverns forest river '
+         'mountain desert sun blood stone ritual priests worship elder power fire cold acid lightning').split()
+
+def monster_name(rng):
+    name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+    return f"{name} {rng.choice(KINDS)}" if rng.random() < 0.5 else name
+
+def sentence(rng, low=8, high=22):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    return ' '.join(words).capitalize() + '.'
+
+def paragraph(rng, sentences=(3, 7)):
+    return ' '.join(sentence(rng) for _ in range(rng.randint(*sentences)))
+
+def hit_dice(rng):
+    dice = rng.randint(1, 16)
+    return rng.choice([str(dice), f"{dice}+{rng.randint(1, 4)}", f"{dice}-{dice + rng.randint(1, 3)}",
+                       '1/2', '1-1', f"{dice} ({dice * 8} hp)"])
+
+def xp_value(rng, dice):
+    xp = max(7, int(dice * dice * rng.uniform(10, 60)))
+    return rng.choice([f"{xp:,}", f"{xp:,}", str(xp), f"{xp}-{xp * 2}", 'Nil'])
+
+def statblock(rng, strength):
+    """One statblock; strength scales the numbers, so age categories grow."""
+    dice = max(1, int(strength))
+    return {
+        'Climate/Terrain': rng.choice([f"{rng.choice(CLIMATES)} {rng.choice(TERRAINS)}",
+                                       f"Any {rng.choice(TERRAINS)}",
+                                       f"{rng.choice(CLIMATES)}/{rng.choice(TERRAINS).capitalize()}",
+                                       'Any']),
+        'Frequency': rng.choice(FREQUENCIES),
+        'Organization': rng.choice(ORGANIZATIONS),
+        'Activity Cycle': rng.choice(ACTIVITY_CYCLES),
+        'Diet': rng.choice(DIETS),
+        'Intelligence': rng.choice(INTELLIGENCE),
+        'Treasure': rng.choice(['Nil', 'A', 'B, Q', 'H', 'Z', 'Incidental', 'See below']),
+        'Alignment': rng.choice(ALIGNMENTS),
+        'No. Appearing': rng.choice(['1', '1-4', '2-12', '1d6', '2d10', '3d4+2', '2d10 x 5', '1-4 or 2d6',
+                                     '1 (2-5)', 'See below']),
+        'Armor Class': rng.choice([str(rng.randint(-4, 10)), f"{rng.randint(0, 8)} (base)",
+                                   f"{rng.randint(0, 5)}/{rng.randint(5, 9)}", f"{10 - dice // 2}"]),
+        'Movement': rng.choice(['12', '9', '6, Sw 12', '9, Fl 30 (C)', '3, Br 1', '15, Fl 18 (D), Jp 3']),
+        'Hit Dice': hit_dice(rng) if dice < 4 else rng.choice([str(dice), f"{dice}+{dice}", hit_dice(rng)]),
+        'THAC0': rng.choice([str(max(1, 21 - dice)), f"{max(1, 21 - dice)} ({max(1, 19 - dice)})",
+                             f"{dice} HD: {max(1, 21 - dice)}"]),
+        'No. of Attacks': rng.choice(['1', '2', '3', '2 or 1', '1 + special']),
+        'Damage/Attack': rng.choice(['1d4', '1d6/1d6/2d8', '2-8', 'By weapon', f"{dice}d4+{dice}",
+                                     '1d8 or by weapon']),
+        'Special Attacks': rng.choice(SPECIAL),
+        'Special Defenses': rng.choice(SPECIAL),
+        'Magic Resistance': rng.choice(['Nil', f"{rng.randint(1, 19) * 5}%", 'See below']),
+        'Size': rng.choice(SIZES),
+        'Morale': rng.choice(MORALES),
+        'XP Value': xp_value(rng, dice),
+    }
+
+def statblocks(rng, kind):
+    if kind == 'age':
+        start = rng.randint(0, 3)
+        return {age: statblock(rng, 3 + 2 * (start + i))
+                for i, age in enumerate(AGE_CATEGORIES[start:start + rng.randint(4, 9)])}
+    if kind == 'variants':
+        strength = rng.uniform(1, 8)
+        return {variant: statblock(rng, strength * (1 + i * 0.5))
+                for i, variant in enumerate(rng.sample(VARIANTS, rng.randint(2, 4)))}
+    return {'': statblock(rng, rng.uniform(0.5, 14))}
+
+def stat_table(blocks):
+    names = list(blocks)
+    rows = []
+    if len(names) > 1:
+        rows.append('<tr><td></td>' + ''.join(f'<th>{name}</th>' for name in names) + '</tr>')
+    for field in next(iter(blocks.values())):
+        cells = ''.join(f'<td>{blocks[name][field]}</td>' for name in names)
+        rows.append(f'<tr><td class="label">{field}:</td>{cells}</tr>')
+    return '<table class="statblock">\n' + '\n'.join(rows) + '\n</table>'
+
+def full_body(rng, title, blocks, images):
+    pictures = ''.join(f'<p><img src="../img/{image}" alt="{title}"></p>' for image in images)
+    sections = ''.join(f'<h3>{heading}</h3>\n<p>{paragraph(rng)}</p>\n'
+                       for heading in ('Combat', 'Habitat/Society', 'Ecology') if rng.random() < 0.9)
+    return (
+        f'<html><head><title>{title}</title>\n'
+        '<script type="text/javascript">function toggle(id) { var e = document.getElementById(id); '
+        'e.style.display = e.style.display == "none" ? "" : "none"; }</script>\n'
+        '<link rel="stylesheet" href="../grf/style.css"></head>\n'
+        f'<body onload="toggle(\'lore\')">\n<!-- generated page -->\n<h1>{title}</h1>\n{pictures}\n'
+        f'{stat_table(blocks)}\n<p id="lore">{paragraph(rng, (4, 10))}</p>\n{sections}'
+        f'<p class="credit">Source: {rng.choice(SOURCES)}</p>\n</body></html>'
+    )
+
+def image_names(image_dir='img'):
+    """The real pictures, so generated pages and image rows point at files that exist."""
+    try:
+        names = sorted(os.listdir(image_dir))
+    except FileNotFoundError:
+        names = []
+    return names or [f"synthetic{i:04d}.gif" for i in range(REAL_COMPENDIUM_MONSTERS)]
+
+def generate_monster(index, rng, images, titles):
+    kind = rng.choices(['single', 'age', 'variants'], weights=[80, 7, 13])[0]
+    title = monster_name(rng)
+    if kind == 'age':
+        title = f"Dragon, {title}"
+    while title in titles:
+        title = f"{title} ({rng.choice(VARIANTS)})"
+    titles.add(title)
+
+    blocks = statblocks(rng, kind)
+    pictures = [images[index % len(images)]] + ([rng.choice(images)] if rng.random() < 0.15 else [])
+    return {
+        'monster_key': f"synthetic-{index:07d}",
+        'title': title,
+        'sources': sorted(set(rng.sample(SOURCES, rng.randint(1, 2)))),
+        'monster_data': {
+            'setting': rng.choice(SETTINGS),
+            'fullBody': full_body(rng, title, blocks, pictures if rng.random() < 0.9 else []),
+            'statblock': blocks,
+            'images': pictures,
+        },
+    }
+
+def iter_compendium(scale=1, seed=0, image_dir='img'):
+    rng = random.Random(seed)
+    images = image_names(image_dir)
+    titles = set()
+    for index in range(int(REAL_COMPENDIUM_MONSTERS * scale)):
+        yield generate_monster(index, rng, images, titles)
+
+def write_compendium(path, scale=1, seed=0, image_dir='img'):
+    """Write a synthetic compendium to path. Returns the number of monsters."""
+    count = 0
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as out:
+        out.write('[\n')
+        for monster in iter_compendium(scale, seed, image_dir):
+            if count:
+                out.write(',\n')
+            out.write(json.dumps(monster))
+            count += 1
+        out.write('\n]\n')
+    os.replace(temporary_path, path)
+    return count
+
+def compendium_path(directory, scale, seed=0):
+    """Where a cached compendium for scale and seed lives in directory."""
+    return os.path.join(directory, f"ALL_Monsters-{scale:g}x-seed{seed}-v{GENERATOR_VERSION}.json")
+
+def ensure_compendium(directory, scale, seed=0, image_dir='img'):
+    """The path of a compendium for scale and seed, generating it if it is not cached."""
+    path = compendium_path(directory, scale, seed)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        write_compendium(path, scale, seed, image_dir)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic ALL_Monsters.json.")
+    parser.add_argument('--scale', type=float, default=1,
+                        help=f"size relative to the real compendium, {REAL_COMPENDIUM_MONSTERS} monsters")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--images', default='img', help="directory of pictures to refer to")
+    parser.add_argument('--output', default='ALL_Monsters.json')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count = write_compendium(args.output, args.scale, args.seed, args.images)
+    print(f"Wrote {count} monsters to {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB) "
+          f"in {time.perf_counter() - start:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
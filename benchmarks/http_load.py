@@ -0,0 +1,188 @@
+"""Load test for monsterserver.py: latency percentiles and requests per second.
+
+Run from the repository root against a populated database:
+
+    python -m benchmarks.http_load --db all_monsters.db --connections 32 --seconds 10
+
+starts the service in a subprocess on a free port and drives it with
+keep-alive connections from one asyncio client, each sending a mix of list,
+search, detail, page, image and encounter requests. Pass --url to test a
+service that is already running instead.
+"""
+import argparse
+import asyncio
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+SEARCH_TERMS = ['dr', 'orc', 'gob', 'giant', 'lair', 'undead', 'x']
+TERRAINS = ['forest', 'desert', 'hill', 'subterranean', '']
+
+# (endpoint name, weight)
+MIX = [
+    ('list', 2),
+    ('search', 20),
+    ('detail', 25),
+    ('page', 20),
+    ('page_cached', 10),
+    ('image', 15),
+    ('encounter', 8),
+]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def sample_data(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        ids = [row[0] for row in conn.execute('SELECT id FROM monsters')]
+        images = [row[0] for row in conn.execute('SELECT DISTINCT image_url FROM images LIMIT 500')]
+    finally:
+        conn.close()
+    return ids, images
+
+def make_target(name, rng, ids, images):
+    if name == 'list':
+        return '/monsters'
+    if name == 'search':
+        return '/monsters?q=' + quote(rng.choice(SEARCH_TERMS))
+    if name == 'detail':
+        return f'/monsters/{rng.choice(ids)}'
+    if name in ('page', 'page_cached'):
+        return f'/monsters/{rng.choice(ids)}/page'
+    if name == 'image':
+        return '/images/' + quote(rng.choice(images)) if images else '/monsters'
+    return f'/encounters?level={rng.randint(1, 12)}&terrain={rng.choice(TERRAINS)}&count=5'
+
+async def request(reader, writer, host, target, etag=None):
+    """Send one keep-alive GET; returns (status, etag)."""
+    lines = [f'GET {target} HTTP/1.1', f'Host: {host}', 'Accept-Encoding: gzip']
+    if etag:
+        lines.append(f'If-None-Match: {etag}')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    response_etag = None
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'etag':
+            response_etag = value.strip()
+    if length:
+        await reader.readexactly(length)
+    return status, response_etag
+
+async def client(host, port, deadline, rng, ids, images, results):
+    reader, writer = await asyncio.open_connection(host, port)
+    names = [name for name, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    etags = {}
+    pages_seen = []
+    try:
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            # A revisit: ask again for a page this client already has
+            if name == 'page_cached' and pages_seen:
+                target = rng.choice(pages_seen)
+            else:
+                target = make_target(name, rng, ids, images)
+            etag = etags.get(target) if name == 'page_cached' else None
+            start = time.perf_counter()
+            status, response_etag = await request(reader, writer, f'{host}:{port}', target, etag)
+            elapsed = (time.perf_counter() - start) * 1000
+            if response_etag and target not in etags:
+                etags[target] = response_etag
+                if name.startswith('page'):
+                    pages_seen.append(target)
+            results.setdefault(name, []).append(elapsed)
+            results.setdefault('status', {}).setdefault(status, 0)
+            results['status'][status] += 1
+    finally:
+        writer.close()
+
+async def run(host, port, connections, seconds, ids, images, seed):
+    results = {}
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(host, port, deadline, random.Random(seed + i), ids, images, results)
+        for i in range(connections)
+    ))
+    return results, time.perf_counter() - start
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def wait_for_port(host, port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise SystemExit(f"service did not start on {host}:{port}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='all_monsters.db', help="database to serve and to pick ids from")
+    parser.add_argument('--url', help="test a running service, e.g. http://127.0.0.1:8080")
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4, help="service database threads")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    ids, images = sample_data(args.db)
+    if not ids:
+        raise SystemExit(f"{args.db} has no monsters; build it with dbinsert.py first")
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        server = subprocess.Popen([sys.executable, 'monsterserver.py', '--db', args.db, '--port', str(port),
+                                   '--workers', str(args.workers), '--log-level', 'WARNING'])
+        wait_for_port(host, port)
+    try:
+        results, elapsed = asyncio.run(run(host, port, args.connections, args.seconds, ids, images, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    statuses = results.pop('status', {})
+    total = sum(len(latencies) for latencies in results.values())
+    print(f"{total:,} requests over {args.connections} connections in {elapsed:.1f}s: "
+          f"{total / elapsed:,.0f} requests/s")
+    print(f"statuses: {dict(sorted(statuses.items()))}\n")
+    print(f"{'endpoint':<14}{'requests':>10}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    everything = []
+    for name, _ in MIX:
+        latencies = results.get(name)
+        if not latencies:
+            continue
+        everything.extend(latencies)
+        print(f"{name:<14}{len(latencies):>10}{percentile(latencies, 0.5):>10.2f}"
+              f"{percentile(latencies, 0.99):>10.2f}{statistics.mean(latencies):>10.2f}")
+    print(f"{'all':<14}{len(everything):>10}{percentile(everything, 0.5):>10.2f}"
+          f"{percentile(everything, 0.99):>10.2f}{statistics.mean(everything):>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Per-query latency of monsterui.py's hot queries, before and after the indexes.
+
+Run from the repository root against a populated database:
+
+    python -m benchmarks.query_latency --db all_monsters.db
+
+The database is copied into a scratch file first, so the original is never
+modified. The "before" run drops the indexes and uses the queries as they
+were originally written (LIKE title search); the "after" run recreates them
+with dbinsert.create_indexes and searches through monsters_fts.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import dbinsert
+import monsterdb
+
+SEARCH_TERMS = ['dr', 'orc', 'gob', 'giant', 'lair', 'x']
+
+# Search parameters for the original LIKE query and the current FTS5 query
+def search_params(ids, indexed):
+    term = random.choice(SEARCH_TERMS)
+    if indexed:
+        return (monsterdb.fts_query(term), monsterdb.SEARCH_LIMIT)
+    return (f"%{term}%",)
+
+# Snippets are only made for the first screenful of search results
+def snippet_params(ids, indexed):
+    term = random.choice(SEARCH_TERMS)
+    shown = random.sample(ids, min(len(ids), monsterdb.SNIPPET_ROWS))
+    return (monsterdb.fts_query(term), json.dumps(shown))
+
+def id_params(ids, indexed):
+    return (random.choice(ids),)
+
+# name -> (original sql, current sql, params factory)
+HOT_QUERIES = {
+    'list_all': (
+        "SELECT id, title FROM monsters",
+        monsterdb.QUERIES['list'],
+        lambda ids, indexed: (),
+    ),
+    'search': (
+        "SELECT id, title FROM monsters WHERE LOWER(title) LIKE ?",
+        monsterdb.QUERIES['search'],
+        search_params,
+    ),
+    # The original search had no snippets, so both runs use the current query
+    'search_snippets': (
+        monsterdb.QUERIES['snippets'],
+        monsterdb.QUERIES['snippets'],
+        snippet_params,
+    ),
+    # full_body has since moved to monster_bodies (see benchmarks/body_storage.py),
+    # so both runs use the current query
+    'get_monster_details': (
+        monsterdb.QUERIES['details'],
+        monsterdb.QUERIES['details'],
+        id_params,
+    ),
+    'get_monster_images': (
+        "SELECT image_url FROM images WHERE monster_id = ?",
+        monsterdb.QUERIES['images'],
+        id_params,
+    ),
+    'statblocks_for_monster': (
+        "SELECT * FROM statblocks WHERE monster_id = ?",
+        "SELECT * FROM statblocks WHERE monster_id = ?",
+        id_params,
+    ),
+}
+
+# Time a query `repeat` times and return the latencies in milliseconds
+def time_query(conn, sql, params_factory, ids, repeat, indexed):
+    latencies = []
+    for _ in range(repeat):
+        params = params_factory(ids, indexed)
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def run(conn, ids, repeat, indexed):
+    results = {}
+    for name, (before_sql, after_sql, params_factory) in HOT_QUERIES.items():
+        sql = after_sql if indexed else before_sql
+        latencies = time_query(conn, sql, params_factory, ids, repeat, indexed)
+        plan = dbinsert.explain_query_plan(conn, sql, params_factory(ids, indexed))
+        results[name] = (statistics.median(latencies), max(latencies), plan)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='all_monsters.db')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        conn = sqlite3.connect(os.path.join(scratch, 'bench.db'))
+        with sqlite3.connect(args.db) as source:
+            source.backup(conn)
+
+        ids = [row[0] for row in conn.execute('SELECT id FROM monsters')]
+        if not ids:
+            raise SystemExit(f"{args.db} has no monsters; build it with dbinsert.py first")
+
+        random.seed(args.seed)
+        with conn:
+            dbinsert.drop_indexes(conn)
+        before = run(conn, ids, args.repeat, indexed=False)
+
+        random.seed(args.seed)
+        with conn:
+            dbinsert.create_indexes(conn)
+            conn.execute('ANALYZE')
+        after = run(conn, ids, args.repeat, indexed=True)
+        conn.close()
+
+    print(f"{len(ids)} monsters, {args.repeat} runs per query (median / max ms)\n")
+    print(f"{'query':<24}{'before':>20}{'after':>20}")
+    for name in HOT_QUERIES:
+        b_median, b_max, _ = before[name]
+        a_median, a_max, _ = after[name]
+        print(f"{name:<24}{b_median:>11.3f} /{b_max:>7.2f}{a_median:>11.3f} /{a_max:>7.2f}")
+
+    print("\nQuery plans:")
+    for name in HOT_QUERIES:
+        print(f"  {name}")
+        print(f"    before: {'; '.join(before[name][2])}")
+        print(f"    after:  {'; '.join(after[name][2])}")
+
+if __name__ == "__main__":
+    main()
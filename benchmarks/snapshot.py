@@ -0,0 +1,108 @@
+"""Search and detail latency reading the database file versus a snapshot.
+
+Run from the repository root against a populated database:
+
+    python -m benchmarks.snapshot --db all_monsters.db --evict
+
+times the same searches and detail fetches through a MonsterDB reading the
+file, one reading it through mmap and one holding an in-memory copy. With
+--evict the file is dropped from the OS page cache before every query (with
+posix_fadvise), which is what a slow disk or a network home directory looks
+like to the file-backed modes. It also times hot-swapping the in-memory copy
+after the file changes.
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import monsterdb
+
+SEARCH_TERMS = ['dr', 'orc', 'gob', 'giant', 'lair', 'undead', 'x']
+
+def evict(path):
+    """Ask the OS to drop the cached pages of a database and its WAL."""
+    for file_path in (path, path + '-wal'):
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+def time_call(call, repeat, before=None):
+    latencies = []
+    for i in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        call(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies), max(latencies)
+
+def run(path, mode, ids, repeat, cold):
+    db = monsterdb.MonsterDB(path, snapshot=mode)
+    start = time.perf_counter()
+    db.dictionary()  # First query: opens a connection, and takes the snapshot if there is one
+    opened = (time.perf_counter() - start) * 1000
+    before = (lambda: evict(path)) if cold else None
+    rng = random.Random(0)
+    picks = [rng.choice(ids) for _ in range(repeat)]
+    results = {
+        'open': (opened, opened),
+        'search': time_call(lambda i: db.get_monster_list(SEARCH_TERMS[i % len(SEARCH_TERMS)]), repeat, before),
+        'detail': time_call(lambda i: db.get_monster_page(picks[i]), repeat, before),
+        'images': time_call(lambda i: db.get_monster_images(picks[i]), repeat, before),
+    }
+    if mode == 'memory':
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute("UPDATE monsters SET title = title WHERE id = ?", (ids[0],))
+        conn.close()
+        start = time.perf_counter()
+        swapped = db.refresh()
+        results['hot swap'] = ((time.perf_counter() - start) * 1000,) * 2 if swapped else (float('nan'),) * 2
+    db.close()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='all_monsters.db')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--evict', action='store_true', help="drop the file from the OS cache before each query")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # A copy, since the hot-swap run writes to it
+        path = os.path.join(scratch, 'snapshot.db')
+        shutil.copyfile(args.db, path)
+        conn = sqlite3.connect(path)
+        ids = [row[0] for row in conn.execute('SELECT id FROM monsters')]
+        conn.close()
+        if not ids:
+            raise SystemExit(f"{args.db} has no monsters; build it with dbinsert.py first")
+
+        modes = {'file': None, 'mmap': 'mmap', 'memory': 'memory'}
+        results = {name: run(path, mode, ids, args.repeat, args.evict) for name, mode in modes.items()}
+
+    print(f"{len(ids)} monsters, {args.repeat} runs per query{', page cache evicted' if args.evict else ''} "
+          f"(median / max ms)\n")
+    print(f"{'query':<12}" + ''.join(f"{name:>20}" for name in modes))
+    for query in results['memory']:
+        cells = []
+        for name in modes:
+            if query in results[name]:
+                median, worst = results[name][query]
+                cells.append(f"{median:>11.3f} /{worst:>7.2f}")
+            else:
+                cells.append(f"{'-':>20}")
+        print(f"{query:<12}" + ''.join(cells))
+
+if __name__ == "__main__":
+    main()
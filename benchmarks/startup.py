@@ -0,0 +1,81 @@
+"""Time from launch to first frame and to a filled list for monsterui.py.
+
+Needs a display (on a headless machine, run it under xvfb-run). From the
+repository root:
+
+    python -m benchmarks.startup --db all_monsters.db --runs 10
+
+launches the browser repeatedly with --startup-metrics --exit-after-startup:
+first with the title snapshot deleted before every run, so the list comes from
+a query, then with the snapshot in place. Reports the median and worst times
+of each startup mark, and exits with status 1 if the median time to first
+frame misses startup.FIRST_FRAME_TARGET_MS.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import monsterdb
+from startup import FIRST_FRAME_TARGET_MS, LAUNCHED_AT_ENV
+
+# A mark line in the startup report: "     123.4  first frame"
+MARK_RE = re.compile(r"^\s+([\d.]+)\s{2}(\S.*)$")
+
+def launch(db_path):
+    """Run the browser once and return {mark: ms since launch}."""
+    env = dict(os.environ, **{LAUNCHED_AT_ENV: repr(time.time())})
+    result = subprocess.run(
+        [sys.executable, 'monsterui.py', '--db', db_path, '--startup-metrics', '--exit-after-startup'],
+        env=env, capture_output=True, text=True, timeout=60,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"monsterui.py failed:\n{result.stderr}")
+    marks = {}
+    for line in result.stderr.splitlines():
+        match = MARK_RE.match(line)
+        if match:
+            # "list shown (snapshot)" and "list shown (database)" are one column
+            marks[match.group(2).split(' (')[0]] = float(match.group(1))
+    return marks
+
+def summarize(runs):
+    names = list(dict.fromkeys(name for marks in runs for name in marks))
+    return {name: (statistics.median(marks[name] for marks in runs if name in marks),
+                   max(marks[name] for marks in runs if name in marks))
+            for name in names}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='all_monsters.db')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    snapshot_path = monsterdb.title_snapshot_path(args.db)
+    cold = []
+    for _ in range(args.runs):
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        cold.append(launch(args.db))
+    # The last cold run rewrote the snapshot; make sure it is there regardless
+    monsterdb.write_title_snapshot(args.db)
+    warm = [launch(args.db) for _ in range(args.runs)]
+
+    print(f"{args.runs} launches each, ms since launch (median / max)\n")
+    print(f"{'mark':<20}{'no snapshot':>20}{'snapshot':>20}")
+    cold_summary, warm_summary = summarize(cold), summarize(warm)
+    for name in dict.fromkeys([*cold_summary, *warm_summary]):
+        cells = [f"{s[name][0]:>11.1f} /{s[name][1]:>7.1f}" if name in s else f"{'-':>20}"
+                 for s in (cold_summary, warm_summary)]
+        print(f"{name:<20}{cells[0]}{cells[1]}")
+
+    first_frame = warm_summary.get('first frame', (float('inf'),))[0]
+    verdict = "within" if first_frame <= FIRST_FRAME_TARGET_MS else "OVER"
+    print(f"\nMedian time to first frame {first_frame:.1f} ms, {verdict} the {FIRST_FRAME_TARGET_MS} ms target")
+    return 0 if first_frame <= FIRST_FRAME_TARGET_MS else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
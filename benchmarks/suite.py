@@ -0,0 +1,284 @@
+"""End-to-end benchmarks on synthetic compendiums, with results as JSON.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --scales 1 10 --output results.json
+    python -m benchmarks.suite --scales 1 --compare results.json
+
+For each scale (relative to the real compendium; see benchmarks/compendium.py)
+a compendium is generated, or reused from --workdir, and ingested into a fresh
+database. The suite then times what the apps do against it:
+
+    ingest          dbinsert.bulk_load of the whole file with --workers (one run)
+    sync_unchanged  dbinsert.sync_monsters of the same file again (one run)
+    list            the browser's unfiltered list
+    search          full-text searches for a fixed set of terms
+    detail          the browser's detail fetch: page, asset inlining, images
+    image_file      reading a picture from img/
+    image_pack      reading a picture from the asset pack
+    thumbnail       making a thumbnail, and finding it fresh (needs PIL)
+    filtered        MonsterDB.get_filtered_monsters for a random terrain
+    encounter       EncounterBuilder.build for a random terrain and level
+    engen           engen's candidate query and one encounter draw
+    combat          rating 100 encounters at 100 trials each (needs NumPy)
+
+Every random choice comes from --seed, so two runs time the same work. The
+JSON records the commit and environment next to each result. --compare prints
+the change in median against an earlier file; with --max-regression, the exit
+status is 1 if any benchmark got slower by more than that percentage.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import assetpack
+import combat
+import dbinsert
+import engen
+import monsterdb
+from benchmarks.compendium import REAL_COMPENDIUM_MONSTERS, ensure_compendium
+from dice import numpy_module
+from encounters import EncounterBuilder
+from monsterhtml import inline_assets
+from thumbnails import ThumbnailCache
+
+SUITE_VERSION = 1
+
+SEARCH_TERMS = ['dr', 'orc', 'gob', 'giant', 'lair', 'undead', 'fire breath', 'x']
+TERRAINS = ['forest', 'desert', 'hills', 'subterranean', 'temperate forest', 'ocean', 'any']
+
+def summarize(latencies, unit='ms'):
+    ordered = sorted(latencies)
+    return {
+        'unit': unit,
+        'runs': len(ordered),
+        'median': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'mean': statistics.fmean(ordered),
+        'min': ordered[0],
+        'max': ordered[-1],
+    }
+
+def time_calls(call, runs, warmup=None):
+    """Time call(i) for i in range(runs), after some untimed warm-up calls."""
+    for i in range(warmup if warmup is not None else max(1, runs // 20)):
+        call(i)
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        call(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return summarize(latencies)
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.strip(), bool(dirty.strip())
+
+def ingest(json_path, db_path, workers=1):
+    """Load json_path into a new database the way dbinsert.main does, and
+    time the load and an unchanged re-sync."""
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    conn = sqlite3.connect(db_path)
+    dbinsert.create_schema(conn)
+    count, rows, elapsed = dbinsert.bulk_load(conn, dbinsert.iter_monster_data(json_path), workers=workers)
+    with conn:
+        conn.execute("INSERT INTO monsters_fts (monsters_fts) VALUES ('optimize')")
+    conn.execute('ANALYZE')
+    counts = dbinsert.sync_monsters(conn, dbinsert.iter_monster_data(json_path))
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.close()
+    return {
+        'ingest': dict(summarize([elapsed], 's'), monsters=count, rows=rows, rows_per_second=rows / elapsed,
+                       workers=workers),
+        'sync_unchanged': dict(summarize([counts['seconds']], 's'), unchanged=counts['unchanged']),
+    }
+
+def query_benchmarks(db_path, runs, seed, pack):
+    db = monsterdb.MonsterDB(db_path)
+    rng = random.Random(seed)
+    ids = [row[0] for row in db.query('list')]
+    # Enough choices for the most calls any benchmark below makes
+    choices = max(runs, 10)
+    picks = [rng.choice(ids) for _ in range(choices)]
+    terrains = [rng.choice(TERRAINS) for _ in range(choices)]
+    levels = [rng.randint(1, 15) for _ in range(choices)]
+
+    def detail(i):
+        monster_id = picks[i % choices]
+        title, html, content_hash = db.get_monster_page(monster_id)
+        if pack is not None:
+            html = inline_assets(html, pack)
+        db.get_monster_images(monster_id)
+
+    builder = EncounterBuilder(db)
+    encounter_rng = random.Random(seed)
+    results = {
+        'list': time_calls(lambda i: db.get_monster_list(''), max(10, runs // 10)),
+        'search': time_calls(lambda i: db.get_monster_list(SEARCH_TERMS[i % len(SEARCH_TERMS)]), runs),
+        'detail': time_calls(detail, runs),
+        'filtered': time_calls(lambda i: db.get_filtered_monsters(terrains[i % choices], 4, seed=i), runs),
+        'encounter': time_calls(lambda i: builder.build(party_level=levels[i % choices],
+                                                        terrain=terrains[i % choices], rng=encounter_rng), runs),
+        'engen': time_calls(lambda i: engen.generate_encounter(
+            engen.query_candidates(db, terrains[i % choices]), 4, encounter_rng), max(10, runs // 10)),
+    }
+    results['search'].update(terms=SEARCH_TERMS)
+
+    np = numpy_module()
+    if np is not None:
+        simulator = combat.CombatSimulator(db)
+        party = combat.default_party(5)
+        encounters = builder.build_many(100, seed=seed, party_level=5)
+        combat_rng = np.random.default_rng(seed)
+        results['combat'] = time_calls(lambda i: simulator.rate_many(encounters, party, 100, combat_rng),
+                                       max(3, runs // 20))
+        results['combat'].update(encounters=len(encounters), trials=100)
+    db.close()
+    return results
+
+def image_benchmarks(runs, seed, pack, workdir, image_dir='img'):
+    names = sorted(os.listdir(image_dir)) if os.path.isdir(image_dir) else []
+    if not names:
+        return {}
+    rng = random.Random(seed)
+    picks = [rng.choice(names) for _ in range(max(runs, 1))]
+
+    def read_file(i):
+        with open(os.path.join(image_dir, picks[i % len(picks)]), 'rb') as file:
+            file.read()
+
+    results = {'image_file': time_calls(read_file, runs)}
+    if pack is not None:
+        results['image_pack'] = time_calls(lambda i: bytes(pack.get(f'{image_dir}/{picks[i % len(picks)]}')), runs)
+
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return results
+    thumbnail_dir = os.path.join(workdir, 'thumbs')
+    shutil.rmtree(thumbnail_dir, ignore_errors=True)
+    cache = ThumbnailCache(None, image_dir=image_dir, thumbnail_dir=thumbnail_dir, pack=pack)
+    # Distinct pictures, so every cold run really makes a thumbnail
+    cold = rng.sample(names, min(len(names), max(10, runs // 10)))
+    results['thumbnail_cold'] = time_calls(lambda i: cache.prepare(cold[i]), len(cold), warmup=0)
+    results['thumbnail_warm'] = time_calls(lambda i: cache.prepare(cold[i % len(cold)]), runs)
+    return results
+
+def run_suite(scales, runs, seed, workdir, only=None, workers=1):
+    pack_path = assetpack.DEFAULT_PACK_PATH
+    if not os.path.exists(pack_path):
+        pack_path = os.path.join(workdir, 'assets.pack')
+        if not os.path.exists(pack_path):
+            assetpack.build_pack(pack_path)
+    pack = assetpack.open_pack(pack_path)
+
+    results = []
+
+    def add(name, scale, result):
+        if only and name not in only:
+            return
+        monsters = int(REAL_COMPENDIUM_MONSTERS * scale) if scale is not None else None
+        results.append({'benchmark': name, 'scale': scale, 'monsters': monsters, **result})
+        print(f"{name:<16}{'' if scale is None else f'{scale:g}x':>6}{result['median']:>12.3f} {result['unit']:<3}"
+              f"p95 {result['p95']:.3f}", file=sys.stderr)
+
+    # The pictures are the same whatever the scale, so these run once
+    for name, result in image_benchmarks(runs, seed, pack, workdir).items():
+        add(name, None, result)
+    for scale in scales:
+        json_path = ensure_compendium(workdir, scale, seed)
+        db_path = os.path.join(workdir, f'bench-{scale:g}x.db')
+        for name, result in ingest(json_path, db_path, workers).items():
+            add(name, scale, result)
+        for name, result in query_benchmarks(db_path, runs, seed, pack).items():
+            add(name, scale, result)
+    if pack is not None:
+        pack.close()
+
+    commit, dirty = git_commit()
+    return {
+        'suite_version': SUITE_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'git_dirty': dirty,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'seed': seed,
+        'runs': runs,
+        'results': results,
+    }
+
+def compare(report, baseline):
+    """Print the change in median per benchmark; returns the worst slowdown in percent."""
+    earlier = {(result['benchmark'], result['scale']): result for result in baseline['results']}
+    worst = 0.0
+    print(f"\nAgainst {baseline.get('git_commit') or 'baseline'} ({baseline.get('created')}):")
+    for result in report['results']:
+        before = earlier.get((result['benchmark'], result['scale']))
+        if before is None or not before['median']:
+            continue
+        change = (result['median'] / before['median'] - 1) * 100
+        worst = max(worst, change)
+        scale = '' if result['scale'] is None else f"{result['scale']:g}x"
+        print(f"  {result['benchmark']:<16}{scale:>6}{before['median']:>12.3f} ->{result['median']:>10.3f} "
+              f"{result['unit']:<3}{change:+7.1f}%")
+    return worst
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1],
+                        help="compendium sizes to run, e.g. 1 10 100 (default: %(default)s)")
+    parser.add_argument('--runs', type=int, default=200, help="timed runs per micro-benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="where compendiums and databases are kept between runs "
+                                          "(default: a temporary directory)")
+    parser.add_argument('--only', nargs='+', help="benchmarks to report")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes for the ingest benchmark")
+    parser.add_argument('--output', help="write the results as JSON here (default: stdout)")
+    parser.add_argument('--compare', help="an earlier results file to compare against")
+    parser.add_argument('--max-regression', type=float,
+                        help="with --compare, fail if a median got slower by more than this percentage")
+    args = parser.parse_args(argv)
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        report = run_suite(args.scales, args.runs, args.seed, args.workdir, args.only, args.workers)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            report = run_suite(args.scales, args.runs, args.seed, workdir, args.only, args.workers)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as out:
+            json.dump(report, out, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            worst = compare(report, json.load(file))
+        if args.max_regression is not None and worst > args.max_regression:
+            print(f"Slowest regression {worst:.1f}% is over the {args.max_regression:g}% limit")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
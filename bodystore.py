@@ -0,0 +1,72 @@
+"""Compression for the monster pages stored in the database.
+
+Page HTML is stored as zlib streams, by default primed with a dictionary
+shared by every page in the database. The dictionary is "trained" from a
+sample of the pages: the markup and phrases that recur across them (table
+rows, headings, the stat labels) are packed into zlib's 32 KB preset window,
+so even a short page compresses against them.
+
+Each blob starts with one byte saying how it was compressed. Text values are
+passed through untouched, so databases written before compression read fine.
+"""
+import re
+import zlib
+from collections import Counter
+
+PLAIN = 0
+SHARED_DICTIONARY = 1
+
+# zlib can only refer back 32 KB, so a longer dictionary is wasted
+DICTIONARY_SIZE = 32 * 1024
+
+# Pages needed before a dictionary is worth training
+MIN_TRAINING_SAMPLES = 20
+
+COMPRESSION_LEVEL = 9
+
+# A page split into tags and the text between them
+FRAGMENT_RE = re.compile(r"<[^>]*>|[^<]+")
+
+def train_dictionary(samples, size=DICTIONARY_SIZE):
+    """Build a preset dictionary from the fragments that recur across samples."""
+    counts = Counter()
+    for sample in samples:
+        if sample:
+            counts.update(set(FRAGMENT_RE.findall(sample)))
+    fragments = [fragment for fragment, count in counts.items() if count > 1 and len(fragment) > 3]
+    # Ties are broken on the text, so the same samples always give the same dictionary
+    fragments.sort(key=lambda fragment: (-counts[fragment] * len(fragment), fragment))
+
+    chosen = []
+    total = 0
+    for fragment in fragments:
+        encoded = fragment.encode('utf-8')
+        if total + len(encoded) <= size:
+            chosen.append(encoded)
+            total += len(encoded)
+    # Matches near the end of the dictionary are cheapest, so the most useful go last
+    return b''.join(reversed(chosen))
+
+def compress(text, dictionary=None):
+    if text is None:
+        return None
+    data = text.encode('utf-8')
+    if dictionary:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=dictionary)
+        return bytes([SHARED_DICTIONARY]) + compressor.compress(data) + compressor.flush()
+    return bytes([PLAIN]) + zlib.compress(data, COMPRESSION_LEVEL)
+
+def decompress(blob, dictionary=None):
+    if blob is None or isinstance(blob, str):
+        return blob
+    method = blob[0]
+    if method == SHARED_DICTIONARY:
+        if not dictionary:
+            raise ValueError("page was compressed with a shared dictionary, but none was given")
+        decompressor = zlib.decompressobj(zdict=dictionary)
+        data = decompressor.decompress(blob[1:]) + decompressor.flush()
+    elif method == PLAIN:
+        data = zlib.decompress(blob[1:])
+    else:
+        raise ValueError(f"unknown page compression method {method}")
+    return data.decode('utf-8')
@@ -0,0 +1,416 @@
+"""Encounter difficulty, by Monte Carlo simulation of simplified 2e combat.
+
+    simulator = CombatSimulator(monsterdb.get_db())
+    party = default_party(level=5, size=4)
+    encounters = EncounterBuilder(db).build_many(1000, party_level=5, terrain="forest")
+    for encounter, rating in zip(encounters, simulator.rate_many(encounters, party)):
+        print(encounter.describe(), rating.describe())
+
+Every trial fights the encounter out, for at most MAX_ROUNDS rounds:
+
+  - Both sides attack at once each round; there is no initiative, morale,
+    movement, spells or special attack.
+  - Each attacker strikes a random living enemy. An attack hits on a d20 of
+    at least THAC0 minus the target's AC; a 20 always hits and a 1 misses.
+  - Monsters roll hit points from their Hit Dice and fight with their best
+    (lowest) AC. THAC0 comes from the statblock, or else from the Hit Dice.
+    Damage/Attack "1d6/1d6/2d8" is three attacks; a single damage roll is
+    made No. of Attacks times, and "By weapon" is WEAPON_DAMAGE.
+  - The party wins when every monster is down and someone is still standing.
+
+The trials of a whole batch of encounters are rows of the same NumPy arrays,
+so a round is a few dozen array operations however many encounters are being
+rated. Rolls of every dice expression in play go through one DiceTable
+lookup. The cost is in proportion to trials x monsters x rounds: on one core,
+low-level encounters of a few monsters rate at thousands a second with 50
+trials each, and hundreds a second with 200.
+"""
+import argparse
+import math
+import re
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+import instrument
+import monsterdb
+from dice import DiceExpression, numpy_module, parse_dice
+from encounters import EncounterBuilder
+
+# Rounds after which an undecided fight counts as not won
+MAX_ROUNDS = 30
+
+DEFAULT_TRIALS = 500
+
+# Monster slots (trials x encounters x largest encounter) simulated together;
+# bounds the memory of rate_many
+SLOTS_PER_BATCH = 2_000_000
+# Largest encounter of a batch relative to its smallest, bounding the padding
+BATCH_SIZE_SPREAD = 1.5
+
+# Damage of a monster that fights "By weapon", or whose damage did not parse
+WEAPON_DAMAGE = parse_dice("1d8")
+
+# Hit points of a monster whose Hit Dice did not parse
+DEFAULT_HIT_POINTS = parse_dice("1d8")
+
+UNARMORED_AC = 10
+
+CombatStats = namedtuple('CombatStats', 'armor_class thac0 hit_points attacks')
+PartyMember = namedtuple('PartyMember', 'hit_points armor_class thac0 damage attacks')
+
+class Rating(namedtuple('Rating', 'trials win_probability expected_rounds expected_hp_loss hp_loss_fraction '
+                                  'expected_deaths')):
+    __slots__ = ()
+
+    def describe(self):
+        return (f"{self.win_probability:.0%} win, {self.expected_rounds:.1f} rounds, "
+                f"{self.expected_hp_loss:.0f} hp lost ({self.hp_loss_fraction:.0%}), "
+                f"{self.expected_deaths:.2f} deaths")
+
+def monster_thac0(hit_dice):
+    """THAC0 of a monster by Hit Dice (DMG table 47): 19 at 1-2 HD, two better per 2 HD after."""
+    if hit_dice is None or hit_dice < 1:
+        return 20
+    return max(3, 21 - 2 * math.ceil(hit_dice / 2))
+
+def default_party(level=1, size=4, armor_class=4, damage="1d8"):
+    """size warriors of a level: 6.5 hit points a level to 9th and 3 after,
+    THAC0 21 - level, and 3/2 attacks a round from 7th level, 2 from 13th."""
+    level = max(1, level)
+    hit_points = round(6.5 * min(level, 9)) + 3 * max(0, level - 9)
+    attacks = 1 if level < 7 else 1.5 if level < 13 else 2
+    member = PartyMember(hit_points, armor_class, max(1, 21 - level), parse_dice(damage), attacks)
+    return [member] * size
+
+def number_of_attacks(text):
+    """The leading number of a No. of Attacks entry ("2 or 1", "1 + special"), or 1."""
+    match = re.match(r"\s*(\d+)", text or "")
+    return max(1, int(match.group(1))) if match else 1
+
+def encounter_groups(encounter):
+    """The (statblock_id, count) pairs of an encounters.Encounter, of an engen
+    encounter (a list of StatblockRecords, one monster each), or such pairs."""
+    if hasattr(encounter, 'groups'):
+        return [(group.statblock_id, group.count) for group in encounter.groups]
+    return [(monster.statblock_id, 1) if hasattr(monster, 'statblock_id') else tuple(monster)
+            for monster in encounter]
+
+class DiceTable:
+    """Dice expressions packed into flat arrays, so that rolling a whole array
+    of different expressions is one searchsorted: the CDF of expression k is
+    stored shifted up by k, and a roll of it looks up k + u for a uniform u.
+    Totals below 0 roll as 0, as there is no negative damage."""
+
+    def __init__(self):
+        self.expressions = []
+        self._index = {}
+        self._arrays = None
+        # Index 0 is "no attack"; it always rolls 0
+        self.add(DiceExpression(["c", 0]))
+
+    def add(self, expression):
+        """The index of an expression in the table, adding it if it is new."""
+        key = expression.to_json()
+        index = self._index.get(key)
+        if index is None:
+            index = self._index[key] = len(self.expressions)
+            self.expressions.append(expression)
+            self._arrays = None
+        return index
+
+    def roll(self, indices, rng):
+        """An array of rolls, one of expression indices[i] for each i."""
+        np = numpy_module()
+        if self._arrays is None:
+            values = np.concatenate([np.maximum(np.asarray(expression.values, dtype=np.float32), 0)
+                                     for expression in self.expressions])
+            cdf = np.concatenate([np.asarray(expression.cdf) + k for k, expression in enumerate(self.expressions)])
+            self._arrays = values, cdf
+        values, cdf = self._arrays
+        # 1 - random() is in (0, 1], so a roll never lands in the previous expression's block
+        return values[np.searchsorted(cdf, indices + (1.0 - rng.random(indices.shape)), side='left')]
+
+# Sides this small (a party) pick targets through a lookup table by who is alive
+LOOKUP_SIDE_SIZE = 8
+
+@lru_cache(maxsize=None)
+def _target_lookup(size):
+    """(living count, the index of the kth living member) tables for every
+    alive bitmask of a side of size members."""
+    np = numpy_module()
+    living = np.zeros(1 << size, dtype=np.int16)
+    members = np.zeros((1 << size, size), dtype=np.int64)
+    for mask in range(1 << size):
+        alive = [member for member in range(size) if mask >> member & 1]
+        living[mask] = len(alive)
+        members[mask, :len(alive)] = alive
+    return living, members
+
+def _pick_targets(alive, count, rng):
+    """(rows, count) indices of a random living member of alive (rows, n) for
+    each of count attackers. Every row must have someone alive."""
+    np = numpy_module()
+    rows, size = alive.shape
+    draw = rng.random((rows, count), dtype=np.float32)
+    if size <= LOOKUP_SIDE_SIZE:
+        living, members = _target_lookup(size)
+        mask = alive @ (1 << np.arange(size))
+        choice = (draw * living[mask][:, None]).astype(np.int64)
+        return members[mask[:, None], choice]
+    order = np.cumsum(alive, axis=1, dtype=np.int16)
+    choice = (draw * order[:, -1:]).astype(np.int16)
+    # The target is the (choice + 1)th living member: the first whose running count passes choice
+    return (order[:, None, :] > choice[:, :, None]).argmax(axis=2)
+
+def _strike(table, rng, attacks, thac0, target_ac, attacking, chance=None):
+    """The damage (rows, attackers) each attacker does in a round. attacks
+    (rows, attackers, attacks each) are dice indices, index 0 for none.
+    thac0, target_ac and attacking (alive) are per attacker; chance, if
+    given, is the chance each attack is made at all."""
+    np = numpy_module()
+    # The d20 roll each attacker needs: 20 always hits, 1 always misses, and
+    # the fallen need a 21. A d20 of at least need is a uniform draw of at
+    # least (need - 1) / 20.
+    need = np.where(attacking, np.clip(thac0 - target_ac, 2, 20), 21)
+    hits = rng.random(attacks.shape, dtype=np.float32) >= ((need - 1) / np.float32(20))[:, :, None]
+    if chance is not None:
+        hits &= rng.random(attacks.shape, dtype=np.float32) < chance
+    # Only the hits roll damage
+    damage = np.zeros(attacks.shape, dtype=np.float32)
+    damage[hits] = table.roll(attacks[hits], rng)
+    # There are only a few attacks each; adding the slices beats a reduction along the short axis
+    total = damage[:, :, 0].copy()
+    for attack in range(1, attacks.shape[2]):
+        total += damage[:, :, attack]
+    return total
+
+def _apportion(damage, targets, defenders):
+    """Sum damage (rows, attackers) onto the targets (rows, attackers) among defenders."""
+    np = numpy_module()
+    rows = damage.shape[0]
+    flat = (np.arange(rows)[:, None] * defenders + targets).ravel()
+    return np.bincount(flat, weights=damage.ravel(), minlength=rows * defenders).reshape(rows, defenders)
+
+def _lineup_size(lineup):
+    return sum(count for _, count in lineup)
+
+def _batches(lineups, trials):
+    """Lists of indices into lineups to simulate together. Encounters of
+    similar size go together, so little of the monster axis is padding."""
+    sizes = [_lineup_size(lineup) for lineup in lineups]
+    batch = []
+    for index in sorted(range(len(lineups)), key=sizes.__getitem__):
+        slots = (len(batch) + 1) * trials * max(1, sizes[index])
+        if batch and (slots > SLOTS_PER_BATCH or sizes[index] > sizes[batch[0]] * BATCH_SIZE_SPREAD):
+            yield batch
+            batch = []
+        batch.append(index)
+    if batch:
+        yield batch
+
+class CombatSimulator:
+    """Rates encounters against a party, with the statblocks of a MonsterDB."""
+
+    def __init__(self, db):
+        if numpy_module() is None:
+            raise RuntimeError("the combat simulator needs NumPy")
+        self.db = db
+        self._generation = db.generation
+        self._stats = None
+        self._slots = {}
+        self.table = DiceTable()
+
+    def stats(self):
+        """{statblock_id: CombatStats}, loaded once per database generation."""
+        if self._generation != self.db.generation:
+            self._generation = self.db.generation
+            self._stats = None
+            self._slots = {}
+        if self._stats is None:
+            dice_cache = {}
+
+            def expression(encoded):
+                if encoded not in dice_cache:
+                    dice_cache[encoded] = DiceExpression.from_json(encoded)
+                return dice_cache[encoded]
+
+            stats = {}
+            for (statblock_id, armor_class, thac0, hit_dice, hit_points_json, damage_json,
+                 no_of_attacks) in self.db.query('combat_stats'):
+                hit_points = expression(hit_points_json) if hit_points_json else DEFAULT_HIT_POINTS
+                if damage_json:
+                    attacks = expression(damage_json).attacks()
+                    if len(attacks) == 1:
+                        attacks = attacks * number_of_attacks(no_of_attacks)
+                else:
+                    attacks = [WEAPON_DAMAGE] * number_of_attacks(no_of_attacks)
+                stats[statblock_id] = CombatStats(
+                    armor_class if armor_class is not None else UNARMORED_AC,
+                    thac0 if thac0 is not None else monster_thac0(hit_dice),
+                    hit_points, tuple(attacks),
+                )
+            self._stats = stats
+        return self._stats
+
+    def _slot(self, statblock_id):
+        """A statblock's CombatStats with its dice as DiceTable indices."""
+        slot = self._slots.get(statblock_id)
+        if slot is None:
+            stats = self.stats().get(statblock_id)
+            if stats is None:
+                raise ValueError(f"no statblock {statblock_id} in the database")
+            slot = self._slots[statblock_id] = stats._replace(
+                hit_points=self.table.add(stats.hit_points),
+                attacks=tuple(self.table.add(attack) for attack in stats.attacks),
+            )
+        return slot
+
+    def rate(self, encounter, party, trials=DEFAULT_TRIALS, rng=None):
+        """The Rating of one encounter; see encounter_groups for what it can be."""
+        return self.rate_many([encounter], party, trials, rng)[0]
+
+    @instrument.traced('combat.rate_many', 'combat')
+    def rate_many(self, encounters, party, trials=DEFAULT_TRIALS, rng=None):
+        """A Rating per encounter, in order. rng is a numpy.random.Generator."""
+        np = numpy_module()
+        if not party:
+            raise ValueError("the party is empty")
+        rng = rng if rng is not None else np.random.default_rng()
+        self.stats()
+        # (slot, count) per group of each encounter
+        lineups = [[(self._slot(statblock_id), count) for statblock_id, count in encounter_groups(encounter)]
+                   for encounter in encounters]
+
+        ratings = [None] * len(lineups)
+        for batch in _batches(lineups, trials):
+            for index, rating in zip(batch, self._simulate([lineups[index] for index in batch], party, trials, rng)):
+                ratings[index] = rating
+        return ratings
+
+    def _simulate(self, lineups, party, trials, rng):
+        np = numpy_module()
+        table = self.table
+        encounters = len(lineups)
+        monsters = max(1, max(_lineup_size(lineup) for lineup in lineups))
+        monster_attacks = max([1] + [len(slot.attacks) for lineup in lineups for slot, _ in lineup])
+
+        # Per monster of each encounter: AC, THAC0, hit point dice and attack
+        # dice, as DiceTable indices; absent monsters stay 0
+        armor_class = np.zeros((encounters, monsters), dtype=np.int16)
+        thac0 = np.zeros((encounters, monsters), dtype=np.int16)
+        hit_point_dice = np.zeros((encounters, monsters), dtype=np.int32)
+        attack_dice = np.zeros((encounters, monsters, monster_attacks), dtype=np.int32)
+        present = np.zeros((encounters, monsters), dtype=bool)
+        for e, lineup in enumerate(lineups):
+            m = 0
+            for slot, count in lineup:
+                group = slice(m, m + count)
+                armor_class[e, group] = slot.armor_class
+                thac0[e, group] = slot.thac0
+                hit_point_dice[e, group] = slot.hit_points
+                attack_dice[e, group, :len(slot.attacks)] = slot.attacks
+                present[e, group] = True
+                m += count
+
+        size = len(party)
+        party_attacks = max(math.ceil(member.attacks) for member in party)
+        party_hp = np.array([member.hit_points for member in party], dtype=np.float32)
+        party_ac = np.array([member.armor_class for member in party], dtype=np.int16)
+        party_thac0 = np.array([member.thac0 for member in party], dtype=np.int16)
+        party_dice = np.zeros((size, party_attacks), dtype=np.int32)
+        # Chance each attack is made in a round: 3/2 attacks is one, and a second half the time
+        party_chance = np.zeros((size, party_attacks), dtype=np.float32)
+        for p, member in enumerate(party):
+            for a in range(math.ceil(member.attacks)):
+                party_dice[p, a] = table.add(member.damage)
+                party_chance[p, a] = min(1.0, member.attacks - a)
+        chance = party_chance if ((party_chance > 0) & (party_chance < 1)).any() else None
+
+        # One row per trial, encounter by encounter
+        encounter_of = np.repeat(np.arange(encounters), trials)
+        rows = encounter_of.size
+        monster_hp = np.where(present[encounter_of], np.maximum(table.roll(hit_point_dice[encounter_of], rng), 1),
+                              0).astype(np.float32)
+        hp = np.tile(party_hp, (rows, 1))
+        rounds = np.zeros(rows, dtype=np.int64)
+        fighting = (monster_hp > 0).any(axis=1)
+
+        with instrument.span('combat.simulate', 'combat', encounters=encounters, trials=trials):
+            for round_number in range(1, MAX_ROUNDS + 1):
+                active = np.flatnonzero(fighting)
+                if not active.size:
+                    break
+                on = encounter_of[active]
+                their_hp = monster_hp[active]
+                our_hp = hp[active]
+                monsters_up = their_hp > 0
+                party_up = our_hp > 0
+
+                targets = _pick_targets(party_up, monsters, rng)
+                damage = _strike(table, rng, attack_dice[on], thac0[on], party_ac[targets], monsters_up)
+                our_hp = our_hp - _apportion(damage, targets, size)
+
+                targets = _pick_targets(monsters_up, size, rng)
+                swings = np.broadcast_to(party_dice, (active.size, size, party_attacks))
+                target_ac = np.take_along_axis(armor_class[on], targets, axis=1)
+                damage = _strike(table, rng, swings, party_thac0, target_ac, party_up, chance)
+                their_hp = their_hp - _apportion(damage, targets, monsters)
+
+                monster_hp[active] = their_hp
+                hp[active] = our_hp
+                rounds[active] = round_number
+                fighting[active] = (their_hp > 0).any(axis=1) & (our_hp > 0).any(axis=1)
+
+        won = ~(monster_hp > 0).any(axis=1) & (hp > 0).any(axis=1)
+        hp_loss = party_hp.sum() - np.maximum(hp, 0).sum(axis=1)
+        deaths = (hp <= 0).sum(axis=1)
+        total_hp = party_hp.sum() or 1.0
+
+        def by_encounter(values):
+            return values.reshape(encounters, trials).mean(axis=1)
+
+        return [
+            Rating(trials, float(win), float(length), float(loss), float(loss / total_hp), float(dead))
+            for win, length, loss, dead in zip(by_encounter(won), by_encounter(rounds), by_encounter(hp_loss),
+                                               by_encounter(deaths))
+        ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rate random encounters by simulating them against a party.")
+    parser.add_argument('--db', default=monsterdb.DEFAULT_DB_PATH)
+    parser.add_argument('--level', type=int, default=1, help="party level")
+    parser.add_argument('--party-size', type=int, default=4)
+    parser.add_argument('--ac', type=int, default=4, help="party armor class")
+    parser.add_argument('--damage', default="1d8", help="party damage per attack")
+    parser.add_argument('--terrain')
+    parser.add_argument('--count', type=int, default=10, help="encounters to build and rate")
+    parser.add_argument('--trials', type=int, default=DEFAULT_TRIALS, help="simulated fights per encounter")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--quiet', action='store_true', help="only print the summary")
+    args = parser.parse_args(argv)
+
+    if parse_dice(args.damage) is None:
+        raise SystemExit(f"No dice expression in {args.damage!r}")
+    db = monsterdb.get_db(args.db)
+    encounters = EncounterBuilder(db).build_many(args.count, seed=args.seed, party_level=args.level,
+                                                 party_size=args.party_size, terrain=args.terrain)
+    if not encounters:
+        raise SystemExit("No monsters fit those criteria.")
+    simulator = CombatSimulator(db)
+    simulator.stats()
+    party = default_party(args.level, args.party_size, args.ac, args.damage)
+
+    start = time.perf_counter()
+    ratings = simulator.rate_many(encounters, party, args.trials, numpy_module().random.default_rng(args.seed))
+    elapsed = time.perf_counter() - start
+    if not args.quiet:
+        for encounter, rating in zip(encounters, ratings):
+            print(f"{encounter.describe()}\n    {rating.describe()}")
+    wins = sum(rating.win_probability for rating in ratings) / len(ratings)
+    print(f"Rated {len(ratings)} encounters x {args.trials} trials in {elapsed * 1000:.1f} ms "
+          f"({len(ratings) / elapsed:,.0f} encounters/s); mean win probability {wins:.0%}")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,87 @@
+import argparse
+import hashlib
+import itertools
 import json
+import os
+import queue
 import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from dice import dice_json
+import bodystore
+import instrument
+import monsterdb
+import statparse
+from monsterhtml import render_page
+from statblocks import iter_statblocks
+from terrain import terrain_tokens
 
 # Load the JSON file
 def load_monster_data(json_file):
     with open(json_file, 'r', encoding='utf-8') as file:
         return json.load(file)
 
+# Yield the monsters of a top-level JSON array one at a time, so only the
+# record being decoded (plus one read chunk) is held in memory
+def iter_monster_data(json_file, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    with open(json_file, 'r', encoding='utf-8') as file:
+        buffer = file.read(chunk_size)
+        pos = 0
+        eof = not buffer
+
+        # Top the buffer up until the next non-whitespace character is available
+        def skip_whitespace():
+            nonlocal buffer, pos, eof
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                buffer, pos = file.read(chunk_size), 0
+                eof = not buffer
+
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] != '[':
+            raise ValueError(f"{json_file}: expected a top-level JSON array")
+        pos += 1
+
+        expect_comma = False
+        while True:
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise ValueError(f"{json_file}: unexpected end of file inside the monster array")
+            if buffer[pos] == ']':
+                return
+            if expect_comma:
+                if buffer[pos] != ',':
+                    raise ValueError(f"{json_file}: expected ',' at offset {pos} of the current chunk")
+                pos += 1
+                skip_whitespace()
+
+            while True:
+                try:
+                    monster, end = decoder.raw_decode(buffer, pos)
+                    # A number that ends with the buffer may go on in the next chunk
+                    if end < len(buffer) or eof:
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                # The record runs past the buffer; read at least as much
+                # again so huge records are not re-parsed chunk by chunk
+                more = file.read(max(chunk_size, len(buffer) - pos))
+                eof = not more
+                buffer, pos = buffer[pos:] + more, 0
+
+            pos = end
+            expect_comma = True
+            if pos > chunk_size:
+                buffer, pos = buffer[pos:], 0
+            yield monster
+
 # Create the SQLite database schema
 def create_schema(conn):
     with conn:
@@ -15,10 +91,20 @@ def create_schema(conn):
             monster_key TEXT,
             title TEXT,
             setting TEXT,
-            full_body TEXT,
-            sources TEXT
+            sources TEXT,
+            content_hash TEXT
         );
         ''')
+        add_missing_columns(conn, 'monsters', {'content_hash': 'TEXT'})
+
+        # monster_key identifies a record across re-ingests
+        try:
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_monsters_monster_key ON monsters(monster_key)')
+        except sqlite3.IntegrityError:
+            raise RuntimeError(
+                "monsters has duplicate monster_key rows from an older append-only ingest; "
+                "rebuild it with --rebuild"
+            ) from None
 
         conn.execute('''
         CREATE TABLE IF NOT EXISTS statblocks (
@@ -49,6 +135,13 @@ def create_schema(conn):
             FOREIGN KEY(monster_id) REFERENCES monsters(id)
         );
         ''')
+        added = add_missing_columns(conn, 'statblocks', dict(
+            column for _, _, columns in DERIVED_STATBLOCK_FIELDS for column in columns
+        ))
+        # New columns, or parsers changed since the rows were derived
+        if added or conn.execute('PRAGMA user_version').fetchone()[0] < DERIVED_VALUES_VERSION:
+            backfill_derived_columns(conn)
+            conn.execute(f'PRAGMA user_version = {DERIVED_VALUES_VERSION}')
 
         conn.execute('''
         CREATE TABLE IF NOT EXISTS images (
@@ -59,112 +152,788 @@ def create_schema(conn):
         );
         ''')
 
+        # Full-text index over the title, the tag-stripped body and the sources.
+        # rowid is the monster id; the prefix indexes keep search-as-you-type cheap.
+        conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS monsters_fts USING fts5(
+            title,
+            body,
+            sources,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        );
+        ''')
+
+        # The full_body pages live apart from the monsters table, compressed
+        # (see bodystore.py), so listing and searching never read them
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS monster_bodies (
+            monster_id INTEGER PRIMARY KEY,
+            body BLOB,
+            FOREIGN KEY(monster_id) REFERENCES monsters(id)
+        );
+        ''')
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS compression_dictionaries (
+            name TEXT PRIMARY KEY,
+            dictionary BLOB
+        );
+        ''')
+
+        # full_body pages as the browser shows them: sanitized, with asset
+        # paths resolved, compressed, and a hash so viewers can cache parsed pages
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS rendered_pages (
+            monster_id INTEGER PRIMARY KEY,
+            html BLOB,
+            content_hash TEXT,
+            FOREIGN KEY(monster_id) REFERENCES monsters(id)
+        );
+        ''')
+
+        # Normalized terrain tokens parsed from climate_terrain, so encounter
+        # sampling can look statblocks up by terrain instead of scanning them
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS statblock_terrains (
+            token TEXT NOT NULL,
+            statblock_id INTEGER NOT NULL,
+            PRIMARY KEY (token, statblock_id),
+            FOREIGN KEY(statblock_id) REFERENCES statblocks(id)
+        ) WITHOUT ROWID;
+        ''')
+
+        create_indexes(conn)
+
+    # Databases built before the pages were split out have them moved now
+    if 'full_body' in table_columns(conn, 'monsters'):
+        split_full_body(conn)
+
+    # Databases built before the search index or rendered pages existed get them filled in now
+    if conn.execute('''
+        SELECT NOT EXISTS (SELECT 1 FROM monsters_fts) OR NOT EXISTS (SELECT 1 FROM rendered_pages)
+    ''').fetchone()[0]:
+        rebuild_search_index(conn)
+    # Likewise the terrain index
+    if conn.execute('SELECT NOT EXISTS (SELECT 1 FROM statblock_terrains)').fetchone()[0]:
+        rebuild_terrain_index(conn)
+
+# Refill monsters_fts and rendered_pages from the monsters table
+def rebuild_search_index(conn):
+    with conn:
+        conn.execute('DELETE FROM monsters_fts')
+        conn.execute('DELETE FROM rendered_pages')
+        dictionary = page_dictionary(conn)
+        search_rows = []
+        rendered_rows = []
+        for monster_id, title, body, sources in conn.execute('''
+            SELECT m.id, m.title, b.body, m.sources
+            FROM monsters m LEFT JOIN monster_bodies b ON b.monster_id = m.id
+        '''):
+            html, text, content_hash = render_page(bodystore.decompress(body, dictionary))
+            search_rows.append((monster_id, title, text, sources))
+            rendered_rows.append((monster_id, bodystore.compress(html, dictionary), content_hash))
+        conn.executemany(INSERT_SEARCH_SQL, search_rows)
+        conn.executemany(INSERT_PAGE_SQL, rendered_rows)
+
+# Move full_body out of the monsters table of an older database into
+# monster_bodies, compressing it, and reclaim the space
+def split_full_body(conn):
+    with conn:
+        rows = conn.execute('SELECT id, full_body FROM monsters').fetchall()
+        dictionary = page_dictionary(conn, [full_body for _, full_body in rows[:TRAINING_SAMPLE_SIZE]])
+        conn.executemany(INSERT_BODY_SQL, [
+            (monster_id, bodystore.compress(full_body, dictionary)) for monster_id, full_body in rows
+        ])
+        conn.execute('ALTER TABLE monsters DROP COLUMN full_body')
+        # Pages rendered before compression are redone compressed
+        conn.execute('DELETE FROM rendered_pages')
+    conn.execute('VACUUM')
+
+# Pages sampled to train the shared compression dictionary
+TRAINING_SAMPLE_SIZE = 500
+
+# Return the database's shared page dictionary. If it has none yet, one is
+# trained from samples (when there are enough of them) and stored; pages
+# compressed before that keep working, as each blob says how it was made.
+def page_dictionary(conn, samples=()):
+    row = conn.execute("SELECT dictionary FROM compression_dictionaries WHERE name = 'pages'").fetchone()
+    if row is not None:
+        return row[0]
+    samples = [sample for sample in samples if sample]
+    if len(samples) < bodystore.MIN_TRAINING_SAMPLES:
+        return None
+    dictionary = bodystore.train_dictionary(samples)
+    conn.execute("INSERT INTO compression_dictionaries (name, dictionary) VALUES ('pages', ?)", (dictionary,))
+    return dictionary
+
+# Refill statblock_terrains from the statblocks table
+def rebuild_terrain_index(conn):
+    with conn:
+        conn.execute('DELETE FROM statblock_terrains')
+        rows = conn.execute('SELECT id, climate_terrain FROM statblocks')
+        conn.executemany(INSERT_TERRAIN_SQL, [
+            row for statblock_id, climate_terrain in rows for row in terrain_rows(statblock_id, climate_terrain)
+        ])
+
+# Indexes for the lookups monsterui.py makes on every click and keystroke:
+# child rows by monster_id, and a NOCASE title index that covers (id, title)
+# so the monster list never has to read the full_body pages
+INDEXES = {
+    'idx_statblocks_monster_id': 'statblocks(monster_id)',
+    'idx_images_monster_id': 'images(monster_id, image_url)',
+    'idx_monsters_title': 'monsters(title COLLATE NOCASE)',
+    # Range filters on the typed statblock columns
+    'idx_statblocks_xp': 'statblocks(xp_min, xp_max)',
+    'idx_statblocks_ac': 'statblocks(ac_min, ac_max)',
+    'idx_statblocks_hd': 'statblocks(hd_min, hd_max)',
+}
+
+# Create any missing indexes; safe to run against databases built before they existed
+def create_indexes(conn):
+    for name, definition in INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+def drop_indexes(conn):
+    for name in INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+# Return the EXPLAIN QUERY PLAN detail lines for a query
+def explain_query_plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+# Add columns introduced after a database was first created; returns the ones added
+def add_missing_columns(conn, table, columns):
+    existing = table_columns(conn, table)
+    added = []
+    for column, column_type in columns.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+            added.append(column)
+    return added
+
+# Recompute every derived statblock column from the raw text columns
+def backfill_derived_columns(conn):
+    raw_columns = [column for column, _ in STATBLOCK_FIELDS]
+    rows = conn.execute('SELECT id, {} FROM statblocks'.format(', '.join(raw_columns))).fetchall()
+    assignments = ', '.join(f'{column} = ?' for column in DERIVED_STATBLOCK_COLUMNS)
+    conn.executemany(f'UPDATE statblocks SET {assignments} WHERE id = ?', [
+        derived_values(dict(zip((key for _, key in STATBLOCK_FIELDS), row[1:]))) + (row[0],)
+        for row in rows
+    ])
+
+# Drop every table so the database can be rebuilt from scratch
+def drop_schema(conn):
+    with conn:
+        for table in ('statblock_terrains', 'rendered_pages', 'compression_dictionaries', 'monster_bodies',
+                      'monsters_fts', 'images', 'statblocks', 'monsters'):
+            conn.execute(f'DROP TABLE IF EXISTS {table}')
+
+# Column name -> JSON key for every field of a statblock, in table order
+STATBLOCK_FIELDS = [
+    ('activity_cycle', 'Activity Cycle'),
+    ('alignment', 'Alignment'),
+    ('armor_class', 'Armor Class'),
+    ('climate_terrain', 'Climate/Terrain'),
+    ('damage_attack', 'Damage/Attack'),
+    ('diet', 'Diet'),
+    ('frequency', 'Frequency'),
+    ('hit_dice', 'Hit Dice'),
+    ('intelligence', 'Intelligence'),
+    ('magic_resistance', 'Magic Resistance'),
+    ('morale', 'Morale'),
+    ('movement', 'Movement'),
+    ('no_appearing', 'No. Appearing'),
+    ('no_of_attacks', 'No. of Attacks'),
+    ('organization', 'Organization'),
+    ('size', 'Size'),
+    ('special_attacks', 'Special Attacks'),
+    ('special_defenses', 'Special Defenses'),
+    ('thac0', 'THAC0'),
+    ('treasure', 'Treasure'),
+    ('xp_value', 'XP Value'),
+]
+
+# Wrap a single-value parser so it returns a one-column tuple
+def _single(parse):
+    def parse_single(text):
+        value = parse(text)
+        return None if value is None else (value,)
+    return parse_single
+
+# Typed columns computed at ingest from the raw text of a statblock field:
+# (JSON key, parser, [(column, type), ...]). The parser returns one value per
+# column, or None when the text has nothing usable; the raw text is kept too.
+# A key can be a tuple of JSON keys: the parser is given the text of the
+# first, and then the texts of the others for context.
+DERIVED_STATBLOCK_FIELDS = [
+    # Dice expression ASTs (see dice.py) as JSON
+    ('No. Appearing', _single(dice_json), [('no_appearing_dice', 'TEXT')]),
+    ('Hit Dice', _single(lambda text: dice_json(text, 'hit_dice')), [('hit_points_dice', 'TEXT')]),
+    ('Damage/Attack', _single(lambda text: dice_json(text, 'damage')), [('damage_attack_dice', 'TEXT')]),
+    # Numeric ranges (see statparse.py)
+    ('Armor Class', statparse.parse_armor_class, [('ac_min', 'INTEGER'), ('ac_max', 'INTEGER')]),
+    ('Hit Dice', statparse.parse_hit_dice, [('hd_min', 'REAL'), ('hd_max', 'REAL')]),
+    (('THAC0', 'Hit Dice'), statparse.parse_thac0, [('thac0_value', 'INTEGER')]),
+    ('XP Value', statparse.parse_xp, [('xp_min', 'INTEGER'), ('xp_max', 'INTEGER')]),
+    ('Morale', statparse.parse_morale, [('morale_min', 'INTEGER'), ('morale_max', 'INTEGER')]),
+    ('Intelligence', statparse.parse_intelligence, [('intelligence_min', 'INTEGER'), ('intelligence_max', 'INTEGER')]),
+    ('Size', statparse.parse_size, [('size_min', 'INTEGER'), ('size_max', 'INTEGER')]),
+]
+
+DERIVED_STATBLOCK_COLUMNS = [column for _, _, columns in DERIVED_STATBLOCK_FIELDS for column, _ in columns]
+
+# Stored as the database's user_version once its derived columns are up to
+# date; raise it when a parser changes so create_schema recomputes them
+DERIVED_VALUES_VERSION = 1
+
+def _field_keys(key):
+    return key if isinstance(key, tuple) else (key,)
+
+STATBLOCK_COLUMNS = [column for column, _ in STATBLOCK_FIELDS] + DERIVED_STATBLOCK_COLUMNS
+
+INSERT_MONSTER_SQL = '''
+INSERT INTO monsters (monster_key, title, setting, sources, content_hash)
+VALUES (?, ?, ?, ?, ?)
+'''
+
+INSERT_MONSTER_WITH_ID_SQL = '''
+INSERT INTO monsters (id, monster_key, title, setting, sources, content_hash)
+VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+INSERT_STATBLOCK_SQL = '''
+INSERT INTO statblocks (monster_id, name, {})
+VALUES (?, ?, {})
+'''.format(
+    ', '.join(STATBLOCK_COLUMNS),
+    ', '.join('?' for _ in STATBLOCK_COLUMNS),
+)
+
+INSERT_STATBLOCK_WITH_ID_SQL = '''
+INSERT INTO statblocks (id, monster_id, name, {})
+VALUES (?, ?, ?, {})
+'''.format(
+    ', '.join(STATBLOCK_COLUMNS),
+    ', '.join('?' for _ in STATBLOCK_COLUMNS),
+)
+
+INSERT_TERRAIN_SQL = '''
+INSERT OR IGNORE INTO statblock_terrains (token, statblock_id)
+VALUES (?, ?)
+'''
+
+INSERT_IMAGE_SQL = '''
+INSERT INTO images (monster_id, image_url)
+VALUES (?, ?)
+'''
+
+INSERT_SEARCH_SQL = '''
+INSERT INTO monsters_fts (rowid, title, body, sources)
+VALUES (?, ?, ?, ?)
+'''
+
+INSERT_BODY_SQL = '''
+INSERT INTO monster_bodies (monster_id, body)
+VALUES (?, ?)
+'''
+
+INSERT_PAGE_SQL = '''
+INSERT INTO rendered_pages (monster_id, html, content_hash)
+VALUES (?, ?, ?)
+'''
+
+# Fingerprint of a raw monster record, used to skip unchanged records on re-ingest
+def monster_hash(monster_data):
+    encoded = json.dumps(monster_data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+# Build the values for a monsters row
+def monster_row(monster_data, content_hash=None):
+    # Ensure that sources is a list and not None
+    sources = monster_data.get('sources', [])
+    if sources is None:
+        sources = []
+    elif isinstance(sources, str):
+        sources = [sources]  # Convert string to a list
+
+    return (
+        monster_data.get('monster_key'),
+        monster_data.get('title'),
+        monster_data['monster_data'].get('setting'),
+        ','.join(sources),  # Join the sources list into a string
+        content_hash or monster_hash(monster_data)
+    )
+
+def monster_body(monster_data):
+    return monster_data['monster_data'].get('fullBody')
+
+# Build the values for the monsters_fts, rendered_pages and monster_bodies
+# rows of a monster, rendering its page once for all three
+def page_rows(monster_id, monster_data, row, dictionary):
+    _, title, _, sources, _ = row
+    full_body = monster_body(monster_data)
+    html, text, content_hash = render_page(full_body)
+    return (
+        (monster_id, title, text, sources),
+        (monster_id, bodystore.compress(html, dictionary), content_hash),
+        (monster_id, bodystore.compress(full_body, dictionary)),
+    )
+
+# Compute the derived column values for a statblock
+def derived_values(statblock):
+    values = ()
+    for key, parse, columns in DERIVED_STATBLOCK_FIELDS:
+        text, *context = (statblock.get(field) for field in _field_keys(key))
+        parsed = parse(text, *context) if isinstance(text, str) else None
+        values += parsed if parsed is not None else (None,) * len(columns)
+    return values
+
+# Count the statblocks whose raw text did not parse into their typed columns.
+# Returns {column: (failures, [example raw values])}, skipping blank fields.
+def parse_failures(conn, examples=3):
+    raw_column = {key: column for column, key in STATBLOCK_FIELDS}
+    failures = {}
+    for key, _, columns in DERIVED_STATBLOCK_FIELDS:
+        raw, typed = raw_column[_field_keys(key)[0]], columns[0][0]
+        condition = f"TRIM(COALESCE({raw}, '')) != '' AND {typed} IS NULL"
+        count = conn.execute(f'SELECT COUNT(*) FROM statblocks WHERE {condition}').fetchone()[0]
+        if count:
+            samples = conn.execute(
+                f'SELECT DISTINCT {raw} FROM statblocks WHERE {condition} LIMIT ?', (examples,)
+            ).fetchall()
+            failures[typed] = (count, [sample[0] for sample in samples])
+    return failures
+
+# Build the values for a statblocks row
+def statblock_row(monster_id, statblock_name, statblock):
+    raw = tuple(statblock.get(key) for _, key in STATBLOCK_FIELDS)
+    return (monster_id, statblock_name) + raw + derived_values(statblock)
+
+# Build the statblock_terrains rows for a statblock
+def terrain_rows(statblock_id, climate_terrain):
+    return [(token, statblock_id) for token in sorted(terrain_tokens(climate_terrain))]
+
 # Insert data into the monsters table
 def insert_monster(conn, monster_data):
     with conn:
         cursor = conn.cursor()
-
-        # Ensure that sources is a list and not None
-        sources = monster_data.get('sources', [])
-        if sources is None:
-            sources = []
-        elif isinstance(sources, str):
-            sources = [sources]  # Convert string to a list
-
-        cursor.execute('''
-        INSERT INTO monsters (monster_key, title, setting, full_body, sources)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (
-            monster_data.get('monster_key'),
-            monster_data.get('title'),
-            monster_data['monster_data'].get('setting'),
-            monster_data['monster_data'].get('fullBody'),
-            ','.join(sources)  # Join the sources list into a string
-        ))
+        row = monster_row(monster_data)
+        cursor.execute(INSERT_MONSTER_SQL, row)
+        search, page, body = page_rows(cursor.lastrowid, monster_data, row, page_dictionary(conn))
+        cursor.execute(INSERT_SEARCH_SQL, search)
+        cursor.execute(INSERT_PAGE_SQL, page)
+        cursor.execute(INSERT_BODY_SQL, body)
         return cursor.lastrowid  # Return the id of the newly inserted monster
 
 
 # Insert data into the statblocks table
 def insert_statblock(conn, monster_id, statblock_name, statblock):
     with conn:
-        conn.execute('''
-        INSERT INTO statblocks (monster_id, name, activity_cycle, alignment, armor_class, climate_terrain, 
-                                damage_attack, diet, frequency, hit_dice, intelligence, magic_resistance, 
-                                morale, movement, no_appearing, no_of_attacks, organization, size, 
-                                special_attacks, special_defenses, thac0, treasure, xp_value)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            monster_id,
-            statblock_name,
-            statblock.get('Activity Cycle'),
-            statblock.get('Alignment'),
-            statblock.get('Armor Class'),
-            statblock.get('Climate/Terrain'),
-            statblock.get('Damage/Attack'),
-            statblock.get('Diet'),
-            statblock.get('Frequency'),
-            statblock.get('Hit Dice'),
-            statblock.get('Intelligence'),
-            statblock.get('Magic Resistance'),
-            statblock.get('Morale'),
-            statblock.get('Movement'),
-            statblock.get('No. Appearing'),
-            statblock.get('No. of Attacks'),
-            statblock.get('Organization'),
-            statblock.get('Size'),
-            statblock.get('Special Attacks'),
-            statblock.get('Special Defenses'),
-            statblock.get('THAC0'),
-            statblock.get('Treasure'),
-            statblock.get('XP Value')
-        ))
+        cursor = conn.execute(INSERT_STATBLOCK_SQL, statblock_row(monster_id, statblock_name, statblock))
+        conn.executemany(INSERT_TERRAIN_SQL, terrain_rows(cursor.lastrowid, statblock.get('Climate/Terrain')))
 
 # Insert data into the images table
 def insert_images(conn, monster_id, images):
     with conn:
         for image_url in images:
-            conn.execute('''
-            INSERT INTO images (monster_id, image_url)
-            VALUES (?, ?)
-            ''', (monster_id, image_url))
+            conn.execute(INSERT_IMAGE_SQL, (monster_id, image_url))
 
-# Process each monster from JSON and insert it into the database
-def process_monster_data(conn, monsters):
+# Leave out, and report, every monster whose monster_key came earlier in the
+# JSON: the unique index on monster_key allows one row per key, and the first
+# record of a key is the one kept, as sync_monsters does
+def skip_duplicate_keys(monsters):
+    seen = set()
     for monster in monsters:
+        monster_key = monster.get('monster_key')
+        if monster_key is not None:
+            if monster_key in seen:
+                print(f"Skipping monster with a duplicate monster_key {monster_key!r}: {monster.get('title')!r}")
+                continue
+            seen.add(monster_key)
+        yield monster
+
+# Process each monster from JSON and insert it into the database, one commit per row.
+# Fine for adding a handful of monsters; use bulk_load for a full rebuild.
+def process_monster_data(conn, monsters):
+    for monster in skip_duplicate_keys(monsters):
         # Insert the monster
         monster_id = insert_monster(conn, monster)
-        
+
         # Insert the statblock(s)
-        statblocks = monster['monster_data'].get('statblock')
-        if statblocks:
-            # Ensure statblocks is a dictionary before proceeding
-            if isinstance(statblocks, dict):
-                for statblock_name, statblock in statblocks.items():
-                    insert_statblock(conn, monster_id, statblock_name, statblock)
-        
+        for statblock_name, statblock in iter_statblocks(monster):
+            insert_statblock(conn, monster_id, statblock_name, statblock)
+
         # Insert images (if any)
         images = monster['monster_data'].get('images', [])
         if images:
             insert_images(conn, monster_id, images)
 
+# Pragmas used while bulk loading. A failed rebuild is simply rerun from the
+# JSON, so the load skips fsyncs and keeps the rollback journal in memory.
+BULK_LOAD_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'cache_size': -200000,  # ~200 MB of page cache
+    'temp_store': 'MEMORY',
+}
+
+# Apply the bulk-load pragmas and return the previous values so they can be restored
+def tune_for_bulk_load(conn, pragmas=BULK_LOAD_PRAGMAS):
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = conn.execute(f'PRAGMA {name}').fetchone()[0]
+        conn.execute(f'PRAGMA {name} = {value}')
+    return previous
+
+def restore_pragmas(conn, previous):
+    for name, value in previous.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+
+# The rows of a batch of monsters, ready to insert. statblocks holds
+# (statblock row without its id, terrain tokens) pairs, as statblock ids are
+# only assigned when the rows are written.
+BatchRows = namedtuple('BatchRows', 'monsters search pages bodies statblocks images')
+
+# Turn a batch of (monster_id, monster) pairs into their rows: parsing,
+# rendering and compression, everything except the database writes. Needs no
+# connection, so it can run in a worker process. A record that cannot be
+# transformed raises ValueError naming it, which reaches the writer intact
+# from a worker process, where the original traceback would not.
+def transform_batch(batch, dictionary):
+    rows = BatchRows([], [], [], [], [], [])
+    for monster_id, monster in batch:
+        try:
+            _transform_monster(rows, monster_id, monster, dictionary)
+        except Exception as error:
+            title = monster.get('title') if isinstance(monster, dict) else None
+            raise ValueError(f"cannot load monster {monster_id} ({title!r}): "
+                             f"{type(error).__name__}: {error}") from error
+    return rows
+
+# Add the rows of one monster to rows
+def _transform_monster(rows, monster_id, monster, dictionary):
+    row = monster_row(monster)
+    rows.monsters.append((monster_id,) + row)
+    search, page, body = page_rows(monster_id, monster, row, dictionary)
+    rows.search.append(search)
+    rows.pages.append(page)
+    rows.bodies.append(body)
+    for statblock_name, statblock in iter_statblocks(monster):
+        rows.statblocks.append((statblock_row(monster_id, statblock_name, statblock),
+                                sorted(terrain_tokens(statblock.get('Climate/Terrain')))))
+    for image_url in monster['monster_data'].get('images') or []:
+        rows.images.append((monster_id, image_url))
+
+# Write transformed rows with executemany. Monster ids come with the rows and
+# statblock ids are assigned here, so the child rows can reference them
+# without a round trip per row. Returns the number of rows written.
+@instrument.traced('ingest.write_batch', 'db')
+def insert_rows(conn, rows):
+    statblock_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM statblocks').fetchone()[0]
+    statblock_rows = []
+    terrain_index_rows = []
+    for row, tokens in rows.statblocks:
+        statblock_rows.append((statblock_id,) + row)
+        terrain_index_rows.extend((token, statblock_id) for token in tokens)
+        statblock_id += 1
+
+    conn.executemany(INSERT_MONSTER_WITH_ID_SQL, rows.monsters)
+    conn.executemany(INSERT_SEARCH_SQL, rows.search)
+    conn.executemany(INSERT_PAGE_SQL, rows.pages)
+    conn.executemany(INSERT_BODY_SQL, rows.bodies)
+    conn.executemany(INSERT_STATBLOCK_WITH_ID_SQL, statblock_rows)
+    conn.executemany(INSERT_TERRAIN_SQL, terrain_index_rows)
+    conn.executemany(INSERT_IMAGE_SQL, rows.images)
+    return len(rows.monsters) + len(statblock_rows) + len(rows.images)
+
+# Monsters per job sent to a worker process. Batches are split into jobs this
+# size so even a small ingest keeps every worker busy.
+TRANSFORM_CHUNK_SIZE = 50
+
+# Transformed jobs allowed to wait for the writer, per worker. Bounds the
+# memory a writer slower than the workers can make the ingest use.
+QUEUED_JOBS_PER_WORKER = 4
+
+# The page dictionary, sent to each worker process once when it starts
+_worker_dictionary = None
+
+def _start_worker(dictionary):
+    global _worker_dictionary
+    _worker_dictionary = dictionary
+
+def _transform_in_worker(batch):
+    return transform_batch(batch, _worker_dictionary)
+
+def default_workers():
+    return os.cpu_count() or 1
+
+# Yield (batch, rows) for each batch of (monster_id, monster) pairs, in order.
+# The page dictionary is settled from the first batch before anything is
+# transformed, so every worker compresses with the same one. With more than
+# one worker a feeder thread reads the batches (and so the JSON) and hands
+# them to a process pool in chunks, while the caller, the single writer,
+# takes the results from a bounded queue in the order they were read: the
+# database ends up the same as with workers=1.
+def transformed_batches(conn, batches, workers=1):
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        return
+    samples = []
+    for _, monster in first[:TRAINING_SAMPLE_SIZE]:
+        try:
+            samples.append(monster_body(monster))
+        except (AttributeError, KeyError, TypeError):
+            pass  # A malformed record; transform_batch reports it
+    dictionary = page_dictionary(conn, samples)
+    batches = itertools.chain([first], batches)
+    if workers <= 1:
+        for batch in batches:
+            yield batch, transform_batch(batch, dictionary)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    pending = queue.Queue(maxsize=workers * QUEUED_JOBS_PER_WORKER)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def feed(pool):
+        try:
+            for batch in batches:
+                jobs = [pool.submit(_transform_in_worker, batch[i:i + TRANSFORM_CHUNK_SIZE])
+                        for i in range(0, len(batch), TRANSFORM_CHUNK_SIZE)]
+                if not put((batch, jobs)):
+                    return
+            put(done)
+        except BaseException as error:
+            put(error)
+
+    with ProcessPoolExecutor(workers, initializer=_start_worker, initargs=(dictionary,)) as pool:
+        feeder = threading.Thread(target=feed, args=(pool,), name='ingest-feeder', daemon=True)
+        feeder.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                batch, jobs = item
+                rows = BatchRows([], [], [], [], [], [])
+                for job in jobs:
+                    for merged, part in zip(rows, job.result()):
+                        merged.extend(part)
+                yield batch, rows
+        finally:
+            # Stops the feeder, and drops the queued jobs if the writer gave up early
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            feeder.join()
+
+# Split (monster_id, monster) pairs into lists of batch_size
+def iter_batches(pairs, batch_size):
+    pairs = iter(pairs)
+    while True:
+        batch = list(itertools.islice(pairs, batch_size))
+        if not batch:
+            return
+        yield batch
+
+# Remove monsters and everything that hangs off them. The ids go through a temp
+# table so each child table is scanned once rather than once per id.
+def delete_monsters(conn, monster_ids):
+    if not monster_ids:
+        return
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS doomed_ids (id INTEGER PRIMARY KEY)')
+    conn.execute('DELETE FROM doomed_ids')
+    conn.executemany('INSERT OR IGNORE INTO doomed_ids (id) VALUES (?)', [(monster_id,) for monster_id in monster_ids])
+    conn.execute('DELETE FROM images WHERE monster_id IN (SELECT id FROM doomed_ids)')
+    conn.execute('''
+    DELETE FROM statblock_terrains WHERE statblock_id IN (
+        SELECT id FROM statblocks WHERE monster_id IN (SELECT id FROM doomed_ids)
+    )
+    ''')
+    conn.execute('DELETE FROM statblocks WHERE monster_id IN (SELECT id FROM doomed_ids)')
+    conn.execute('DELETE FROM monsters_fts WHERE rowid IN (SELECT id FROM doomed_ids)')
+    conn.execute('DELETE FROM rendered_pages WHERE monster_id IN (SELECT id FROM doomed_ids)')
+    conn.execute('DELETE FROM monster_bodies WHERE monster_id IN (SELECT id FROM doomed_ids)')
+    conn.execute('DELETE FROM monsters WHERE id IN (SELECT id FROM doomed_ids)')
+
+# Load every monster in a single transaction, batch_size monsters per executemany,
+# with the monsters transformed by workers processes (see transformed_batches).
+# Returns (monsters, rows, seconds).
+def bulk_load(conn, monsters, batch_size=500, workers=1):
+    start = time.perf_counter()
+    previous = tune_for_bulk_load(conn)
+    count = 0
+    rows = 0
+    try:
+        with conn:
+            next_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM monsters').fetchone()[0]
+            batches = iter_batches(enumerate(skip_duplicate_keys(monsters), next_id), batch_size)
+            for batch, batch_rows in transformed_batches(conn, batches, workers):
+                rows += insert_rows(conn, batch_rows)
+                count += len(batch)
+    finally:
+        restore_pragmas(conn, previous)
+
+    return count, rows, time.perf_counter() - start
+
+# Bring an existing database in line with the JSON, keyed on monster_key.
+# Unchanged records (same content hash) are skipped, changed ones are rewritten
+# under their existing id, and keys missing from the JSON are deleted. Records
+# without a key, or repeating one seen earlier in the JSON, are skipped.
+# Returns a dict of inserted/updated/deleted/unchanged/skipped counts and seconds.
+def sync_monsters(conn, monsters, batch_size=500, workers=1):
+    start = time.perf_counter()
+    counts = dict.fromkeys(('inserted', 'updated', 'deleted', 'unchanged', 'skipped'), 0)
+    previous = tune_for_bulk_load(conn)
+    try:
+        with conn:
+            existing = {
+                monster_key: (monster_id, content_hash)
+                for monster_id, monster_key, content_hash
+                in conn.execute('SELECT id, monster_key, content_hash FROM monsters WHERE monster_key IS NOT NULL')
+            }
+            next_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM monsters').fetchone()[0]
+            seen = set()
+
+            # The new and changed monsters, as (monster_id, monster) pairs
+            def changed_monsters():
+                nonlocal next_id
+                for monster in monsters:
+                    monster_key = monster.get('monster_key')
+                    if monster_key is None:
+                        print(f"Skipping monster without a monster_key: {monster.get('title')!r}")
+                        counts['skipped'] += 1
+                        continue
+                    if monster_key in seen:
+                        print(f"Skipping monster with a duplicate monster_key {monster_key!r}: "
+                              f"{monster.get('title')!r}")
+                        counts['skipped'] += 1
+                        continue
+                    seen.add(monster_key)
+
+                    content_hash = monster_hash(monster)
+                    current = existing.get(monster_key)
+                    if current is None:
+                        monster_id = next_id
+                        next_id += 1
+                        existing[monster_key] = (monster_id, content_hash)
+                        counts['inserted'] += 1
+                    elif current[1] == content_hash:
+                        counts['unchanged'] += 1
+                        continue
+                    else:
+                        monster_id = current[0]
+                        existing[monster_key] = (monster_id, content_hash)
+                        counts['updated'] += 1
+
+                    yield monster_id, monster
+
+            batches = iter_batches(changed_monsters(), batch_size)
+            for batch, batch_rows in transformed_batches(conn, batches, workers):
+                delete_monsters(conn, [monster_id for monster_id, _ in batch])
+                insert_rows(conn, batch_rows)
+
+            stale = [monster_id for monster_key, (monster_id, _) in existing.items() if monster_key not in seen]
+            delete_monsters(conn, stale)
+            counts['deleted'] = len(stale)
+    finally:
+        restore_pragmas(conn, previous)
+
+    counts['seconds'] = time.perf_counter() - start
+    return counts
+
 # Main function to load the JSON and insert into SQLite
-def main():
-    # Load the JSON data
-    json_file = 'ALL_Monsters.json'  # Update this with your actual file path
-    monsters = load_monster_data(json_file)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the monster database from ALL_Monsters.json.")
+    parser.add_argument('json_file', nargs='?', default='ALL_Monsters.json')
+    parser.add_argument('--db', default='all_monsters.db')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help="monsters per executemany batch (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help="processes transforming monsters for the single writer; 1 does it all "
+                             "in this process (default: one per CPU, %(default)s)")
+    parser.add_argument('--row-by-row', action='store_true',
+                        help="use the old one-commit-per-row insert path; only into an empty database, "
+                             "so pair it with --rebuild to reload one")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="drop the existing tables and load everything from scratch")
+    args = parser.parse_args(argv)
+
+    # Stream the JSON data; monsters are decoded as the loader asks for them
+    monsters = iter_monster_data(args.json_file)
 
     # Create the SQLite database connection
-    conn = sqlite3.connect('all_monsters.db')
+    conn = sqlite3.connect(args.db)
 
     # Create the database schema
+    if args.rebuild:
+        drop_schema(conn)
     create_schema(conn)
+    is_empty = conn.execute('SELECT NOT EXISTS (SELECT 1 FROM monsters)').fetchone()[0]
+    if args.row_by_row and not is_empty:
+        # It inserts every monster afresh and would hit the unique monster keys
+        conn.close()
+        parser.error(f"--row-by-row cannot load into {args.db}, which already has monsters; "
+                     "add --rebuild to start from scratch, or leave it out to sync")
 
-    # Process the monster data and insert into the database
-    process_monster_data(conn, monsters)
+    # Process the monster data and insert into the database. A populated
+    # database is synced in place rather than appended to.
+    if args.row_by_row:
+        process_monster_data(conn, monsters)
+    else:
+        # Both run in one transaction, so a bad record leaves the database as it was
+        try:
+            if not is_empty:
+                counts = sync_monsters(conn, monsters, batch_size=args.batch_size, workers=args.workers)
+            else:
+                count, rows, elapsed = bulk_load(conn, monsters, batch_size=args.batch_size, workers=args.workers)
+        except ValueError as error:
+            conn.close()
+            raise SystemExit(f"{args.json_file}: {error}; {args.db} was not changed") from None
+        if not is_empty:
+            print("Synced in {seconds:.2f}s: {inserted} inserted, {updated} updated, "
+                  "{deleted} deleted, {unchanged} unchanged, {skipped} skipped".format(**counts))
+        else:
+            elapsed = elapsed or float('nan')
+            print(f"Loaded {count} monsters ({rows} rows) in {elapsed:.2f}s with {args.workers} worker(s): "
+                  f"{count / elapsed:,.0f} monsters/s, {rows / elapsed:,.0f} rows/s")
+
+    # Report the statblock fields that could not be typed
+    for column, (count, samples) in parse_failures(conn).items():
+        print(f"Could not parse {count} statblocks into {column}, e.g. {samples}")
+
+    # Merge the search index segments and refresh the planner statistics
+    with conn:
+        conn.execute("INSERT INTO monsters_fts (monsters_fts) VALUES ('optimize')")
+    conn.execute('ANALYZE')
+
+    # Readers (monsterdb) open the file read-only; WAL lets them keep reading
+    # while a later sync writes
+    conn.execute('PRAGMA journal_mode = WAL')
 
     # Close the connection
     conn.close()
     print("Data has been successfully inserted into the SQLite database.")
 
+    # The browser shows this list at startup instead of querying for it
+    count = monsterdb.write_title_snapshot(args.db)
+    print(f"Wrote {count} titles to {monsterdb.title_snapshot_path(args.db)}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,349 @@
+"""Dice expressions from the statblocks, parsed once into a compact AST.
+
+Handles the notations the compendium uses for No. Appearing, Hit Dice and
+Damage/Attack: dice ("3d4+2", "d6"), ranges ("2-12"), multipliers
+("2d10 x 5"), sums and alternatives ("1-4 or 2d6", "2d4/1d6"). Parenthesized
+notes and stray words ("1d6 (in lair)", "by weapon") are ignored.
+
+The AST is nested JSON-friendly lists, stored in the database as text:
+
+    ["c", k]            the constant k
+    ["d", n, s]         n dice of s sides
+    ["r", lo, hi]       a whole number from lo to hi, evenly
+    ["+", a, b, ...]    the sum of the terms
+    ["*", a, k]         a times the constant k
+    ["|", a, b, ...]    one of the alternatives, evenly
+    ["&", a, b, ...]    separate attacks (Damage/Attack "1d6/1d6/2d8"); rolls their total
+
+Hit Dice are turned into the hit point roll they stand for: "4+1" is 4d8+1
+and "1/2" is 1d4.
+
+Exact distributions are computed in pure Python. DiceExpression.roll draws
+in bulk with NumPy by inverse-CDF lookup in the compiled distribution, which
+runs at tens of millions of rolls per second.
+"""
+import argparse
+import bisect
+import json
+import random
+import re
+import time
+from functools import lru_cache
+
+# NumPy is only needed for bulk rolls, so it is imported on first use: parsing
+# and exact distributions work without it, and the browser imports this
+# module at startup
+_numpy = None
+
+def numpy_module():
+    """The numpy module, or None if it is not installed."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+# Largest dice pool (count x sides) or range accepted, to keep exact
+# distributions cheap
+MAX_SPAN = 2000
+
+HIT_DIE_SIDES = 8
+
+TOKEN_RE = re.compile(r"\d+|[a-z]+|[-+*/,;]")
+
+class DiceParseError(ValueError):
+    pass
+
+def _tokenize(text):
+    text = text.lower()
+    text = re.sub(r"\([^)]*\)|\[[^\]]*\]", " ", text)  # Notes: "(in lair)", "[see below]"
+    text = text.replace("–", "-").replace("—", "-").replace("×", "x")
+    text = re.sub(r"(?<=\d),(?=\d{3}\b)", "", text)  # Thousands separators
+    tokens = []
+    for token in TOKEN_RE.findall(text):
+        if token.isalpha():
+            if token in ("d", "or"):
+                tokens.append(token)
+            elif token in ("x", "times"):
+                tokens.append("*")
+            # Any other word is commentary and dropped
+        else:
+            tokens.append(token)
+    return tokens
+
+class _Parser:
+    def __init__(self, tokens, kind):
+        self.tokens = tokens
+        self.pos = 0
+        self.kind = kind
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def integer(self):
+        token = self.take()
+        if token is None or not token.isdigit():
+            raise DiceParseError(f"expected a number, got {token!r}")
+        return int(token)
+
+    def alternatives(self):
+        """alternatives := attacks (("or" | "," | ";" | "/") attacks)*"""
+        options = [self.attacks()]
+        while self.peek() in ("or", ",", ";", "/"):
+            self.take()
+            options.append(self.attacks())
+        return options[0] if len(options) == 1 else ["|"] + options
+
+    def attacks(self):
+        """For Damage/Attack, "/" separates attacks rather than alternatives."""
+        attacks = [self.sum()]
+        while self.kind == "damage" and self.peek() == "/":
+            self.take()
+            attacks.append(self.sum())
+        return attacks[0] if len(attacks) == 1 else ["&"] + attacks
+
+    def sum(self):
+        terms = [self.term()]
+        while self.peek() in ("+", "-"):
+            sign = self.take()
+            term = self.term()
+            if sign == "-":
+                term = ["c", -term[1]] if term[0] == "c" else ["*", term, -1]
+            terms.append(term)
+        return terms[0] if len(terms) == 1 else ["+"] + terms
+
+    def term(self):
+        node = self.atom()
+        while self.peek() == "*":
+            self.take()
+            node = ["*", node, self.integer()]
+        return node
+
+    def atom(self):
+        if self.peek() == "d":
+            self.take()
+            return self.dice(1, self.integer())
+        count = self.integer()
+        if self.peek() == "d":
+            self.take()
+            return self.dice(count, self.integer())
+        # "2-12" is a range, but "1-1" (Hit Dice: 1 HD less 1 hp) is a subtraction
+        if (self.peek() == "-" and self.peek(1) is not None and self.peek(1).isdigit()
+                and self.peek(2) != "d" and int(self.peek(1)) > count):
+            self.take()
+            high = self.integer()
+            if high - count > MAX_SPAN:
+                raise DiceParseError(f"range {count}-{high} is too wide")
+            return ["r", count, high]
+        # Hit Dice "1/2": half a hit die
+        if (self.kind == "hit_dice" and self.peek() == "/" and self.peek(1) is not None
+                and self.peek(1).isdigit()):
+            self.take()
+            return ["f", count, self.integer()]
+        return ["c", count]
+
+    def dice(self, count, sides):
+        if count < 1 or sides < 1 or count * sides > MAX_SPAN:
+            raise DiceParseError(f"unsupported dice {count}d{sides}")
+        return ["d", count, sides]
+
+def _hit_points(node):
+    """Rewrite a parsed Hit Dice entry as the hit point roll it stands for."""
+    kind = node[0]
+    if kind == "c":
+        return ["d", node[1], HIT_DIE_SIDES] if node[1] else ["c", 0]
+    if kind == "f":  # A fraction of a hit die: 1/2 HD is 1d4
+        sides = max(1, HIT_DIE_SIDES * node[1] // node[2])
+        return ["d", 1, sides]
+    if kind == "r":
+        return ["|"] + [["d", count, HIT_DIE_SIDES] if count else ["c", 0]
+                        for count in range(node[1], node[2] + 1)]
+    if kind == "+":  # "4+1": only the leading number counts hit dice
+        return ["+", _hit_points(node[1])] + node[2:]
+    if kind == "|":
+        return ["|"] + [_hit_points(option) for option in node[1:]]
+    return node
+
+def parse_ast(text, kind="plain"):
+    """Parse a statblock entry into an AST. kind is "plain", "hit_dice" or
+    "damage". Raises DiceParseError if there is no dice expression in it."""
+    if not text or not isinstance(text, str):
+        raise DiceParseError("empty")
+    tokens = _tokenize(text)
+    # Drop separators left dangling by removed words, e.g. "by weapon or 1d6"
+    while tokens and tokens[0] in ("or", ",", ";", "/", "+", "*"):
+        tokens.pop(0)
+    while tokens and tokens[-1] in ("or", ",", ";", "/", "+", "-", "*", "d"):
+        tokens.pop()
+    if not tokens:
+        raise DiceParseError(f"no dice expression in {text!r}")
+    parser = _Parser(tokens, kind)
+    node = parser.alternatives()
+    if parser.pos != len(tokens):
+        raise DiceParseError(f"unexpected {parser.peek()!r} in {text!r}")
+    if kind == "hit_dice":
+        node = _hit_points(node)
+    _check(node)
+    return node
+
+def _check(node):
+    if node[0] == "f":
+        raise DiceParseError("fractions are only meaningful in Hit Dice")
+    for child in node[1:]:
+        if isinstance(child, list):
+            _check(child)
+
+def _convolve(left, right):
+    result = {}
+    for a, p in left.items():
+        for b, q in right.items():
+            result[a + b] = result.get(a + b, 0.0) + p * q
+    return result
+
+def _uniform(low, high):
+    p = 1.0 / (high - low + 1)
+    return {value: p for value in range(low, high + 1)}
+
+def _distribution(node):
+    kind = node[0]
+    if kind == "c":
+        return {node[1]: 1.0}
+    if kind == "d":
+        die = _uniform(1, node[2])
+        result = {0: 1.0}
+        for _ in range(node[1]):
+            result = _convolve(result, die)
+        return result
+    if kind == "r":
+        return _uniform(node[1], node[2])
+    if kind in ("+", "&"):
+        result = {0: 1.0}
+        for child in node[1:]:
+            result = _convolve(result, _distribution(child))
+        return result
+    if kind == "*":
+        return {value * node[2]: p for value, p in _distribution(node[1]).items()}
+    if kind == "|":
+        result = {}
+        weight = 1.0 / (len(node) - 1)
+        for child in node[1:]:
+            for value, p in _distribution(child).items():
+                result[value] = result.get(value, 0.0) + p * weight
+        return result
+    raise DiceParseError(f"unknown node {kind!r}")
+
+class DiceExpression:
+    """A parsed dice expression with its exact distribution, ready to roll."""
+
+    __slots__ = ("text", "ast", "values", "probabilities", "cdf", "_arrays")
+
+    def __init__(self, ast, text=None):
+        self.text = text
+        self.ast = ast
+        distribution = sorted(_distribution(ast).items())
+        self.values = [value for value, _ in distribution]
+        self.probabilities = [p for _, p in distribution]
+        self.cdf = []
+        total = 0.0
+        for p in self.probabilities:
+            total += p
+            self.cdf.append(total)
+        self.cdf[-1] = 1.0
+        self._arrays = None
+
+    @classmethod
+    def from_json(cls, encoded, text=None):
+        return cls(json.loads(encoded), text)
+
+    def to_json(self):
+        return json.dumps(self.ast, separators=(",", ":"))
+
+    @property
+    def distribution(self):
+        """[(value, probability), ...] in increasing value order."""
+        return list(zip(self.values, self.probabilities))
+
+    @property
+    def mean(self):
+        return sum(value * p for value, p in zip(self.values, self.probabilities))
+
+    @property
+    def minimum(self):
+        return self.values[0]
+
+    @property
+    def maximum(self):
+        return self.values[-1]
+
+    def attacks(self):
+        """The separate attacks of a Damage/Attack entry, one expression each."""
+        if self.ast[0] == "&":
+            return [DiceExpression(child) for child in self.ast[1:]]
+        return [self]
+
+    def roll_one(self, rng=random):
+        """One roll, without NumPy."""
+        return self.values[bisect.bisect_left(self.cdf, rng.random())]
+
+    def roll(self, size, rng=None):
+        """A NumPy array of size rolls. rng is a numpy.random.Generator."""
+        np = numpy_module()
+        if np is None:
+            raise RuntimeError("rolling in bulk needs NumPy")
+        if self._arrays is None:
+            self._arrays = (np.asarray(self.values), np.asarray(self.cdf))
+        values, cdf = self._arrays
+        rng = rng if rng is not None else np.random.default_rng()
+        return values[np.searchsorted(cdf, rng.random(size), side="left")]
+
+    def __repr__(self):
+        return f"DiceExpression({self.text or self.to_json()!r})"
+
+@lru_cache(maxsize=4096)
+def parse_dice(text, kind="plain"):
+    """Return the DiceExpression for a statblock entry, or None if it has no
+    dice expression in it. Cached, so repeated entries are parsed once."""
+    try:
+        return DiceExpression(parse_ast(text, kind), text)
+    except DiceParseError:
+        return None
+
+def dice_json(text, kind="plain"):
+    """The AST of an entry as JSON for the database, or None."""
+    expression = parse_dice(text, kind)
+    return expression.to_json() if expression is not None else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the distribution of a dice expression.")
+    parser.add_argument("expression")
+    parser.add_argument("--kind", choices=("plain", "hit_dice", "damage"), default="plain")
+    parser.add_argument("--rolls", type=int, default=1_000_000, help="bulk rolls to time (needs NumPy)")
+    args = parser.parse_args(argv)
+
+    expression = parse_dice(args.expression, args.kind)
+    if expression is None:
+        raise SystemExit(f"No dice expression in {args.expression!r}")
+    print(f"AST: {expression.to_json()}")
+    print(f"Mean: {expression.mean:.3f}  Range: {expression.minimum} to {expression.maximum}")
+    for value, p in expression.distribution:
+        print(f"{value:>6}  {p:8.5f}  {'#' * round(p * 200)}")
+    np = numpy_module()
+    if np is not None and args.rolls:
+        rng = np.random.default_rng()
+        start = time.perf_counter()
+        rolls = expression.roll(args.rolls, rng)
+        elapsed = time.perf_counter() - start
+        print(f"{args.rolls:,} rolls in {elapsed * 1000:.1f} ms ({args.rolls / elapsed:,.0f}/s), "
+              f"sample mean {rolls.mean():.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""Random encounters built to an XP budget.
+
+An EncounterBuilder loads the typed stats of every statblock once, and for
+each set of filters (terrain, setting, activity cycle, alignment) keeps a
+candidate pool sorted by XP with cumulative frequency weights. Building an
+encounter is then a few bisections per monster group:
+
+    builder = EncounterBuilder(monsterdb.get_db())
+    for encounter in builder.build_many(100, party_level=5, terrain="forest"):
+        print(encounter.describe())
+
+Each encounter is one to max_groups groups of different monsters, each group
+sized by its No. Appearing roll, with a total XP between min_fill of the
+budget and the budget itself.
+"""
+import argparse
+import bisect
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+
+import instrument
+import monsterdb
+from dice import DiceExpression
+from terrain import terrain_tokens
+
+log = logging.getLogger('encounters')
+
+# XP value of a monster by Hit Dice (DMG table 31); a party of level N is
+# budgeted the XP of one N HD monster per character
+XP_BY_HIT_DICE = {
+    1: 15, 2: 35, 3: 65, 4: 120, 5: 175, 6: 270, 7: 420, 8: 650, 9: 975, 10: 1400,
+    11: 2000, 12: 3000, 13: 4000, 14: 5000, 15: 6000, 16: 7000, 17: 8000, 18: 9000,
+    19: 10000, 20: 11000,
+}
+
+# Relative chance of meeting a monster of each Frequency (DMG encounter tables)
+FREQUENCY_WEIGHTS = {
+    'common': 65,
+    'uncommon': 20,
+    'rare': 11,
+    'very rare': 4,
+    'unique': 1,
+}
+DEFAULT_FREQUENCY_WEIGHT = FREQUENCY_WEIGHTS['uncommon']
+
+# Most distinct filter combinations whose candidate pools are kept in memory
+POOL_CACHE_SIZE = 128
+
+# Draws tried before giving up on filling an encounter
+MAX_ATTEMPTS = 50
+
+# Encounters in a row build_many lets fail before it settles for fewer
+MAX_FAILED_BUILDS = 10
+
+Candidate = namedtuple('Candidate', 'statblock_id monster_id title xp weight dice')
+EncounterGroup = namedtuple('EncounterGroup', 'statblock_id monster_id title count xp')
+
+class Encounter(namedtuple('Encounter', 'groups budget')):
+    __slots__ = ()
+
+    @property
+    def xp(self):
+        return sum(group.count * group.xp for group in self.groups)
+
+    def describe(self):
+        groups = ", ".join(f"{group.title} (x{group.count})" for group in self.groups)
+        return f"{groups} - {self.xp:,} of {self.budget:,} XP"
+
+def xp_budget(party_level, party_size=4):
+    """The XP budget for a party: one monster of the party's level per character."""
+    level = max(1, min(party_level, max(XP_BY_HIT_DICE)))
+    return XP_BY_HIT_DICE[level] * party_size
+
+def frequency_weight(frequency):
+    frequency = " ".join((frequency or "").lower().split())
+    for name in ('very rare', 'uncommon', 'common', 'rare', 'unique'):
+        if frequency.startswith(name):
+            return FREQUENCY_WEIGHTS[name]
+    return DEFAULT_FREQUENCY_WEIGHT
+
+def matches_words(text, wanted):
+    """True if every word of wanted is in text, or text says "Any"."""
+    if not wanted:
+        return True
+    text = (text or "").lower()
+    if text.startswith('any'):
+        return True
+    return all(word in text for word in wanted.lower().split())
+
+class CandidatePool:
+    """Candidates sorted by XP, with cumulative weights for drawing among the
+    ones that still fit the remaining budget."""
+
+    __slots__ = ('candidates', 'xps', 'cumulative_weights')
+
+    def __init__(self, candidates):
+        self.candidates = sorted(candidates, key=lambda candidate: (candidate.xp, candidate.statblock_id))
+        self.xps = [candidate.xp for candidate in self.candidates]
+        self.cumulative_weights = []
+        total = 0
+        for candidate in self.candidates:
+            total += candidate.weight
+            self.cumulative_weights.append(total)
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def draw(self, max_xp, rng):
+        """A weighted random candidate worth at most max_xp, or None."""
+        fitting = bisect.bisect_right(self.xps, max_xp)
+        if not fitting:
+            return None
+        point = rng.random() * self.cumulative_weights[fitting - 1]
+        return self.candidates[min(fitting - 1, bisect.bisect_right(self.cumulative_weights, point))]
+
+class EncounterBuilder:
+    """Builds encounters from the statblocks of a MonsterDB. One builder can
+    serve several threads: its caches are filled under a lock, and each build
+    draws from its own rng."""
+
+    def __init__(self, db):
+        self.db = db
+        self._generation = db.generation
+        self._candidates = None
+        self._pools = {}
+        self._lock = threading.RLock()
+
+    def _drop_stale(self):
+        # The database has swapped in a new snapshot since these were loaded
+        if self._generation != self.db.generation:
+            self._generation = self.db.generation
+            self._candidates = None
+            self._pools = {}
+
+    @instrument.traced('encounter.candidates', 'encounter')
+    def candidates(self):
+        """Every statblock with a known XP value, loaded once per database generation."""
+        with self._lock:
+            return self._load_candidates()
+
+    def _load_candidates(self):
+        self._drop_stale()
+        if self._candidates is None:
+            dice_cache = {}
+            candidates = []
+            for (statblock_id, monster_id, title, setting, frequency, activity_cycle, alignment, xp,
+                 dice_json) in self.db.query('encounter_candidates'):
+                if dice_json is not None and dice_json not in dice_cache:
+                    dice_cache[dice_json] = DiceExpression.from_json(dice_json)
+                candidate = Candidate(statblock_id, monster_id, title, xp, frequency_weight(frequency),
+                                      dice_cache.get(dice_json))
+                candidates.append((candidate, setting, activity_cycle, alignment))
+            self._candidates = candidates
+        return self._candidates
+
+    @instrument.traced('encounter.pool', 'encounter')
+    def pool(self, terrain=None, setting=None, activity_cycle=None, alignment=None):
+        """The CandidatePool for a set of filters; cached per filter combination."""
+        with self._lock:
+            return self._pool(terrain, setting, activity_cycle, alignment)
+
+    def _pool(self, terrain, setting, activity_cycle, alignment):
+        self._drop_stale()
+        tokens = frozenset(terrain_tokens(terrain))
+        key = (tokens, (setting or "").lower(), (activity_cycle or "").lower(), (alignment or "").lower())
+        pool = self._pools.get(key)
+        if pool is not None:
+            return pool
+
+        in_terrain = None
+        for token in sorted(tokens):
+            ids = {row[0] for row in self.db.query('terrain_statblocks', (token,))}
+            in_terrain = ids if in_terrain is None else in_terrain & ids
+        pool = CandidatePool(
+            candidate for candidate, monster_setting, monster_activity, monster_alignment in self.candidates()
+            if (in_terrain is None or candidate.statblock_id in in_terrain)
+            and (not setting or (monster_setting or "").lower() == key[1])
+            and matches_words(monster_activity, activity_cycle)
+            and matches_words(monster_alignment, alignment)
+        )
+
+        if len(self._pools) >= POOL_CACHE_SIZE:
+            self._pools.clear()
+        self._pools[key] = pool
+        return pool
+
+    @instrument.traced('encounter.build', 'encounter')
+    def build(self, budget=None, party_level=1, party_size=4, max_groups=3, min_fill=0.5, rng=random,
+              **filters):
+        """One encounter worth between min_fill * budget and budget XP, or None
+        if the filters leave nothing that fits. filters are those of pool()."""
+        if budget is None:
+            budget = xp_budget(party_level, party_size)
+        pool = self.pool(**filters)
+        target = budget * min_fill
+        for _ in range(MAX_ATTEMPTS):
+            groups = []
+            remaining = budget
+            used = set()
+            while len(groups) < max_groups and remaining > 0:
+                candidate = pool.draw(remaining, rng)
+                if candidate is None or candidate.statblock_id in used:
+                    break
+                used.add(candidate.statblock_id)
+                count = candidate.dice.roll_one(rng) if candidate.dice is not None else 1
+                count = max(1, min(count, remaining // candidate.xp))
+                groups.append(EncounterGroup(candidate.statblock_id, candidate.monster_id, candidate.title,
+                                             count, candidate.xp))
+                remaining -= count * candidate.xp
+                # Once the budget is filled enough, stop at a random group count
+                if budget - remaining >= target and rng.random() < 0.5:
+                    break
+            if groups and budget - remaining >= target:
+                return Encounter(tuple(groups), budget)
+        return None
+
+    def build_many(self, count, seed=None, **options):
+        """count encounters built with the same options; a seed makes them
+        reproducible. An encounter that fails to fill is tried again, and
+        after MAX_FAILED_BUILDS failures in a row the ones built so far are
+        returned, with a warning saying how many are missing."""
+        rng = random.Random(seed)
+        encounters = []
+        failed = 0
+        while len(encounters) < count and failed < MAX_FAILED_BUILDS:
+            encounter = self.build(rng=rng, **options)
+            if encounter is None:
+                failed += 1
+                continue
+            failed = 0
+            encounters.append(encounter)
+        if len(encounters) < count:
+            log.warning("Built %d of %d encounters; %d in a row did not fit the budget and filters",
+                        len(encounters), count, failed)
+        return encounters
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build random encounters to an XP budget.")
+    parser.add_argument('--db', default=monsterdb.DEFAULT_DB_PATH)
+    parser.add_argument('--level', type=int, default=1, help="party level")
+    parser.add_argument('--party-size', type=int, default=4)
+    parser.add_argument('--budget', type=int, help="XP budget (default: from party level and size)")
+    parser.add_argument('--terrain')
+    parser.add_argument('--setting')
+    parser.add_argument('--activity', help="activity cycle, e.g. Night")
+    parser.add_argument('--alignment', help="alignment words, e.g. 'evil'")
+    parser.add_argument('--groups', type=int, default=3, help="most monster types in one encounter")
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--rate', action='store_true',
+                        help="simulate each encounter against a party of the level (see combat.py; needs NumPy)")
+    parser.add_argument('--trials', type=int, help="simulated fights per encounter with --rate")
+    args = parser.parse_args(argv)
+
+    db = monsterdb.get_db(args.db)
+    builder = EncounterBuilder(db)
+    start = time.perf_counter()
+    encounters = builder.build_many(args.count, seed=args.seed, budget=args.budget, party_level=args.level,
+                                    party_size=args.party_size, max_groups=args.groups, terrain=args.terrain,
+                                    setting=args.setting, activity_cycle=args.activity,
+                                    alignment=args.alignment)
+    elapsed = time.perf_counter() - start
+    if not encounters:
+        raise SystemExit("No monsters fit those criteria.")
+    ratings = [None] * len(encounters)
+    if args.rate:
+        import combat
+        simulator = combat.CombatSimulator(db)
+        party = combat.default_party(args.level, args.party_size)
+        ratings = simulator.rate_many(encounters, party, args.trials or combat.DEFAULT_TRIALS)
+    for encounter, rating in zip(encounters, ratings):
+        print(encounter.describe())
+        if rating is not None:
+            print(f"    {rating.describe()}")
+    print(f"{len(encounters)} encounters in {elapsed * 1000:.1f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,49 @@
+import argparse
+import csv
 import json
+import logging
 import random
+import sys
+
+import instrument
+import monsterdb
+from statblocks import iter_statblocks
+from terrain import terrain_tokens
+
+log = logging.getLogger('engen')
+
+# Fields written for every monster of an encounter, in output order
+ENCOUNTER_FIELDS = [
+    'monster_id', 'title', 'statblock', 'armor_class', 'hit_dice', 'no_appearing', 'thac0', 'xp_value',
+    'setting', 'climate_terrain',
+]
+
+class StatblockRecord:
+    """One statblock of one monster, flattened: a monster with several named
+    statblocks (variants, age categories) gives one record per statblock.
+    The terrain words and a lowercased copy of the setting, which the filters
+    compare, are made once, up front."""
+
+    __slots__ = ENCOUNTER_FIELDS + ['statblock_id', 'terrain_keys', 'setting_key']
+
+    def __init__(self, statblock_id, monster_id, title, statblock, armor_class, hit_dice, no_appearing, thac0,
+                 xp_value, setting, climate_terrain):
+        self.statblock_id = statblock_id
+        self.monster_id = monster_id
+        self.title = title
+        self.statblock = statblock
+        self.armor_class = armor_class
+        self.hit_dice = hit_dice
+        self.no_appearing = no_appearing
+        self.thac0 = thac0
+        self.xp_value = xp_value
+        self.setting = setting
+        self.climate_terrain = climate_terrain
+        self.terrain_keys = frozenset(terrain_tokens(climate_terrain))
+        self.setting_key = (setting or "").lower()
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in ENCOUNTER_FIELDS}
 
 # Load the JSON file
 def load_monster_data(json_file):
@@ -7,79 +51,164 @@ def load_monster_data(json_file):
         data = json.load(file)
     return data
 
-# Function to filter monsters based on environment or other criteria (e.g., setting)
-def filter_monsters(monsters, environment=None, setting=None):
-    filtered = []
-    for monster in monsters:
+# Flatten the monsters of the JSON file into one StatblockRecord per statblock.
+# Monsters are numbered from 1 in file order, as a fresh dbinsert load numbers them.
+@instrument.traced('engen.records_from_json', 'encounter')
+def records_from_json(monsters):
+    records = []
+    for monster_id, monster in enumerate(monsters, 1):
         monster_data = monster.get("monster_data", {})
-        statblock = monster_data.get("statblock", {})
-        
-        # Log the current monster being processed
-        print(f"Checking monster: {monster_data.get('title', 'Unknown Monster')}")
-
-        # Ensure statblock and other data exist before accessing it
-        if not statblock:
-            print("Statblock missing, skipping this monster.")
-            continue
-        
-        # Check for environment
-        climate_terrain = statblock.get("Climate/Terrain", "")
-        if environment and environment.lower() not in climate_terrain.lower():
-            print(f"Environment '{climate_terrain}' does not match '{environment}', skipping.")
-            continue
-        
-        # Check for setting
-        monster_setting = monster_data.get("setting", "")
-        if setting and setting.lower() != monster_setting.lower():
-            print(f"Setting '{monster_setting}' does not match '{setting}', skipping.")
-            continue
-
-        print(f"Monster '{monster_data.get('title', 'Unknown Monster')}' matches the criteria.")
-        filtered.append(monster)
-    
+        title = monster.get('title') or monster_data.get('title', 'Unknown Monster')
+        setting = monster_data.get('setting')
+        for name, statblock in iter_statblocks(monster):
+            if not isinstance(statblock, dict):
+                log.debug("%s: statblock %r is not a table, skipping", title, name)
+                continue
+            records.append(StatblockRecord(
+                len(records) + 1, monster_id, title, name, statblock.get('Armor Class'),
+                statblock.get('Hit Dice'), statblock.get('No. Appearing'), statblock.get('THAC0'),
+                statblock.get('XP Value'), setting, statblock.get('Climate/Terrain'),
+            ))
+    log.info("%d statblocks in %d monsters", len(records), len(monsters))
+    return records
+
+# One StatblockRecord per statblock in the database
+@instrument.traced('engen.records_from_db', 'encounter')
+def records_from_db(db):
+    return [StatblockRecord(*row) for row in db.query('encounter_statblocks')]
+
+# Keep the records whose Climate/Terrain has every terrain word of
+# environment and whose setting is setting, ignoring case; one pass over the
+# flat records. Words are compared as terrain.py normalizes them, the way
+# query_candidates looks them up in the terrain index.
+@instrument.traced('engen.filter_monsters', 'encounter')
+def filter_monsters(records, environment=None, setting=None):
+    wanted = terrain_tokens(environment)
+    setting = setting.lower() if setting else None
+    filtered = [
+        record for record in records
+        if (not wanted or wanted <= record.terrain_keys)
+        and (not setting or setting == record.setting_key)
+    ]
+    log.info("%d of %d statblocks match environment=%r setting=%r", len(filtered), len(records), environment,
+             setting)
     return filtered
 
+# The records in the database matching an environment and setting. The
+# environment is looked up through the terrain index, so only statblocks
+# with those terrain words are turned into records.
+@instrument.traced('engen.query_candidates', 'encounter')
+def query_candidates(db, environment=None, setting=None):
+    statblock_ids = None
+    for token in sorted(terrain_tokens(environment)):
+        ids = {row[0] for row in db.query('terrain_statblocks', (token,))}
+        statblock_ids = ids if statblock_ids is None else statblock_ids & ids
+
+    rows = db.query('encounter_statblocks')
+    if statblock_ids is not None:
+        rows = [row for row in rows if row[0] in statblock_ids]
+        log.info("%d statblocks have the terrain words of %r", len(rows), environment)
+    return filter_monsters([StatblockRecord(*row) for row in rows], setting=setting)
+
 # Generate random encounters
-def generate_encounter(monsters, num_monsters=1):
-    encounter = random.sample(monsters, min(num_monsters, len(monsters)))
+def generate_encounter(monsters, num_monsters=1, rng=random):
+    encounter = rng.sample(monsters, min(num_monsters, len(monsters)))
     return encounter
 
+# Generate count encounters lazily, so they can be written as they are made
+def iter_encounters(monsters, count, num_monsters=1, seed=None):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield generate_encounter(monsters, num_monsters, rng)
+
 # Display the encounter details
-def display_encounter(encounter):
+def display_encounter(encounter, out=sys.stdout):
     for monster in encounter:
-        monster_data = monster.get("monster_data", {})
-        title = monster_data.get("title", "Unknown Monster")
-        statblock = monster_data.get("statblock", {})
-        
-        # Use .get() safely with default values to avoid NoneType errors
-        print(f"\nMonster: {title}")
-        print(f"  Armor Class: {statblock.get('Armor Class', 'N/A')}")
-        print(f"  Hit Dice: {statblock.get('Hit Dice', 'N/A')}")
-        print(f"  Number Appearing: {statblock.get('No. Appearing', 'N/A')}")
-        print(f"  THAC0: {statblock.get('THAC0', 'N/A')}")
-        print(f"  XP Value: {statblock.get('XP Value', 'N/A')}")
-        print(f"  Setting: {monster_data.get('setting', 'N/A')}")
-        print(f"  Environment: {statblock.get('Climate/Terrain', 'N/A')}")
-        print()
-
-# Main function to load the data and generate a random encounter
-def main():
-    # Load monster data
-    monsters = load_monster_data('ALL_MONSTERS.json')
-    
-    # Filter monsters (optional)
-    # Example: Only get monsters in the "desert" environment from the "Dark Sun" setting
-    filtered_monsters = filter_monsters(monsters, environment="desert", setting="Dark Sun")
-    
-    if not filtered_monsters:
-        print("No monsters found with the specified criteria.")
-        return
-    
-    # Generate a random encounter
-    encounter = generate_encounter(filtered_monsters, num_monsters=3)
-    
-    # Display the encounter details
-    display_encounter(encounter)
+        out.write(f"\nMonster: {monster.title} ({monster.statblock})\n"
+                  f"  Armor Class: {monster.armor_class or 'N/A'}\n"
+                  f"  Hit Dice: {monster.hit_dice or 'N/A'}\n"
+                  f"  Number Appearing: {monster.no_appearing or 'N/A'}\n"
+                  f"  THAC0: {monster.thac0 or 'N/A'}\n"
+                  f"  XP Value: {monster.xp_value or 'N/A'}\n"
+                  f"  Setting: {monster.setting or 'N/A'}\n"
+                  f"  Environment: {monster.climate_terrain or 'N/A'}\n\n")
+
+# Writers for each output format; each takes an iterable of encounters
+def write_text(encounters, out):
+    for encounter in encounters:
+        display_encounter(encounter, out)
+
+def write_jsonl(encounters, out):
+    # Candidates repeat across encounters, so each is encoded only once
+    encoded = {}
+    for number, encounter in enumerate(encounters, 1):
+        monsters = []
+        for monster in encounter:
+            text = encoded.get(id(monster))
+            if text is None:
+                text = encoded[id(monster)] = json.dumps(monster.as_dict(), separators=(',', ':'))
+            monsters.append(text)
+        out.write(f'{{"encounter":{number},"monsters":[{",".join(monsters)}]}}\n')
+
+def write_csv(encounters, out):
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(['encounter'] + ENCOUNTER_FIELDS)
+    values = {}
+    for number, encounter in enumerate(encounters, 1):
+        for monster in encounter:
+            row = values.get(id(monster))
+            if row is None:
+                row = values[id(monster)] = [getattr(monster, field) for field in ENCOUNTER_FIELDS]
+            writer.writerow([number, *row])
+
+WRITERS = {'text': write_text, 'jsonl': write_jsonl, 'csv': write_csv}
+
+# Main function: generate random encounters from the database and stream them to stdout
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate random encounters from the monster database.")
+    parser.add_argument('--db', default=monsterdb.DEFAULT_DB_PATH)
+    parser.add_argument('--json', help="read the monsters from this JSON file instead of the database")
+    parser.add_argument('--environment',
+                        help="Climate/Terrain words, e.g. 'desert' or 'tropical hills'; a statblock matches when "
+                             "its Climate/Terrain has every word, whole words only, ignoring case and plurals")
+    parser.add_argument('--setting', help="e.g. 'Dark Sun'")
+    parser.add_argument('-n', '--count', type=int, default=1, help="encounters to generate")
+    parser.add_argument('--monsters', type=int, default=1, help="monsters per encounter")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='text')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--log-level', default='WARNING', help="DEBUG, INFO, WARNING or ERROR")
+    parser.add_argument('--timings', action='store_true', help="print timing histograms to stderr at the end")
+    parser.add_argument('--trace', metavar='FILE', help="write a Chrome trace of the run to FILE")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(levelname)s %(name)s: %(message)s')
+    if args.trace:
+        instrument.trace_to(args.trace)
+    elif args.timings:
+        instrument.enable()
+
+    if args.json:
+        records = records_from_json(load_monster_data(args.json))
+        candidates = filter_monsters(records, args.environment, args.setting)
+    else:
+        db = monsterdb.get_db(args.db)
+        candidates = query_candidates(db, args.environment, args.setting)
+        db.close()
+    if not candidates:
+        log.error("No monsters found with the specified criteria.")
+        return 1
+
+    encounters = iter_encounters(candidates, args.count, args.monsters, args.seed)
+    try:
+        with instrument.span('engen.write', 'encounter', count=args.count, format=args.format):
+            WRITERS[args.format](encounters, sys.stdout)
+            sys.stdout.flush()
+    except BrokenPipeError:  # e.g. piped into head
+        sys.stderr.close()
+        return 0
+    if args.timings:
+        print(instrument.format_histograms(), file=sys.stderr)
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""Timing spans for the hot paths, kept as histograms and optionally as a trace.
+
+    with instrument.span('html.load'):
+        ...
+
+    @instrument.traced('ui.on_monster_select', 'tk')
+    def on_monster_select(self, event):
+        ...
+
+Everything is off by default. A disabled span is a shared no-op object, and
+a traced function checks one flag before calling straight through, so the
+instrumentation can stay in the hot paths.
+
+instrument.enable() starts keeping a histogram per span name (count, p50,
+p99, mean, max). enable(trace=True) also keeps every span as a Chrome trace
+event; write_trace() saves them in a file that chrome://tracing and
+ui.perfetto.dev open, with one track per thread. Setting MONSTERS_TRACE=path
+in the environment does both for any app and writes the trace at exit.
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from functools import wraps
+
+TRACE_ENV = 'MONSTERS_TRACE'
+
+# Trace events kept at most; later ones are counted but dropped
+MAX_TRACE_EVENTS = 1_000_000
+
+# Histogram resolution: buckets per doubling of duration, about 9% wide
+BUCKETS_PER_OCTAVE = 8
+# Durations are bucketed in units of 0.1 us
+BUCKET_UNIT = 1e-7
+
+_enabled = False
+_tracing = False
+_lock = threading.Lock()
+_histograms = {}
+_events = []
+_thread_names = {}
+_dropped = 0
+_origin = time.perf_counter()
+
+class Histogram:
+    """Durations in logarithmic buckets: constant memory, percentiles to within a bucket."""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        bucket = math.floor(math.log2(max(seconds / BUCKET_UNIT, 1.0)) * BUCKETS_PER_OCTAVE)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction):
+        """Upper bound, in seconds, of the duration below which fraction of the samples fall."""
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.max, 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) * BUCKET_UNIT)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'p50_ms': self.percentile(0.5) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'mean_ms': self.total * 1000 / self.count if self.count else 0.0,
+            'max_ms': self.max * 1000,
+            'total_ms': self.total * 1000,
+        }
+
+class _Span:
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, self.category, self.start, time.perf_counter(), self.args)
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def is_enabled():
+    return _enabled
+
+def span(name, category='app', **args):
+    """A context manager timing its block under name. args go into the trace event."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+def record(name, category, start, end, args=None):
+    """Add a duration measured elsewhere, from time.perf_counter() readings."""
+    global _dropped
+    if not _enabled:
+        return
+    elapsed = end - start
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(elapsed)
+        if _tracing:
+            if len(_events) >= MAX_TRACE_EVENTS:
+                _dropped += 1
+                return
+            thread_id = threading.get_native_id()
+            if thread_id not in _thread_names:
+                _thread_names[thread_id] = threading.current_thread().name
+            event = {'name': name, 'cat': category, 'ph': 'X', 'ts': (start - _origin) * 1e6,
+                     'dur': elapsed * 1e6, 'pid': os.getpid(), 'tid': thread_id}
+            if args:
+                event['args'] = args
+            _events.append(event)
+
+def traced(name=None, category='app'):
+    """Decorator timing every call of a function; name defaults to its qualified name."""
+    def decorate(function):
+        label = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(label, category, start, time.perf_counter())
+        return wrapper
+    return decorate
+
+def enable(trace=False):
+    global _enabled, _tracing
+    _enabled = True
+    _tracing = _tracing or trace
+
+def disable():
+    global _enabled, _tracing
+    _enabled = _tracing = False
+
+def reset():
+    global _dropped
+    with _lock:
+        _histograms.clear()
+        _events.clear()
+        _dropped = 0
+
+def histograms():
+    """{span name: summary} of everything recorded so far."""
+    with _lock:
+        return {name: histogram.summary() for name, histogram in sorted(_histograms.items())}
+
+def format_histograms():
+    lines = [f"{'span':<32}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'total ms':>11}"]
+    for name, summary in histograms().items():
+        lines.append(f"{name:<32}{summary['count']:>8}{summary['p50_ms']:>10.3f}{summary['p99_ms']:>10.3f}"
+                     f"{summary['max_ms']:>10.3f}{summary['total_ms']:>11.1f}")
+    return "\n".join(lines)
+
+def write_trace(path):
+    """Write the trace events in Chrome's JSON format. Returns how many were written."""
+    with _lock:
+        events = list(_events)
+        names = dict(_thread_names)
+        dropped = _dropped
+    pid = os.getpid()
+    metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'monsters'}}]
+    metadata += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': name}}
+                 for thread_id, name in names.items()]
+    with open(path, 'w', encoding='utf-8') as out:
+        json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms',
+                   'otherData': {'dropped_events': dropped}}, out)
+    return len(events)
+
+def trace_to(path):
+    """Enable tracing and write the trace to path when the process exits."""
+    enable(trace=True)
+    atexit.register(write_trace, path)
+
+if os.environ.get(TRACE_ENV):
+    trace_to(os.environ[TRACE_ENV])
@@ -0,0 +1,637 @@
+"""Shared read-only access to the monster database.
+
+The Tk apps, scripts and any future service all go through a MonsterDB: a
+small pool of long-lived read-only connections, each with its own statement
+cache, plus timing counters for connects and every named query.
+
+Nothing here writes, so a MonsterDB can also read from a snapshot instead of
+the file: snapshot='memory' copies the whole database into RAM with the
+backup API, and snapshot='mmap' reads the file through a memory map rather
+than read() calls. refresh() notices when the file has changed and swaps in
+a new snapshot while queries carry on against the old one.
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+import bodystore
+import instrument
+from terrain import terrain_tokens
+
+DEFAULT_DB_PATH = 'db/monsters.db'
+
+# Most search results a list will show, in title order like the full list
+SEARCH_LIMIT = 200
+
+# Search results that get a snippet: about a screenful of the list. snippet()
+# reads and tokenizes the whole body, so it is kept to the rows seen first
+SNIPPET_ROWS = 40
+
+# Every query the apps run, by name. Keeping the SQL text fixed lets each
+# connection's statement cache reuse the prepared statement.
+QUERIES = {
+    # The NOCASE title index covers this query, and the pages are in other tables anyway
+    'list': "SELECT id, title, NULL FROM monsters ORDER BY title COLLATE NOCASE",
+    # Matches in title order. Going through the NOCASE title index keeps the
+    # rows sorted for free; ranking by bm25() sorted every match in a temp B-tree.
+    'search': """
+        SELECT m.id, m.title
+        FROM monsters m INDEXED BY idx_monsters_title
+        WHERE m.id IN (SELECT rowid FROM monsters_fts WHERE monsters_fts MATCH ?)
+        ORDER BY m.title COLLATE NOCASE
+        LIMIT ?
+    """,
+    # Snippets for a JSON array of the rowids 'search' returned, and whether
+    # the body matched at all. The markers are control characters, which the
+    # tag-stripped text never holds. The unary + keeps FTS5 from looking up
+    # each rowid on its own, which re-runs the match.
+    'snippets': """
+        SELECT rowid, snippet, instr(snippet, char(2)) > 0
+        FROM (
+            SELECT rowid, snippet(monsters_fts, 1, char(2), char(3), '...', 8) AS snippet
+            FROM monsters_fts
+            WHERE monsters_fts MATCH ? AND +rowid IN (SELECT value FROM json_each(?))
+        )
+    """,
+    # Pages are compressed; see bodystore.py and the 'dictionary' query
+    'details': """
+        SELECT m.title, b.body
+        FROM monsters m
+        LEFT JOIN monster_bodies b ON b.monster_id = m.id
+        WHERE m.id = ?
+    """,
+    'page': """
+        SELECT m.title, p.html, p.content_hash
+        FROM monsters m
+        LEFT JOIN rendered_pages p ON p.monster_id = m.id
+        WHERE m.id = ?
+    """,
+    'summary': """
+        SELECT m.title, p.content_hash
+        FROM monsters m
+        LEFT JOIN rendered_pages p ON p.monster_id = m.id
+        WHERE m.id = ?
+    """,
+    'dictionary': "SELECT dictionary FROM compression_dictionaries WHERE name = ?",
+    'images': "SELECT image_url FROM images WHERE monster_id = ?",
+    # Encounter candidates: every statblock carrying one terrain token, or all
+    # statblocks that list a terrain at all
+    'terrain_pool': """
+        SELECT sb.id, m.id, m.title, sb.no_appearing
+        FROM statblock_terrains t
+        JOIN statblocks sb ON sb.id = t.statblock_id
+        JOIN monsters m ON m.id = sb.monster_id
+        WHERE t.token = ?
+    """,
+    'any_terrain_pool': """
+        SELECT sb.id, m.id, m.title, sb.no_appearing
+        FROM statblocks sb
+        JOIN monsters m ON m.id = sb.monster_id
+        WHERE sb.climate_terrain IS NOT NULL
+    """,
+    # engen's view of a statblock: its id, then engen.ENCOUNTER_FIELDS
+    'encounter_statblocks': """
+        SELECT sb.id, m.id, m.title, sb.name, sb.armor_class, sb.hit_dice, sb.no_appearing, sb.thac0,
+               sb.xp_value, m.setting, sb.climate_terrain
+        FROM statblocks sb
+        JOIN monsters m ON m.id = sb.monster_id
+        ORDER BY sb.id
+    """,
+    'terrain_statblocks': "SELECT statblock_id FROM statblock_terrains WHERE token = ?",
+    # Everything the encounter builder needs, for every statblock worth XP
+    'encounter_candidates': """
+        SELECT sb.id, m.id, m.title, m.setting, sb.frequency, sb.activity_cycle, sb.alignment,
+               sb.xp_max, sb.no_appearing_dice
+        FROM statblocks sb
+        JOIN monsters m ON m.id = sb.monster_id
+        WHERE sb.xp_max > 0
+    """,
+    # What the combat simulator needs of every statblock
+    'combat_stats': """
+        SELECT id, ac_min, thac0_value, hd_min, hit_points_dice, damage_attack_dice, no_of_attacks
+        FROM statblocks
+    """,
+}
+
+# Typed statblock ranges find_statblocks can filter on: name -> (min column, max column)
+STATBLOCK_RANGES = {
+    'ac': ('ac_min', 'ac_max'),
+    'hd': ('hd_min', 'hd_max'),
+    'thac0': ('thac0_value', 'thac0_value'),
+    'xp': ('xp_min', 'xp_max'),
+    'morale': ('morale_min', 'morale_max'),
+    'intelligence': ('intelligence_min', 'intelligence_max'),
+    'size': ('size_min', 'size_max'),
+}
+
+# Most distinct terrain queries whose candidate pools are kept in memory
+TERRAIN_POOL_CACHE_SIZE = 128
+
+SNAPSHOT_MODES = ('memory', 'mmap')
+
+# Bytes of the file mapped in mmap mode; SQLite caps it at its compile-time limit
+MMAP_SIZE = 1 << 30
+
+# Names the in-memory snapshots apart, across every MonsterDB in the process
+_snapshot_ids = itertools.count(1)
+
+def fts_query(search_query):
+    """Turn free text into an FTS5 query: every word must match as a prefix.
+
+    One-letter prefixes match nearly every word of lore text, so until a longer
+    word is typed only the titles and sources are searched.
+    """
+    words = re.findall(r"\w+", search_query)
+    match = " ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+    if words and max(len(word) for word in words) < 2:
+        match = "{title sources} : (" + match + ")"
+    return match
+
+def format_snippet(snippet):
+    """A snippet from the 'snippets' query on one line, with [brackets] for its
+    highlight markers; body text keeps its line breaks."""
+    return " ".join(snippet.split()).replace("\x02", "[").replace("\x03", "]")
+
+class QueryCancelled(Exception):
+    """Raised when a query is abandoned because its caller no longer wants it."""
+
+class MonsterDB:
+    """A pool of read-only connections to one database file.
+
+    Connections are opened lazily, up to pool_size, and handed to one thread at
+    a time, so the UI thread and background workers can share a MonsterDB.
+
+    generation goes up every time refresh() finds the database changed;
+    anything caching query results can compare it to know when to drop them.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, pool_size=4, snapshot=None):
+        if snapshot is not None and snapshot not in SNAPSHOT_MODES:
+            raise ValueError(f"snapshot must be one of {SNAPSHOT_MODES}, not {snapshot!r}")
+        self.path = path
+        self.pool_size = pool_size
+        self.snapshot = snapshot
+        self.generation = 0
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._connect_count = 0
+        self._connect_seconds = 0.0
+        self._query_stats = {}
+        self._terrain_pools = {}
+        self._dictionaries = {}
+        # The snapshot connections open: its URI, the connection keeping an
+        # in-memory copy alive, and the database_stamp() it was taken at
+        self._snapshot_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._snapshot_uri = None
+        self._snapshot_holder = None
+        self._snapshot_stamp = None
+        self._snapshot_count = 0
+        self._snapshot_seconds = 0.0
+
+    def _file_uri(self):
+        return 'file:{}?mode=ro'.format(urllib.parse.quote(self.path))
+
+    def _take_snapshot(self):
+        """Return (uri, holder, stamp) for the database as it is now. Only
+        memory mode copies anything; the other modes just note the stamp."""
+        stamp = database_stamp(self.path)
+        if self.snapshot != 'memory':
+            return self._file_uri(), None, stamp
+
+        start = time.perf_counter()
+        uri = f'file:monsterdb-snapshot-{next(_snapshot_ids)}?mode=memory&cache=shared'
+        # The in-memory database lives as long as some connection to it is open
+        holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        source = sqlite3.connect(self._file_uri(), uri=True)
+        try:
+            source.backup(holder)
+        except BaseException:
+            holder.close()
+            raise
+        finally:
+            source.close()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._snapshot_count += 1
+            self._snapshot_seconds += elapsed
+        return uri, holder, stamp
+
+    def _current_snapshot(self):
+        """(generation, uri) for new connections, taking the first snapshot if need be."""
+        with self._snapshot_lock:
+            if self._snapshot_stamp is None:
+                self._snapshot_uri, self._snapshot_holder, self._snapshot_stamp = self._take_snapshot()
+            return self.generation, self._snapshot_uri
+
+    def _connect(self):
+        """Return (generation, connection) for the current snapshot."""
+        generation, uri = self._current_snapshot()
+        start = time.perf_counter()
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=len(QUERIES) * 2)
+        if self.snapshot == 'memory':
+            # Connections share the copy through the shared cache; nothing
+            # writes to it, so readers can skip its table locks
+            conn.execute('PRAGMA read_uncommitted = ON')
+        elif self.snapshot == 'mmap':
+            conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute('PRAGMA query_only = ON')
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._connect_count += 1
+            self._connect_seconds += elapsed
+        return generation, conn
+
+    def _reconnect(self, conn):
+        """Replace a connection to an old snapshot, keeping its pool slot."""
+        conn.close()
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool for the duration of the block."""
+        try:
+            generation, conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.pool_size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    generation, conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                generation, conn = self._idle.get()
+        if generation != self.generation:
+            generation, conn = self._reconnect(conn)
+        try:
+            yield conn
+        finally:
+            if generation != self.generation:
+                # Swapped while in use: put a connection to the new snapshot back instead
+                generation, conn = self._reconnect(conn)
+            self._idle.put((generation, conn))
+
+    def refresh(self):
+        """Check whether the database file has changed since the current
+        snapshot was taken, and if so take a new one and switch to it.
+
+        Queries already running finish against the old snapshot; later ones
+        use the new one. The caches of this MonsterDB are dropped, and
+        generation goes up so that other caches can follow. Returns True if
+        there was a swap. Nothing happens before the first query, or if the
+        file cannot be read just now (say, mid-write); the next call retries.
+        """
+        if self._snapshot_stamp is None or database_stamp(self.path) == self._snapshot_stamp:
+            return False
+        if not self._refresh_lock.acquire(blocking=False):
+            return False  # Another thread is already taking the new snapshot
+        try:
+            try:
+                uri, holder, stamp = self._take_snapshot()
+            except sqlite3.Error:
+                return False
+            with self._snapshot_lock:
+                old_holder = self._snapshot_holder
+                self._snapshot_uri, self._snapshot_holder, self._snapshot_stamp = uri, holder, stamp
+                with self._lock:
+                    self._terrain_pools = {}
+                    self._dictionaries = {}
+                self.generation += 1
+            if old_holder is not None:
+                old_holder.close()  # Connections still on it keep it alive until they are replaced
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def query(self, name, params=(), one=False, cancelled=None):
+        """Run one of the named QUERIES and return all rows (or the first).
+
+        cancelled is an optional callable polled while the query runs; once it
+        returns true the query is aborted and QueryCancelled is raised.
+        """
+        return self._execute(name, QUERIES[name], params, one, cancelled)
+
+    def _execute(self, name, sql, params, one=False, cancelled=None):
+        with self.connection() as conn:
+            if cancelled is not None:
+                conn.set_progress_handler(lambda: 1 if cancelled() else 0, 1000)
+            try:
+                start = time.perf_counter()
+                cursor = conn.execute(sql, params)
+                result = cursor.fetchone() if one else cursor.fetchall()
+                elapsed = time.perf_counter() - start
+            except sqlite3.OperationalError as e:
+                if cancelled is not None and cancelled():
+                    raise QueryCancelled(name) from e
+                raise
+            finally:
+                if cancelled is not None:
+                    conn.set_progress_handler(None, 0)
+        self._record(name, elapsed)
+        if instrument.is_enabled():
+            instrument.record(f'db.{name}', 'db', start, start + elapsed)
+        return result
+
+    def _record(self, name, elapsed):
+        with self._lock:
+            stats = self._query_stats.get(name)
+            if stats is None:
+                stats = self._query_stats[name] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+    def get_monster_list(self, search_query="", cancelled=None):
+        """Return (id, title, snippet) rows, searched through monsters_fts when
+        there is a query. The snippet is the bit of body text that matched,
+        with the matches in [brackets], for the first SNIPPET_ROWS results.
+        It is None further down, when only the title or sources matched, and
+        for the unfiltered list."""
+        match = fts_query(search_query)
+        if match:
+            rows = self.query('search', (match, SEARCH_LIMIT), cancelled=cancelled)
+            shown = json.dumps([monster_id for monster_id, _ in rows[:SNIPPET_ROWS]])
+            snippets = {monster_id: snippet for monster_id, snippet, in_body
+                        in self.query('snippets', (match, shown), cancelled=cancelled) if in_body}
+            return [(monster_id, title, format_snippet(snippets[monster_id]) if monster_id in snippets else None)
+                    for monster_id, title in rows]
+        return self.query('list', cancelled=cancelled)
+
+    def dictionary(self, name='pages'):
+        """The shared compression dictionary the pages were stored with, or None."""
+        dictionaries = self._dictionaries
+        if name not in dictionaries:
+            row = self.query('dictionary', (name,), one=True)
+            dictionaries[name] = row[0] if row is not None else None
+        return dictionaries[name]
+
+    def get_monster_details(self, monster_id):
+        """Return (title, full_body) for a monster, or None. The page is only
+        decompressed here, when it is asked for."""
+        row = self.query('details', (monster_id,), one=True)
+        if row is None:
+            return None
+        return row[0], bodystore.decompress(row[1], self.dictionary())
+
+    def get_monster_page(self, monster_id):
+        """Return (title, html, content_hash) for a monster's rendered page, or None."""
+        row = self.query('page', (monster_id,), one=True)
+        if row is None:
+            return None
+        title, html, content_hash = row
+        return title, bodystore.decompress(html, self.dictionary()) or '', content_hash
+
+    def get_monster_summary(self, monster_id):
+        """Return (title, content_hash) for a monster without reading its page, or None."""
+        return self.query('summary', (monster_id,), one=True)
+
+    def get_monster_images(self, monster_id):
+        """Return the image file names of a monster."""
+        return [row[0] for row in self.query('images', (monster_id,))]
+
+    def find_statblocks(self, limit=None, **ranges):
+        """Return (statblock_id, monster_id, title, name) rows for the statblocks
+        whose typed stats overlap every given range, e.g.
+
+            db.find_statblocks(xp=(500, 2000), ac=(None, 3))
+
+        Range names are the keys of STATBLOCK_RANGES; None leaves that end open.
+        Runs as one SQL query on the indexed typed columns."""
+        conditions, params = [], []
+        for stat, (low, high) in ranges.items():
+            min_column, max_column = STATBLOCK_RANGES[stat]
+            # A statblock with a range of values matches if any of them is in range
+            if low is not None:
+                conditions.append(f"sb.{max_column} >= ?")
+                params.append(low)
+            if high is not None:
+                conditions.append(f"sb.{min_column} <= ?")
+                params.append(high)
+        sql = ("SELECT sb.id, m.id, m.title, sb.name FROM statblocks sb "
+               "JOIN monsters m ON m.id = sb.monster_id")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY sb.id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._execute('find_statblocks', sql, params)
+
+    @instrument.traced('db.terrain_pool', 'db')
+    def terrain_pool(self, climate_terrain):
+        """Return the (monster_id, title, no_appearing) rows of every statblock
+        whose Climate/Terrain has all the words of climate_terrain (any terrain
+        if it has none), in statblock order. Pools are cached per word set."""
+        tokens = frozenset(terrain_tokens(climate_terrain))
+        # A refresh() swaps in a new dict, so a pool read from the old
+        # snapshot is never cached for the new one
+        pools = self._terrain_pools
+        pool = pools.get(tokens)
+        if pool is not None:
+            return pool
+
+        if tokens:
+            matches = None
+            for token in sorted(tokens):
+                rows = {row[0]: row[1:] for row in self.query('terrain_pool', (token,))}
+                matches = rows if matches is None else {key: matches[key] for key in matches if key in rows}
+        else:
+            matches = {row[0]: row[1:] for row in self.query('any_terrain_pool')}
+        pool = tuple(matches[statblock_id] for statblock_id in sorted(matches))
+
+        with self._lock:
+            if len(pools) >= TERRAIN_POOL_CACHE_SIZE:
+                pools.clear()
+            pools[tokens] = pool
+        return pool
+
+    def sample_encounters(self, climate_terrain, count, seed=None):
+        """Draw count independent random (id, title, no_appearing) encounters
+        for a terrain. Once the terrain's pool is cached this is O(count); a
+        seed makes the draw reproducible."""
+        pool = self.terrain_pool(climate_terrain)
+        if not pool:
+            return []
+        rng = random.Random(seed) if seed is not None else random
+        return rng.choices(pool, k=count)
+
+    def get_filtered_monsters(self, climate_terrain, num_monsters=1, seed=None):
+        """Return up to num_monsters distinct random (id, title, no_appearing) rows for a terrain."""
+        pool = self.terrain_pool(climate_terrain)
+        rng = random.Random(seed) if seed is not None else random
+        return rng.sample(pool, min(num_monsters, len(pool)))
+
+    def stats(self):
+        """Connection and per-query timing counters."""
+        with self._lock:
+            return {
+                'connections': {
+                    'open': self._opened,
+                    'count': self._connect_count,
+                    'total_ms': self._connect_seconds * 1000,
+                },
+                'snapshot': {
+                    'mode': self.snapshot or 'file',
+                    'generation': self.generation,
+                    'loads': self._snapshot_count,
+                    'load_ms': self._snapshot_seconds * 1000,
+                },
+                'queries': {
+                    name: {'count': count, 'total_ms': total * 1000, 'max_ms': worst * 1000,
+                           'mean_ms': total * 1000 / count}
+                    for name, (count, total, worst) in self._query_stats.items()
+                },
+            }
+
+    def format_stats(self):
+        stats = self.stats()
+        connections = stats['connections']
+        lines = [f"connections: {connections['count']} opened in {connections['total_ms']:.2f} ms"]
+        snapshot = stats['snapshot']
+        if snapshot['loads']:
+            lines.append(f"snapshot: {snapshot['loads']} {snapshot['mode']} copies made in "
+                         f"{snapshot['load_ms']:.2f} ms")
+        for name, query in sorted(stats['queries'].items()):
+            lines.append(f"{name:<10} {query['count']:>6} calls  mean {query['mean_ms']:.3f} ms  "
+                         f"max {query['max_ms']:.3f} ms")
+        return "\n".join(lines)
+
+    def close(self):
+        while True:
+            try:
+                _, conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+        with self._snapshot_lock:
+            if self._snapshot_holder is not None:
+                self._snapshot_holder.close()
+                self._snapshot_holder = None
+            self._snapshot_stamp = None
+
+# The unfiltered list, precomputed into a small file next to the database so
+# the browser can show it without waiting on a query. The snapshot is stamped
+# with the size and mtime of the database file and its WAL, so any write
+# since it was taken makes it stale.
+TITLE_SNAPSHOT_SUFFIX = '.titles'
+TITLE_SNAPSHOT_VERSION = 1
+
+def title_snapshot_path(path=DEFAULT_DB_PATH):
+    return path + TITLE_SNAPSHOT_SUFFIX
+
+def database_stamp(path=DEFAULT_DB_PATH):
+    stamp = []
+    for file_path in (path, path + '-wal'):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            stamp += [0, 0]
+            continue
+        # Readers leave an empty WAL behind, which is not a change
+        stamp += [stat.st_size, stat.st_mtime_ns] if stat.st_size else [0, 0]
+    return stamp
+
+def write_title_snapshot(path=DEFAULT_DB_PATH, db=None):
+    """Write the title snapshot for the database at path, reading the list
+    through db if given. Returns the number of titles written."""
+    stamp = database_stamp(path)
+    if db is None:
+        db = MonsterDB(path, pool_size=1)
+        try:
+            rows = db.query('list')
+        finally:
+            db.close()
+    else:
+        rows = db.query('list')
+
+    snapshot_path = title_snapshot_path(path)
+    temporary_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as snapshot:
+        snapshot.write(json.dumps({'version': TITLE_SNAPSHOT_VERSION, 'database': stamp,
+                                   'count': len(rows)}) + '\n')
+        snapshot.writelines(
+            "{}\t{}\n".format(monster_id, title.replace('\t', ' ').replace('\n', ' '))
+            for monster_id, title, _ in rows
+        )
+    os.replace(temporary_path, snapshot_path)
+    return len(rows)
+
+def read_title_snapshot(path=DEFAULT_DB_PATH):
+    """The (id, title, None) rows of the unfiltered list from the snapshot, or
+    None if there is no snapshot or the database has changed since."""
+    try:
+        with open(title_snapshot_path(path), encoding='utf-8') as snapshot:
+            header = json.loads(snapshot.readline())
+            if header.get('version') != TITLE_SNAPSHOT_VERSION or header.get('database') != database_stamp(path):
+                return None
+            rows = []
+            for line in snapshot:
+                monster_id, title = line.rstrip('\n').split('\t', 1)
+                rows.append((int(monster_id), title, None))
+    except (OSError, ValueError):
+        return None
+    return rows if len(rows) == header.get('count') else None
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def get_db(path=DEFAULT_DB_PATH, snapshot=None):
+    """Return the process-wide MonsterDB for a database file and snapshot mode."""
+    with _shared_lock:
+        db = _shared.get((path, snapshot))
+        if db is None:
+            db = _shared[path, snapshot] = MonsterDB(path, snapshot=snapshot)
+        return db
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the monster database from the command line.")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--stats', action='store_true', help="print connection and query timings")
+    parser.add_argument('--snapshot', choices=SNAPSHOT_MODES, help="read from an in-memory or mmap snapshot")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="list every monster")
+    search = commands.add_parser('search', help="full-text search")
+    search.add_argument('query')
+    show = commands.add_parser('show', help="print a monster's page")
+    show.add_argument('monster_id', type=int)
+    args = parser.parse_args(argv)
+
+    db = get_db(args.db, args.snapshot)
+    if args.command == 'show':
+        monster = db.get_monster_details(args.monster_id)
+        if monster is None:
+            raise SystemExit(f"No monster with id {args.monster_id}")
+        print(monster[0])
+        print(monster[1])
+    else:
+        query = args.query if args.command == 'search' else ""
+        for monster_id, title, snippet in db.get_monster_list(query):
+            print(f"{monster_id}: {title}" + (f" - {snippet}" if snippet else ""))
+    if args.stats:
+        print(db.format_stats())
+    db.close()
+
+if __name__ == "__main__":
+    main()
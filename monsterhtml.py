@@ -0,0 +1,199 @@
+import base64
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from functools import lru_cache
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+import assetpack
+import instrument
+from assetpack import ASSET_DIRS
+
+# Tags whose contents are never shown as text
+SKIPPED_TAGS = {'script', 'style', 'head', 'title'}
+
+# Tags that end a line of text, so words either side of them are not run together
+BLOCK_TAGS = {'br', 'p', 'div', 'tr', 'td', 'th', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'hr'}
+
+# Collects the visible text of an HTML document
+class TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    # The extracted text, one line per block, runs of whitespace collapsed
+    def text(self):
+        lines = (' '.join(line.split()) for line in ''.join(self.parts).splitlines())
+        return '\n'.join(line for line in lines if line)
+
+# Strip the markup from a full_body page, collapsing runs of whitespace
+def html_to_text(html):
+    if not html:
+        return ''
+    extractor = TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return extractor.text()
+
+# Tags dropped from rendered pages along with everything inside them
+DROPPED_TAGS = {'script', 'noscript', 'iframe', 'object', 'applet', 'title'}
+
+# Tags dropped from rendered pages, keeping what is inside them
+UNWRAPPED_TAGS = {'html', 'head', 'body', 'meta', 'link', 'base', 'embed', 'font'}
+
+# Attributes that may point at an asset
+URL_ATTRIBUTES = {'src', 'href', 'background'}
+
+# Void elements, which have no end tag
+VOID_TAGS = {'area', 'br', 'col', 'hr', 'img', 'input', 'wbr'}
+
+# Map the lowercased asset paths and bare file names to their real paths, e.g.
+# 'img/beh.gif' and 'beh.gif' -> 'img/beh.gif'. Uses the asset pack under root
+# if there is one, else the files on disk.
+@lru_cache(maxsize=8)
+def asset_index(root='.'):
+    pack = assetpack.open_pack(os.path.join(root, assetpack.DEFAULT_PACK_PATH))
+    if pack is not None:
+        paths = pack.names()
+        pack.close()
+    else:
+        paths = []
+        for directory in ASSET_DIRS:
+            try:
+                paths.extend(f'{directory}/{name}' for name in os.listdir(os.path.join(root, directory)))
+            except FileNotFoundError:
+                continue
+    index = {}
+    for path in paths:
+        index[path.lower()] = path
+        index.setdefault(path.rsplit('/', 1)[-1].lower(), path)
+    return index
+
+# Rewrite an asset reference such as '../IMG/Beh.gif' to the app-relative path
+# of the file, 'img/beh.gif'. Anything else (links, other sites) is kept as is.
+def resolve_asset(url, assets):
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc or not parts.path:
+        return url
+    path = posixpath.normpath(parts.path.replace('\\', '/')).lstrip('./').lower()
+    segments = path.split('/')
+    for i, segment in enumerate(segments):
+        if segment in ASSET_DIRS:
+            path = '/'.join(segments[i:])
+            break
+    return assets.get(path) or assets.get(segments[-1]) or url
+
+# Rewrites a full_body page into the compact form shown by the browser:
+# scripts, comments and other unused markup removed, whitespace collapsed and
+# asset paths resolved. Collects the page's text on the way.
+class PageRenderer(TextExtractor):
+    def __init__(self, assets):
+        super().__init__()
+        self.assets = assets
+        self.output = []
+        self.drop_depth = 0
+        self.pre_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        super().handle_starttag(tag, attrs)
+        if tag in DROPPED_TAGS:
+            self.drop_depth += 1
+        if self.drop_depth or tag in UNWRAPPED_TAGS:
+            return
+        if tag == 'pre':
+            self.pre_depth += 1
+        rendered = [tag]
+        for name, value in attrs:
+            if name.startswith('on'):
+                continue
+            if value is None:
+                rendered.append(name)
+                continue
+            if name in URL_ATTRIBUTES:
+                if value.strip().lower().startswith('javascript:'):
+                    continue
+                value = resolve_asset(value.strip(), self.assets)
+            rendered.append(f'{name}="{escape(value)}"')
+        self.output.append('<{}>'.format(' '.join(rendered)))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        super().handle_endtag(tag)
+        if tag in DROPPED_TAGS:
+            self.drop_depth = max(0, self.drop_depth - 1)
+            return
+        if self.drop_depth or tag in UNWRAPPED_TAGS or tag in VOID_TAGS:
+            return
+        if tag == 'pre':
+            self.pre_depth = max(0, self.pre_depth - 1)
+        self.output.append(f'</{tag}>')
+
+    def handle_data(self, data):
+        super().handle_data(data)
+        if self.drop_depth:
+            return
+        if not self.pre_depth:
+            # Runs of whitespace become one space, which may still separate
+            # words across tags, so it is kept even at either end
+            data = re.sub(r'\s+', ' ', data)
+            if data == ' ' and (not self.output or self.output[-1].endswith(' ')):
+                return
+        self.output.append(escape(data, quote=False))
+
+    def html(self):
+        return ''.join(self.output)
+
+# Render a full_body page for display. Returns (html, text, content_hash):
+# the compact page, its plain text and a SHA-1 of the page that changes
+# whenever it does. Asset paths are resolved against the files under root.
+@instrument.traced('html.render', 'html')
+def render_page(full_body, root='.'):
+    if not full_body:
+        return '', '', hashlib.sha1(b'').hexdigest()
+    renderer = PageRenderer(asset_index(root))
+    renderer.feed(full_body)
+    renderer.close()
+    rendered = renderer.html()
+    return rendered, renderer.text(), hashlib.sha1(rendered.encode('utf-8')).hexdigest()
+
+# An asset reference in a rendered page
+ASSET_REFERENCE_RE = re.compile(r'(src|background)="((?:{})/[^"]+)"'.format('|'.join(ASSET_DIRS)))
+
+# Replace the asset references of a rendered page with data: URIs of the
+# assets in an AssetPack, so the page needs no file lookups to display.
+# References to assets not in the pack are left alone.
+@instrument.traced('html.inline_assets', 'html')
+def inline_assets(html, pack):
+    def inline(match):
+        data = pack.get(match.group(2))
+        if data is None:
+            return match.group(0)
+        mime_type = mimetypes.guess_type(match.group(2))[0] or 'application/octet-stream'
+        encoded = base64.b64encode(data).decode('ascii')
+        return f'{match.group(1)}="data:{mime_type};base64,{encoded}"'
+    return ASSET_REFERENCE_RE.sub(inline, html)
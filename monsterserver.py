@@ -0,0 +1,436 @@
+"""A small HTTP/JSON service over the monster database.
+
+    python monsterserver.py --db all_monsters.db --port 8080
+
+Endpoints (GET or HEAD):
+
+    /monsters                       every (id, title)
+    /monsters?q=dragon              search results with snippets
+    /monsters/<id>                  title, content hash and images of a monster
+    /monsters/<id>/page             the rendered page, as text/html
+    /images/<name>                  a picture, from the asset pack or img/
+    /encounters?level=5&terrain=... random encounters (see encounters.py)
+    /stats                          query timings, and span histograms when
+                                    started with --timings or --trace
+
+Runs on asyncio with the standard library only. The blocking SQLite work
+happens on a thread pool sized to the MonsterDB connection pool, and at most
+max_concurrency requests are served at once, with further ones queued up to a
+limit and then turned away with 503. Pages, images and the monster list carry
+ETags and answer If-None-Match with 304; text responses are gzipped for
+clients that accept it. With --snapshot the database is served from memory
+(see MonsterDB), and a changed file is picked up without a restart.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import assetpack
+import instrument
+import monsterdb
+from encounters import EncounterBuilder
+
+log = logging.getLogger('monsterserver')
+
+DEFAULT_PORT = 8080
+
+IMAGE_DIR = 'img'
+
+# Requests served at once, and how many more may wait before new ones get 503
+MAX_CONCURRENCY = 32
+MAX_QUEUED = 256
+
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 15
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+# Compressed bodies kept, keyed by ETag, so hot pages are gzipped once
+GZIP_CACHE_SIZE = 256
+
+# Most encounters one request may ask for
+MAX_ENCOUNTERS = 1000
+
+# How often, in seconds, the database file is checked for changes
+REFRESH_INTERVAL = 2.0
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+class Response:
+    __slots__ = ('status', 'content_type', 'body', 'etag', 'headers')
+
+    def __init__(self, status=HTTPStatus.OK, content_type='application/json', body=b'', etag=None, headers=None):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.etag = etag
+        self.headers = headers or {}
+
+def json_response(value, etag=None, status=HTTPStatus.OK):
+    return Response(status, 'application/json', json.dumps(value, separators=(',', ':')).encode('utf-8'), etag)
+
+def error_response(status, message=None):
+    response = json_response({'error': message or status.phrase}, status=status)
+    if status == HTTPStatus.SERVICE_UNAVAILABLE:
+        response.headers['Retry-After'] = '1'
+    return response
+
+def quoted_etag(value):
+    return f'"{value}"'
+
+# The ETag of the gzipped form of a response: a different body, so a
+# different tag, or a cache could answer one encoding's request with the other
+def gzip_etag(etag):
+    return etag[:-1] + '-gz"' if etag else etag
+
+def accepts_gzip(headers):
+    return 'gzip' in headers.get('accept-encoding', '')
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match or etag is None:
+        return False
+    return if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(','))
+
+# The span a request is timed under: its path with the id or name left out,
+# e.g. http.monsters/<id>/page
+def endpoint_name(parts):
+    placeholders = {'monsters': '<id>', 'images': '<name>'}
+    named = parts[:1] + [placeholders.get(parts[0], '<arg>')] * (len(parts) > 1) + parts[2:3]
+    return 'http.' + '/'.join(named)
+
+class MonsterService:
+    """The request handlers. Everything here is blocking and runs on the
+    service's thread pool."""
+
+    def __init__(self, db, assets=None, image_dir=IMAGE_DIR):
+        self.db = db
+        self.assets = assets
+        self.image_dir = image_dir
+        self.encounters = EncounterBuilder(db)
+        self._list_response = None
+        # Shared by the request threads; compressing happens outside the lock
+        self._gzipped = OrderedDict()
+        self._gzipped_lock = threading.Lock()
+
+    def handle(self, method, target, headers):
+        if method not in ('GET', 'HEAD'):
+            return error_response(HTTPStatus.METHOD_NOT_ALLOWED)
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        try:
+            with instrument.span(endpoint_name(parts), 'http'):
+                response = self.route(parts, query, headers)
+        except HTTPError as e:
+            return error_response(e.status, str(e))
+
+        gzipped = accepts_gzip(headers) and self.compressible(response)
+        etag = gzip_etag(response.etag) if gzipped else response.etag
+        if etag_matches(headers.get('if-none-match'), etag):
+            return Response(HTTPStatus.NOT_MODIFIED, response.content_type, etag=etag, headers=response.headers)
+        return self.compress(response) if gzipped else response
+
+    def route(self, parts, query, headers):
+        if parts == ['monsters']:
+            return self.search(query['q']) if query.get('q') else self.monster_list()
+        if len(parts) == 2 and parts[0] == 'monsters':
+            return self.monster(self.monster_id(parts[1]))
+        if len(parts) == 3 and parts[0] == 'monsters' and parts[2] == 'page':
+            return self.page(self.monster_id(parts[1]), headers.get('if-none-match'), accepts_gzip(headers))
+        if len(parts) == 2 and parts[0] == 'images':
+            return self.image(parts[1])
+        if parts == ['encounters']:
+            return self.encounter(query)
+        if parts == ['stats']:
+            stats = self.db.stats()
+            if instrument.is_enabled():
+                stats['spans'] = instrument.histograms()
+            return json_response(stats)
+        raise HTTPError(HTTPStatus.NOT_FOUND)
+
+    @staticmethod
+    def monster_id(text):
+        try:
+            return int(text)
+        except ValueError:
+            raise HTTPError(HTTPStatus.NOT_FOUND) from None
+
+    def monster_list(self):
+        # Built once per database generation; the list only changes when the database does
+        generation = self.db.generation
+        if self._list_response is None or self._list_response[0] != generation:
+            response = json_response([{'id': monster_id, 'title': title}
+                                      for monster_id, title, _ in self.db.get_monster_list()])
+            response.etag = quoted_etag(hashlib.sha1(response.body).hexdigest())
+            self._list_response = (generation, response)
+        return self._list_response[1]
+
+    def search(self, text):
+        return json_response([{'id': monster_id, 'title': title, 'snippet': snippet}
+                              for monster_id, title, snippet in self.db.get_monster_list(text)])
+
+    def monster(self, monster_id):
+        summary = self.db.get_monster_summary(monster_id)
+        if summary is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"no monster {monster_id}")
+        title, content_hash = summary
+        return json_response({
+            'id': monster_id,
+            'title': title,
+            'content_hash': content_hash,
+            'images': self.db.get_monster_images(monster_id),
+        })
+
+    def page(self, monster_id, if_none_match=None, gzipped=False):
+        # A client that has the page already is answered without decompressing
+        # it. Which encoding it would get depends on the page's size, so only
+        # a tag of the encoding it asks for counts; handle() checks the rest.
+        summary = self.db.get_monster_summary(monster_id)
+        if summary is not None and summary[1]:
+            etag = quoted_etag(summary[1])
+            etag = gzip_etag(etag) if gzipped else etag
+            if etag_matches(if_none_match, etag):
+                return Response(HTTPStatus.NOT_MODIFIED, 'text/html; charset=utf-8', etag=etag)
+        page = self.db.get_monster_page(monster_id)
+        if page is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"no monster {monster_id}")
+        _, html, content_hash = page
+        return Response(content_type='text/html; charset=utf-8', body=html.encode('utf-8'),
+                        etag=quoted_etag(content_hash) if content_hash else None)
+
+    def image(self, name):
+        name = os.path.basename(name)
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if self.assets is not None:
+            packed_name = self.assets.resolve(f'{IMAGE_DIR}/{name}')
+            if packed_name is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"no image {name}")
+            data = self.assets.get(packed_name)
+            mtime_ns = self.assets.mtime_ns(packed_name)
+        else:
+            path = os.path.join(self.image_dir, name)
+            try:
+                with open(path, 'rb') as file:
+                    data = file.read()
+                mtime_ns = os.stat(path).st_mtime_ns
+            except (FileNotFoundError, IsADirectoryError):
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"no image {name}") from None
+        return Response(content_type=content_type, body=data, etag=quoted_etag(f'{mtime_ns:x}-{len(data):x}'),
+                        headers={'Cache-Control': 'max-age=86400'})
+
+    def encounter(self, query):
+        try:
+            count = min(int(query.get('count', 1)), MAX_ENCOUNTERS)
+            options = {
+                'party_level': int(query.get('level', 1)),
+                'party_size': int(query.get('party_size', 4)),
+                'max_groups': int(query.get('groups', 3)),
+                'budget': int(query['budget']) if 'budget' in query else None,
+            }
+            seed = int(query['seed']) if 'seed' in query else None
+        except ValueError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e)) from None
+        encounters = self.encounters.build_many(
+            count, seed=seed, terrain=query.get('terrain'), setting=query.get('setting'),
+            activity_cycle=query.get('activity'), alignment=query.get('alignment'), **options)
+        return json_response([
+            {'xp': encounter.xp, 'budget': encounter.budget, 'groups': [group._asdict() for group in encounter.groups]}
+            for encounter in encounters
+        ])
+
+    @staticmethod
+    def compressible(response):
+        return (response.status != HTTPStatus.NOT_MODIFIED and len(response.body) >= MIN_COMPRESS_SIZE
+                and response.content_type.startswith(COMPRESSIBLE_TYPES))
+
+    def compress(self, response):
+        """The gzipped form of a compressible response, with the ETag of that
+        encoding. The response itself is left as it is, as it may be cached."""
+        compressed = None
+        if response.etag:
+            with self._gzipped_lock:
+                compressed = self._gzipped.get(response.etag)
+                if compressed is not None:
+                    self._gzipped.move_to_end(response.etag)
+        if compressed is None:
+            compressed = gzip.compress(response.body, compresslevel=6, mtime=0)
+            if response.etag:
+                with self._gzipped_lock:
+                    self._gzipped[response.etag] = compressed
+                    while len(self._gzipped) > GZIP_CACHE_SIZE:
+                        self._gzipped.popitem(last=False)
+        return Response(response.status, response.content_type, compressed, gzip_etag(response.etag),
+                        dict(response.headers, **{'Content-Encoding': 'gzip'}))
+
+class MonsterServer:
+    """Speaks HTTP/1.1 with keep-alive on asyncio and hands each request to
+    a MonsterService on a thread pool."""
+
+    def __init__(self, service, workers=4, max_concurrency=MAX_CONCURRENCY, max_queued=MAX_QUEUED):
+        self.service = service
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='request')
+        self.limit = asyncio.Semaphore(max_concurrency)
+        self.max_queued = max_queued
+        self.waiting = 0
+        self.served = 0
+        self.rejected = 0
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    writer.write(self.serialize(error_response(HTTPStatus.BAD_REQUEST), False, False))
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length') or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # Without a length the body cannot be skipped, so the connection ends here
+                    writer.write(self.serialize(error_response(HTTPStatus.BAD_REQUEST, "bad Content-Length"),
+                                                False, False))
+                    break
+                if length:
+                    await reader.readexactly(length)  # Nothing takes a body; discard it
+
+                response = await self.respond(method, target, headers)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(self.serialize(response, keep_alive, method == 'HEAD'))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, headers):
+        if self.waiting >= self.max_queued:
+            self.rejected += 1
+            return error_response(HTTPStatus.SERVICE_UNAVAILABLE, "server is busy")
+        self.waiting += 1
+        try:
+            await self.limit.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self.executor, self.service.handle, method, target, headers)
+            log.debug("%s %s %d in %.2f ms", method, target, response.status,
+                      (time.perf_counter() - start) * 1000)
+            self.served += 1
+            return response
+        except Exception:
+            log.exception("error serving %s %s", method, target)
+            return error_response(HTTPStatus.INTERNAL_SERVER_ERROR)
+        finally:
+            self.limit.release()
+
+    @staticmethod
+    def serialize(response, keep_alive, head_only):
+        lines = [f'HTTP/1.1 {response.status.value} {response.status.phrase}']
+        body = response.body if response.status != HTTPStatus.NOT_MODIFIED else b''
+        headers = {
+            'Content-Type': response.content_type,
+            'Content-Length': str(len(body)),
+            'Connection': 'keep-alive' if keep_alive else 'close',
+            'Vary': 'Accept-Encoding',
+        }
+        if response.etag:
+            headers['ETag'] = response.etag
+        headers.update(response.headers)
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        return head if head_only else head + bytes(body)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+# Swap in a new database snapshot whenever the file changes
+async def watch_database(db, executor, interval=REFRESH_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await loop.run_in_executor(executor, db.refresh):
+                log.info("database changed; now serving generation %d", db.generation)
+        except Exception:
+            log.exception("could not refresh the database snapshot")
+
+async def serve(db_path, host, port, workers, max_concurrency, snapshot=None):
+    db = monsterdb.MonsterDB(db_path, pool_size=workers, snapshot=snapshot)
+    service = MonsterService(db, assetpack.open_pack())
+    server = MonsterServer(service, workers=workers, max_concurrency=max_concurrency)
+    listener = await server.start(host, port)
+    watcher = asyncio.create_task(watch_database(db, server.executor))
+    log.info("serving %s on http://%s:%d", db_path, host, port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        watcher.cancel()
+        server.close()
+        db.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the monster database over HTTP.")
+    parser.add_argument('--db', default=monsterdb.DEFAULT_DB_PATH)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=4, help="database threads and connections")
+    parser.add_argument('--max-concurrency', type=int, default=MAX_CONCURRENCY)
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--snapshot', choices=monsterdb.SNAPSHOT_MODES,
+                        help="serve from an in-memory copy of the database, or through mmap")
+    parser.add_argument('--timings', action='store_true', help="keep span histograms, shown by /stats")
+    parser.add_argument('--trace', metavar='FILE', help="write a Chrome trace to FILE on shutdown")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if args.trace:
+        instrument.trace_to(args.trace)
+    elif args.timings:
+        instrument.enable()
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.workers, args.max_concurrency, args.snapshot))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,112 +1,148 @@
+# First, so that every import after it is timed when startup metrics are on
+from startup import timer
+
+import argparse
+import logging
+import sys
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox
-from tkinterweb import HtmlFrame
-import sqlite3
-import random
-import re
-from PIL import Image, ImageTk
-import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import assetpack
+import instrument
+import monsterdb
+from dice import parse_dice
+from monsterhtml import inline_assets
+from pagecache import PageCache
+from thumbnails import ThumbnailCache
+from virtuallist import VirtualList
+
+timer.mark("imports done")
+
+log = logging.getLogger('monsterui')
 
 # Database connection
-DB_PATH = 'db/monsters.db'
+DB_PATH = monsterdb.DEFAULT_DB_PATH
+
+# Read from an in-memory or mmap snapshot of the database (see MonsterDB), or
+# None to read the file
+DB_SNAPSHOT = None
+
+def database():
+    return monsterdb.get_db(DB_PATH, DB_SNAPSHOT)
 
 def get_monster_images(monster_id):
     """Retrieve images associated with a specific monster by its ID."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT image_url FROM images WHERE monster_id = ?", (monster_id,))
-    images = cursor.fetchall()
-    conn.close()
-    return [image[0] for image in images]  # Extract image URLs from the tuples
+    return database().get_monster_images(monster_id)
     
-def load_image(image_path):
-    """Load an image from the local img directory and return a PhotoImage."""
-    if os.path.exists(image_path):
-        try:
-            image = Image.open(image_path)
-            image = image.resize((150, 150), Image.ANTIALIAS)  # Resize the image if needed
-            return ImageTk.PhotoImage(image)
-        except Exception as e:
-            print(f"Error loading image {image_path}: {e}")
-            return None
-    else:
-        print(f"Image path does not exist: {image_path}")
-        return None
-
-def get_monster_list(search_query=""):
-    """Retrieve the list of monster titles from the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    query = f"%{search_query.lower()}%"
-    cursor.execute("SELECT id, title FROM monsters WHERE LOWER(title) LIKE ?", (query,))
-    monsters = cursor.fetchall()
-    conn.close()
-    return monsters
+def get_monster_list(search_query="", cancelled=None):
+    """Retrieve (id, title, snippet) rows, searched through monsters_fts when there is a query."""
+    return database().get_monster_list(search_query, cancelled)
 
 def get_monster_details(monster_id):
     """Retrieve full details of a specific monster by ID."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT title, full_body FROM monsters WHERE id = ?", (monster_id,))
-    monster = cursor.fetchone()
-    conn.close()
-    return monster
+    return database().get_monster_details(monster_id)
+
+def get_monster_page(monster_id):
+    """Retrieve (title, html, content_hash) of a monster's pre-rendered page."""
+    return database().get_monster_page(monster_id)
 
 def get_filtered_monsters(climate_terrain, num_monsters=1):
     """Retrieve monsters based on climate/terrain and randomly select num_monsters."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    climate_query = f"%{climate_terrain.lower()}%"
-    cursor.execute("""
-        SELECT m.id, m.title, sb.no_appearing 
-        FROM monsters m
-        JOIN statblocks sb ON m.id = sb.monster_id
-        WHERE LOWER(sb.climate_terrain) LIKE ?
-        ORDER BY RANDOM() LIMIT ?;
-    """, (climate_query, num_monsters))
-    monsters = cursor.fetchall()
-    conn.close()
-    print(f"Monsters found: {monsters}")  # Debugging
+    monsters = database().get_filtered_monsters(climate_terrain, num_monsters)
+    log.debug("Monsters found: %s", monsters)
     return monsters
 
 def parse_no_appearing(no_appearing_str):
-    """Parse the 'No. Appearing' field (e.g., '1d6+1' or a number range) to generate the number of monsters."""
+    """Roll the 'No. Appearing' field (e.g. '1d6+1', '2-12' or '2d10 x 5') to get the number of monsters."""
     if not no_appearing_str:
-        print("No 'no_appearing' value provided. Defaulting to 1.")
+        log.debug("No 'no_appearing' value provided. Defaulting to 1.")
         return 1
 
-    try:
-        # Try to match dice notation like 1d6+1 or similar
-        match = re.match(r'(\d+)d(\d+)([+-]\d+)?', no_appearing_str)
-        if match:
-            num_dice = int(match.group(1))
-            dice_size = int(match.group(2))
-            modifier = int(match.group(3)) if match.group(3) else 0
-            total = sum(random.randint(1, dice_size) for _ in range(num_dice)) + modifier
-            return max(1, total)  # Ensure at least 1 appears
-        else:
-            # Fallback to a number or range like "1-3" or just "3"
-            numbers = re.findall(r'\d+', no_appearing_str)
-            if numbers:
-                chosen_number = random.choice(list(map(int, numbers)))
-                print(f"Choosing from range: {numbers}, selected: {chosen_number}")
-                return chosen_number
-            else:
-                print(f"Unexpected format in 'no_appearing': {no_appearing_str}. Defaulting to 1.")
-                return 1
-    except Exception as e:
-        print(f"Error parsing 'no_appearing': {no_appearing_str}, Exception: {e}")
+    expression = parse_dice(no_appearing_str)
+    if expression is None:
+        log.warning("Unexpected format in 'no_appearing': %s. Defaulting to 1.", no_appearing_str)
         return 1
+    return max(1, expression.roll_one())  # Ensure at least 1 appears
+
+# Most monster thumbnails kept in memory at once
+THUMBNAIL_CACHE_SIZE = 256
+
+# Monster pages kept ready to show, and how many rows either side of the
+# selection are fetched ahead of time
+DETAIL_CACHE_SIZE = 32
+PREFETCH_DISTANCE = 2
+
+# Monster pages kept laid out, so going back to one is instant
+PAGE_CACHE_SIZE = 8
+
+# How long typing must pause before a search runs, and how often the main
+# loop checks for finished searches (about one frame)
+SEARCH_DEBOUNCE_MS = 150
+SEARCH_POLL_MS = 16
+
+# How often the database file is checked for changes, which are then shown
+# without a restart
+REFRESH_CHECK_MS = 2000
+
+# Modules deferred until first use, imported in the background once the
+# window is up so the first page or picture does not wait on them
+PRELOAD_MODULES = ('tkinterweb', 'PIL.Image')
+PRELOAD_DELAY_MS = 500
+
+# Format a (id, title, snippet) row for the monster list; there is a snippet
+# only when the body text matched
+def format_list_row(monster_id, title, snippet):
+    if snippet:
+        return f"{monster_id}: {title} - {snippet}"
+    return f"{monster_id}: {title}"
 
 # Create the GUI application
 class MonsterExplorer(tk.Tk):
     def __init__(self):
         super().__init__()
+        timer.mark("window created")
         self.title("Monster Data Explorer")
         self.geometry("800x600")
+
+        # Searches run one at a time on a worker thread. Each new search bumps
+        # the generation, which cancels any older search still queued or running.
+        self.search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+        self.search_generation = 0
+        self.search_future = None
+        self.search_after_id = None
+        self.last_search_query = None
+        self.generation_lock = threading.Lock()
+
+        # Checks for a changed database, swapping in a new snapshot if so
+        self.refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refresh")
+
+        # Pictures come from the memory-mapped asset pack when it has been built
+        self.assets = assetpack.open_pack()
+
+        # Pre-sized thumbnails, most recently viewed kept as PhotoImages
+        self.thumbnails = ThumbnailCache(self, max_images=THUMBNAIL_CACHE_SIZE, pack=self.assets)
+
+        # Monster pages are fetched on worker threads into an LRU of futures,
+        # keyed by monster id. Only the current selection is ever displayed.
+        self.detail_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="detail")
+        self.detail_futures = OrderedDict()
+        self.selected_monster_id = None
+        self.selected_at = None  # perf_counter() of the click, for the ui.monster_click span
+
+        # The list is filled in once the window is on screen: from the title
+        # snapshot next to the database if it is current, else by a query
+        self.first_frame_shown = False
+        self.startup_complete = False
+        self.snapshot_stale = False
         
         # Create the main layout
         self.create_widgets()
+        timer.mark("widgets created")
+        self.bind("<Map>", self.on_first_map, add="+")
 
     def create_widgets(self):
         # Create a frame for the search, monster list, and buttons
@@ -127,14 +163,11 @@ class MonsterExplorer(tk.Tk):
         # Monster list label
         ttk.Label(self.left_frame, text="Monster List").pack(pady=10)
 
-        # Listbox to display monster titles
-        self.monster_listbox = tk.Listbox(self.left_frame)
+        # List of monster titles; only the rows on screen are materialized
+        self.monster_listbox = VirtualList(self.left_frame)
         self.monster_listbox.pack(fill="y", expand=True, padx=10, pady=10)
         self.monster_listbox.bind("<<ListboxSelect>>", self.on_monster_select)
 
-        # Populate the listbox with all monsters initially
-        self.populate_monster_list()
-
         # Create a frame for monster details
         self.right_frame = ttk.Frame(self)
         self.right_frame.pack(side="right", fill="both", expand=True)
@@ -147,52 +180,257 @@ class MonsterExplorer(tk.Tk):
         self.image_label = ttk.Label(self.right_frame)
         self.image_label.pack(pady=10)
 
-        # HTML frame to display full body text using tkinterweb's HtmlFrame
-        self.html_frame = HtmlFrame(self.right_frame)
-        self.html_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        # The monster's page, with the most recently shown ones kept laid out
+        self.pages = PageCache(self.right_frame, max_pages=PAGE_CACHE_SIZE)
+        self.pages.pack(fill="both", expand=True, padx=10, pady=10)
+
+    def on_first_map(self, event):
+        # <Map> also fires for every child widget; only the first one matters
+        if not self.first_frame_shown:
+            self.first_frame_shown = True
+            self.after_idle(self.on_first_frame)
+
+    @instrument.traced('ui.on_first_frame', 'tk')
+    def on_first_frame(self):
+        """Main loop: the window has been drawn. Fill the list, then warm up
+        the modules that were left out of startup."""
+        timer.mark("first frame")
+        self.load_initial_list()
+        self.after(PRELOAD_DELAY_MS, self.preload_modules)
+        self.after(REFRESH_CHECK_MS, self.check_for_changes)
+        # Take the snapshot (and read the page dictionary) before the first click needs it
+        self.refresh_executor.submit(database().dictionary)
+
+    def check_for_changes(self):
+        """Main loop: have a worker check whether the database has changed."""
+        future = self.refresh_executor.submit(database().refresh)
+        self.after(SEARCH_POLL_MS, self.poll_refresh, future)
+
+    def poll_refresh(self, future):
+        if not future.done():
+            self.after(SEARCH_POLL_MS, self.poll_refresh, future)
+            return
+        try:
+            changed = future.result()
+        except Exception as e:
+            log.warning("Could not refresh the database: %s", e)
+            changed = False
+        if changed:
+            self.on_database_changed()
+        self.after(REFRESH_CHECK_MS, self.check_for_changes)
+
+    @instrument.traced('ui.on_database_changed', 'tk')
+    def on_database_changed(self):
+        """Main loop: a new snapshot is in; reload what was read from the old one."""
+        log.info("Database changed; reloading the list")
+        self.detail_futures.clear()
+        self.snapshot_stale = True
+        self.populate_monster_list(self.last_search_query or "")
+
+    @instrument.traced('ui.load_initial_list', 'tk')
+    def load_initial_list(self):
+        rows = monsterdb.read_title_snapshot(DB_PATH)
+        if rows is None:
+            # The search worker rewrites the snapshot after listing everything
+            self.snapshot_stale = True
+            self.populate_monster_list()
+            return
+        self.last_search_query = ""
+        self.monster_listbox.set_rows([format_list_row(*row) for row in rows])
+        self.list_shown("snapshot")
+
+    def list_shown(self, source):
+        """Main loop: called whenever the list is filled in."""
+        if self.startup_complete:
+            return
+        self.startup_complete = True
+        timer.mark(f"list shown ({source})")
+        self.event_generate("<<StartupComplete>>", when="tail")
+
+    def preload_modules(self):
+        def preload():
+            for name in PRELOAD_MODULES:
+                try:
+                    __import__(name)
+                except ImportError:
+                    pass
+        threading.Thread(target=preload, name="preload", daemon=True).start()
 
     def populate_monster_list(self, search_query=""):
-        """Populate the Listbox with monster titles filtered by search query."""
-        monsters = get_monster_list(search_query)
-        self.monster_listbox.delete(0, tk.END)
-        for monster in monsters:
-            self.monster_listbox.insert(tk.END, f"{monster[0]}: {monster[1]}")
+        """Start filling the list with monster titles filtered by search query.
+
+        The query runs on the search worker; the list is updated from the main
+        loop once the results are in.
+        """
+        self.last_search_query = search_query
+        with self.generation_lock:
+            self.search_generation += 1
+            generation = self.search_generation
+        if self.search_future is not None:
+            self.search_future.cancel()  # Only succeeds if it has not started yet
+        self.search_future = self.search_executor.submit(self.run_search, search_query, generation)
+        self.after(SEARCH_POLL_MS, self.poll_search, self.search_future, generation)
+
+    def is_stale(self, generation):
+        with self.generation_lock:
+            return generation != self.search_generation
+
+    @instrument.traced('ui.run_search', 'worker')
+    def run_search(self, search_query, generation):
+        """Worker thread: run the query and format the rows, unless superseded."""
+        if self.is_stale(generation):
+            return None
+        try:
+            monsters = get_monster_list(search_query, cancelled=lambda: self.is_stale(generation))
+        except monsterdb.QueryCancelled:
+            return None
+        if not search_query and self.snapshot_stale:
+            self.snapshot_stale = False
+            try:
+                # Read from the file itself, which a snapshot may lag behind
+                monsterdb.write_title_snapshot(DB_PATH)
+            except OSError as e:
+                log.warning("Could not write the title snapshot: %s", e)
+        return [format_list_row(*monster) for monster in monsters]
+
+    @instrument.traced('ui.poll_search', 'tk')
+    def poll_search(self, future, generation):
+        """Main loop: show the results of a finished search if it is still current."""
+        if self.is_stale(generation):
+            return
+        if not future.done():
+            self.after(SEARCH_POLL_MS, self.poll_search, future, generation)
+            return
+        try:
+            rows = future.result()
+        except Exception as e:
+            messagebox.showerror("Error", f"Search failed: {e}")
+            return
+        if rows is not None:
+            self.monster_listbox.set_rows(rows)
+            self.list_shown("database")
 
+    @instrument.traced('ui.on_search', 'tk')
     def on_search(self, event):
-        """Handle real-time search in the monster list."""
+        """Handle real-time search in the monster list, once typing pauses."""
+        if self.search_after_id is not None:
+            self.after_cancel(self.search_after_id)
+        self.search_after_id = self.after(SEARCH_DEBOUNCE_MS, self.run_debounced_search)
+
+    @instrument.traced('ui.run_debounced_search', 'tk')
+    def run_debounced_search(self):
+        self.search_after_id = None
         search_query = self.search_var.get()
-        self.populate_monster_list(search_query)
+        # Keys that do not edit the text (arrows, shift) also fire <KeyRelease>
+        if search_query != self.last_search_query:
+            self.populate_monster_list(search_query)
 
+    @instrument.traced('ui.on_monster_select', 'tk')
     def on_monster_select(self, event):
-        """Load and display details and image of the selected monster."""
+        """Load and display details and image of the selected monster.
+
+        The page is fetched in the background (or taken from the prefetched
+        ones) and shown once ready, unless another monster is selected first.
+        Neighbouring rows are prefetched so arrow-key browsing is instant.
+        """
+        # Get selected item
+        selection = self.monster_listbox.curselection()
+        if not selection:
+            return
+
+        index = selection[0]
+        monster_id = self.list_row_monster_id(index)
+        self.selected_monster_id = monster_id
+        self.selected_at = time.perf_counter()
+
+        future = self.request_detail(monster_id)
+        neighbours = [
+            self.list_row_monster_id(i)
+            for i in range(max(0, index - PREFETCH_DISTANCE),
+                           min(self.monster_listbox.size(), index + PREFETCH_DISTANCE + 1))
+            if i != index
+        ]
+        for neighbour_id in neighbours:
+            self.request_detail(neighbour_id)
+
+        # Drop fetches that have not started and are no longer near the selection
+        wanted = set(neighbours) | {monster_id}
+        for other_id, other in list(self.detail_futures.items()):
+            if other_id not in wanted and other.cancel():
+                del self.detail_futures[other_id]
+
+        self.poll_detail(monster_id, future)
+
+    def list_row_monster_id(self, index):
+        return int(self.monster_listbox.get(index).split(":")[0])
+
+    def request_detail(self, monster_id):
+        """Return the future for a monster's page, starting the fetch if needed."""
+        future = self.detail_futures.get(monster_id)
+        if future is not None and not future.cancelled():
+            self.detail_futures.move_to_end(monster_id)
+            return future
+        future = self.detail_executor.submit(self.fetch_detail, monster_id)
+        self.detail_futures[monster_id] = future
+        while len(self.detail_futures) > DETAIL_CACHE_SIZE:
+            self.detail_futures.popitem(last=False)
+        return future
+
+    @instrument.traced('ui.fetch_detail', 'worker')
+    def fetch_detail(self, monster_id):
+        """Worker thread: read the page and make sure its thumbnail is ready.
+
+        Returns (title, html, page_key, image_name, thumbnail_path), or None if
+        the monster is gone.
+        """
+        monster = get_monster_page(monster_id)
+        if monster is None:
+            return None
+        title, html, content_hash = monster
+        page_key = content_hash or f"monster:{monster_id}"  # Not rendered at ingest
+        if self.assets is not None:
+            html = inline_assets(html, self.assets)
+        image_paths = get_monster_images(monster_id)
+        image_name = image_paths[0] if image_paths else None  # Assuming first image
+        prepared_path = self.thumbnails.prepare(image_name) if image_name else None
+        return title, html, page_key, image_name, prepared_path
+
+    @instrument.traced('ui.poll_detail', 'tk')
+    def poll_detail(self, monster_id, future):
+        """Main loop: show a fetched page if it is still the selected one."""
+        if monster_id != self.selected_monster_id:
+            return
+        if not future.done():
+            self.after(SEARCH_POLL_MS, self.poll_detail, monster_id, future)
+            return
         try:
-            # Get selected item
-            selection = self.monster_listbox.curselection()
-            if not selection:
-                return
-
-            index = selection[0]
-            monster_id = int(self.monster_listbox.get(index).split(":")[0])
-
-            # Fetch monster details
-            monster = get_monster_details(monster_id)
-            if monster:
-                self.title_label.config(text=monster[0])
-                self.html_frame.load_html(monster[1])  # Use load_html to load the HTML string
+            detail = future.result()
+        except Exception as e:
+            self.detail_futures.pop(monster_id, None)  # Let a reselect try again
+            messagebox.showerror("Error", f"An error occurred: {e}")
+            return
+        if detail is not None:
+            self.show_detail(*detail)
+            # From the click to the page being on screen, across the worker thread
+            instrument.record('ui.monster_click', 'tk', self.selected_at, time.perf_counter(),
+                              {'monster_id': monster_id})
+
+    @instrument.traced('ui.show_detail', 'tk')
+    def show_detail(self, title, html, page_key, image_name, prepared_path):
+        try:
+            self.title_label.config(text=title)
+            self.pages.show(page_key, html)
 
-                # Get associated images
-                image_paths = get_monster_images(monster_id)
-                if image_paths:
-                    image_path = os.path.join("img", image_paths[0])  # Assuming first image
-                    image = load_image(image_path)
-                    if image:
-                        self.image_label.config(image=image)
-                        self.image_label.image = image  # Keep a reference to prevent GC
+            if image_name:
+                image = self.thumbnails.get(image_name, prepared_path)
+                if image:
+                    self.image_label.config(image=image)
+                    self.image_label.image = image  # Keep a reference to prevent GC
 
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {e}")
 
-
+    @instrument.traced('ui.open_encounter_screen', 'tk')
     def open_encounter_screen(self):
         """Open the screen to configure and generate an encounter."""
         encounter_window = tk.Toplevel(self)
@@ -205,21 +443,22 @@ class MonsterExplorer(tk.Tk):
         ttk.Entry(encounter_window, textvariable=climate_terrain).pack(pady=5)
 
         # Button to generate the encounter
+        @instrument.traced('ui.generate_encounter', 'tk')
         def generate_encounter():
             monsters = get_filtered_monsters(climate_terrain.get())
             if not monsters:
-                print("No monsters found.")  # Debugging
+                log.debug("No monsters found.")
                 messagebox.showinfo("No Monsters Found", "No monsters found matching the criteria.")
                 return
             
             # Monster is a tuple with id, title, and no_appearing fields, so unpack it
             monster_id, monster_title, no_appearing = monsters[0]  # Since you're fetching multiple monsters, access the first one
-            print(f"Monster selected: {monster_title}, Appearing: {no_appearing}")  # Debugging
+            log.debug("Monster selected: %s, Appearing: %s", monster_title, no_appearing)
 
             # Use no_appearing field to determine number of monsters
             num_appearing = parse_no_appearing(no_appearing)  
             encounter_text = f"{monster_title} (x{num_appearing})"
-            print(f"Encounter generated: {encounter_text}")  # Debugging
+            log.debug("Encounter generated: %s", encounter_text)
             messagebox.showinfo("Generated Encounter", encounter_text)
 
             # Automatically display the monster in the browser
@@ -230,14 +469,46 @@ class MonsterExplorer(tk.Tk):
     def show_monster(self, monster_id):
         """Show the monster in the monster browser."""
         # Select the monster in the listbox
-        for i in range(self.monster_listbox.size()):
-            if self.monster_listbox.get(i).startswith(f"{monster_id}:"):
+        prefix = f"{monster_id}:"
+        for i, row in enumerate(self.monster_listbox.rows):
+            if row.startswith(prefix):
                 self.monster_listbox.select_clear(0, tk.END)
                 self.monster_listbox.select_set(i)
                 self.monster_listbox.event_generate("<<ListboxSelect>>")
                 break
 
-# Run the application
-if __name__ == "__main__":
+def main(argv=None):
+    global DB_PATH, DB_SNAPSHOT
+    parser = argparse.ArgumentParser(description="Browse the monster database.")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--snapshot', choices=monsterdb.SNAPSHOT_MODES,
+                        help="read from an in-memory copy of the database, or through mmap")
+    parser.add_argument('--startup-metrics', action='store_true',
+                        help="print import times and time to first frame to stderr")
+    parser.add_argument('--exit-after-startup', action='store_true',
+                        help="quit as soon as the list is shown (used by benchmarks/startup.py)")
+    parser.add_argument('--timings', action='store_true', help="print timing histograms to stderr on exit")
+    parser.add_argument('--trace', metavar='FILE', help="write a Chrome trace of the session to FILE on exit")
+    parser.add_argument('--log-level', default='WARNING', help="DEBUG, INFO, WARNING or ERROR")
+    args = parser.parse_args(argv)
+    DB_PATH = args.db
+    DB_SNAPSHOT = args.snapshot
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(levelname)s %(name)s: %(message)s')
+    if args.trace:
+        instrument.trace_to(args.trace)
+    elif args.timings:
+        instrument.enable()
+
     app = MonsterExplorer()
+    if args.startup_metrics:
+        app.bind("<<StartupComplete>>", lambda event: print(timer.report(), file=sys.stderr), add="+")
+    if args.exit_after_startup:
+        app.bind("<<StartupComplete>>", lambda event: app.after_idle(app.destroy), add="+")
     app.mainloop()
+    if args.timings:
+        print(instrument.format_histograms(), file=sys.stderr)
+
+# Run the application
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import pathlib
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import ttk
+
+import instrument
+
+# Rendered pages reference their assets as img/... and grf/..., relative to the app
+BASE_URL = pathlib.Path(os.getcwd()).as_uri() + '/'
+
+class PageCache(ttk.Frame):
+    """Shows HTML pages, keeping the last few laid out in their own HtmlFrames.
+
+    Pages are keyed by content hash. Showing a cached page just raises its
+    frame, so going back to a monster costs no parse or layout; the least
+    recently shown frame is destroyed once there are more than max_pages.
+    """
+
+    def __init__(self, master, max_pages=8, base_url=BASE_URL):
+        super().__init__(master)
+        self.max_pages = max_pages
+        self.base_url = base_url
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+    def show(self, key, html):
+        """Show a page, laying it out only if it is not cached. key identifies
+        the page's content, e.g. its content hash."""
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.frames.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            # tkinterweb is slow to import; it waits for the first page
+            from tkinterweb import HtmlFrame
+            with instrument.span('html.load', 'html', bytes=len(html)):
+                frame = HtmlFrame(self)
+                frame.load_html(html, base_url=self.base_url)
+            frame.grid(row=0, column=0, sticky=tk.NSEW)
+            self.frames[key] = frame
+            while len(self.frames) > self.max_pages:
+                _, evicted = self.frames.popitem(last=False)
+                evicted.destroy()
+        frame.tkraise()
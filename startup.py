@@ -0,0 +1,124 @@
+"""Startup timings for the Tk apps.
+
+A StartupTimer records named marks (window created, first frame, list shown)
+as offsets from process launch. With metrics on, it also times every module
+import the way `python -X importtime` does, including the ones deferred until
+first use, so a heavy import that creeps back onto the startup path shows up
+in the report:
+
+    python monsterui.py --startup-metrics
+
+Metrics are switched on by that flag or by MONSTERUI_STARTUP_METRICS=1. They
+have to be decided when this module is imported, before the app's own imports
+run, which is why the flag is read straight from sys.argv.
+"""
+import builtins
+import os
+import sys
+import threading
+import time
+
+METRICS_ENV = 'MONSTERUI_STARTUP_METRICS'
+METRICS_FLAG = '--startup-metrics'
+
+# Set by benchmarks/startup.py to the time.time() it launched the process at,
+# so the interpreter's own startup is counted too
+LAUNCHED_AT_ENV = 'MONSTERUI_LAUNCHED_AT'
+
+# The window should be drawn and taking input within this long of launch
+FIRST_FRAME_TARGET_MS = 250
+
+class ImportTimes:
+    """Times imports by wrapping builtins.__import__ while installed.
+
+    Records (depth, name, self seconds, cumulative seconds) per module, in the
+    order the imports finish, so nested imports come before their parent.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._local = threading.local()
+        self._original = None
+
+    def install(self):
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        # Time spent in the imports nested inside each one in progress, per thread
+        stack = getattr(self._local, 'nested', None)
+        if stack is None:
+            stack = self._local.nested = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            self.records.append((len(stack), name, cumulative - nested, cumulative))
+
+    def format(self, min_cumulative=0.0):
+        """Lines in the `-X importtime` layout, leaving out imports faster
+        than min_cumulative seconds."""
+        lines = ["import time: self [us] | cumulative | imported package"]
+        for depth, name, own, cumulative in self.records:
+            if cumulative >= min_cumulative:
+                lines.append(f"import time: {own * 1e6:9.0f} | {cumulative * 1e6:10.0f} | {'  ' * depth}{name}")
+        return lines
+
+class StartupTimer:
+    def __init__(self, enabled=False):
+        self.start = time.perf_counter()
+        launched_at = os.environ.get(LAUNCHED_AT_ENV)
+        # How long the process ran before this module was imported
+        self.offset = max(0.0, time.time() - float(launched_at)) if launched_at else 0.0
+        self.marks = []
+        self.imports = ImportTimes() if enabled else None
+        if self.imports is not None:
+            self.imports.install()
+
+    @property
+    def enabled(self):
+        return self.imports is not None
+
+    def elapsed(self):
+        """Seconds since launch."""
+        return self.offset + time.perf_counter() - self.start
+
+    def mark(self, name):
+        self.marks.append((name, self.elapsed()))
+
+    def get(self, name):
+        """Seconds from launch to a mark, or None if it was not reached."""
+        for mark, elapsed in self.marks:
+            if mark == name:
+                return elapsed
+        return None
+
+    def report(self, first_frame='first frame', target_ms=FIRST_FRAME_TARGET_MS, min_import_ms=1.0):
+        lines = []
+        if self.imports is not None:
+            lines += self.imports.format(min_import_ms / 1000)
+            lines.append("")
+        since = "launch" if self.offset else "startup.py import"
+        lines.append(f"Startup marks (ms since {since}):")
+        for name, elapsed in self.marks:
+            lines.append(f"  {elapsed * 1000:8.1f}  {name}")
+        first = self.get(first_frame)
+        if first is not None:
+            verdict = "ok" if first * 1000 <= target_ms else "OVER TARGET"
+            lines.append(f"Time to {first_frame}: {first * 1000:.1f} ms (target {target_ms} ms, {verdict})")
+        return "\n".join(lines)
+
+timer = StartupTimer(enabled=METRICS_FLAG in sys.argv[1:] or os.environ.get(METRICS_ENV) == '1')
@@ -0,0 +1,10 @@
+# Helpers for the records of ALL_Monsters.json that both the loader and the
+# JSON-reading tools need, kept apart so those tools do not import dbinsert
+
+# Return the (name, statblock) pairs of a monster, skipping anything malformed
+def iter_statblocks(monster):
+    statblocks = monster['monster_data'].get('statblock')
+    # Ensure statblocks is a dictionary before proceeding
+    if statblocks and isinstance(statblocks, dict):
+        return statblocks.items()
+    return ()
@@ -0,0 +1,146 @@
+"""Typed values parsed from the free-text statblock fields.
+
+Each parser takes the raw text of one field and returns a tuple of values
+for its typed columns, or None when the text has nothing it can use.
+"""
+import re
+
+# Size categories in increasing order; size columns hold the index
+SIZE_CATEGORIES = ('T', 'S', 'M', 'L', 'H', 'G')
+
+# 2e morale ratings and the scores they stand for
+MORALE_RATINGS = {
+    'unreliable': (2, 4),
+    'unsteady': (5, 7),
+    'average': (8, 10),
+    'steady': (11, 12),
+    'elite': (13, 14),
+    'champion': (15, 16),
+    'fanatic': (17, 18),
+    'fearless': (19, 20),
+}
+
+# 2e intelligence ratings and the scores they stand for, checked in order
+INTELLIGENCE_RATINGS = [
+    ('non', (0, 0)),
+    ('animal', (1, 1)),
+    ('semi', (2, 4)),
+    ('low', (5, 7)),
+    ('average', (8, 10)),
+    ('very', (11, 12)),
+    ('high', (13, 14)),
+    ('exceptional', (15, 16)),
+    ('supra', (19, 20)),
+    ('genius', (17, 18)),
+    ('godlike', (21, 25)),
+]
+
+def _strip_notes(text):
+    return re.sub(r"\([^)]*\)", " ", text)
+
+def _integers(text):
+    """Every whole number in the text, with thousands separators and minus signs."""
+    text = re.sub(r"(?<=\d),(?=\d{3}\b)", "", text).replace('–', '-')
+    return [int(number) for number in re.findall(r"(?<![\w])-?\d+", text)]
+
+def _range(numbers):
+    return (min(numbers), max(numbers)) if numbers else None
+
+def parse_armor_class(text):
+    """(ac_min, ac_max): "3 (base)" -> (3, 3), "4/6" -> (4, 6), "-2" -> (-2, -2)."""
+    if not text:
+        return None
+    return _range(_integers(_strip_notes(text)) or _integers(text))
+
+def parse_hit_dice(text):
+    """(hd_min, hd_max) as numbers of hit dice: "4+1" -> (4, 4), "2-5" -> (2, 5),
+    "1/2" -> (0.5, 0.5). Bonus hit points are not counted."""
+    if not text:
+        return None
+    text = _strip_notes(text).replace('–', '-')
+    fraction = re.match(r"\s*(\d+)\s*/\s*(\d+)", text)
+    if fraction and int(fraction.group(2)):
+        value = int(fraction.group(1)) / int(fraction.group(2))
+        return (value, value)
+    values = []
+    # A hit dice count is a number not preceded by + (bonus hit points) and,
+    # for "1-1", not a subtraction smaller than the number before it
+    for match in re.finditer(r"([+-]?)\s*(\d+)", text):
+        sign, number = match.group(1), int(match.group(2))
+        if sign == '+':
+            continue
+        if sign == '-' and (not values or number <= values[-1]):
+            continue
+        values.append(number)
+    return _range(values)
+
+# "12 HD: 9" or "1-2 HD: 19": a THAC0 given for a number or range of Hit Dice
+THAC0_BY_HIT_DICE_RE = re.compile(
+    r"(\d+(?:\s*/\s*\d+)?)(?:\s*[-–]\s*(\d+))?\s*\+?\s*HD\s*:?\s*(-?\d+)", re.IGNORECASE
+)
+
+def parse_thac0(text, hit_dice=None):
+    """(thac0,): the first number, so "13 (11)" -> (13,). Entries by Hit Dice
+    give the THAC0 after "HD:": "12 HD: 9" -> (9,). When there are several,
+    as in "1-2 HD: 19; 3-4 HD: 17", the one covering the statblock's Hit Dice
+    text is taken, or None if that does not settle it."""
+    if not text:
+        return None
+    by_hit_dice = THAC0_BY_HIT_DICE_RE.findall(text)
+    if by_hit_dice:
+        if len(by_hit_dice) == 1:
+            return (int(by_hit_dice[0][2]),)
+        dice = parse_hit_dice(hit_dice)
+        if dice is None or dice[0] != dice[1]:
+            return None
+        for low, high, thac0 in by_hit_dice:
+            low = parse_hit_dice(low)[0]
+            if low <= dice[0] <= (int(high) if high else low):
+                return (int(thac0),)
+        return None
+    numbers = _integers(text)
+    return (numbers[0],) if numbers else None
+
+def parse_xp(text):
+    """(xp_min, xp_max): "1,400" -> (1400, 1400), "Nil" -> (0, 0),
+    "Hatchling: 35, Adult: 5,000" -> (35, 5000)."""
+    if not text:
+        return None
+    if text.strip().lower() in ('nil', 'none', '0'):
+        return (0, 0)
+    numbers = [number for number in _integers(text) if number >= 0]
+    return _range(numbers)
+
+def parse_morale(text):
+    """(morale_min, morale_max): "Steady (11-12)" -> (11, 12), "Elite" -> (13, 14)."""
+    if not text:
+        return None
+    numbers = [abs(number) for number in _integers(text)]
+    if numbers:
+        return _range(numbers)
+    lowered = text.lower()
+    ratings = [scores for name, scores in MORALE_RATINGS.items() if name in lowered]
+    if ratings:
+        return (min(low for low, _ in ratings), max(high for _, high in ratings))
+    return None
+
+def parse_intelligence(text):
+    """(intelligence_min, intelligence_max): "Average (8-10)" -> (8, 10), "Non-" -> (0, 0)."""
+    if not text:
+        return None
+    numbers = [abs(number) for number in _integers(text)]
+    if numbers:
+        return _range(numbers)
+    lowered = text.lower()
+    for name, scores in INTELLIGENCE_RATINGS:
+        if lowered.startswith(name):
+            return scores
+    return None
+
+def parse_size(text):
+    """(size_min, size_max) as indexes into SIZE_CATEGORIES: "M (6' tall)" -> (2, 2),
+    "T-S (1-3')" -> (0, 1)."""
+    if not text:
+        return None
+    letters = re.findall(r"\b([TSMLHG])\b", _strip_notes(text).upper())
+    return _range([SIZE_CATEGORIES.index(letter) for letter in letters])
@@ -0,0 +1,25 @@
+import re
+
+# Words in a Climate/Terrain entry that say nothing about where a monster lives
+TERRAIN_STOPWORDS = {
+    'a', 'an', 'and', 'or', 'of', 'the', 'in', 'on', 'to', 'with', 'near', 'by', 'as', 'but', 'except',
+}
+
+# Reduce a word to the form stored in statblock_terrains: lowercase, singular
+def normalize_terrain_word(word):
+    word = word.lower()
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        if word.endswith('ies'):
+            return word[:-3] + 'y'
+        if word.endswith(('shes', 'ches', 'xes', 'sses')):
+            return word[:-2]
+        return word[:-1]
+    return word
+
+# Split a Climate/Terrain entry such as "Tropical/Forests and Hills" into its
+# normalized terrain tokens: {'tropical', 'forest', 'hill'}
+def terrain_tokens(climate_terrain):
+    if not climate_terrain:
+        return set()
+    words = re.findall(r"[A-Za-z]+", climate_terrain)
+    return {normalize_terrain_word(word) for word in words if word.lower() not in TERRAIN_STOPWORDS}
@@ -0,0 +1,37 @@
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURE_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'monsters.json')
+
+
+@pytest.fixture
+def fixture_json():
+    """Path of a small compendium in the shape of ALL_Monsters.json."""
+    return FIXTURE_JSON
+
+
+@pytest.fixture
+def monsters():
+    """The records of the fixture compendium, a fresh copy for each test."""
+    with open(FIXTURE_JSON, encoding='utf-8') as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def fixture_db(tmp_path):
+    """Path of a database loaded from the fixture compendium."""
+    import dbinsert
+
+    path = str(tmp_path / 'monsters.db')
+    conn = sqlite3.connect(path)
+    dbinsert.create_schema(conn)
+    dbinsert.bulk_load(conn, dbinsert.iter_monster_data(FIXTURE_JSON))
+    conn.close()
+    return path
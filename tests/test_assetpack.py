@@ -0,0 +1,57 @@
+import gc
+import sqlite3
+
+import pytest
+
+import assetpack
+
+
+@pytest.fixture
+def pack_path(tmp_path):
+    (tmp_path / 'img').mkdir()
+    (tmp_path / 'grf').mkdir()
+    (tmp_path / 'img' / 'beh.gif').write_bytes(b'GIF89a beholder')
+    (tmp_path / 'img' / 'orc.gif').write_bytes(b'GIF89a orc')
+    (tmp_path / 'grf' / 'map.gif').write_bytes(b'GIF89a map')
+    path = str(tmp_path / 'assets.pack')
+    assert assetpack.build_pack(path, str(tmp_path)) == 3
+    return path
+
+
+def test_lookups(pack_path):
+    pack = assetpack.AssetPack(pack_path)
+    assert sorted(pack.names()) == ['grf/map.gif', 'img/beh.gif', 'img/orc.gif']
+    assert bytes(pack.get('IMG\\Beh.gif')) == b'GIF89a beholder'
+    assert bytes(pack.get('map.gif')) == b'GIF89a map'
+    assert pack.get('missing.gif') is None
+    assert pack.open('orc.gif').read() == b'GIF89a orc'
+    assert assetpack.index_problems(pack) == []
+    pack.close()
+
+
+def test_close_with_views_still_held(pack_path):
+    pack = assetpack.AssetPack(pack_path)
+    view = pack.get('img/beh.gif')
+    header = view[:6]
+    opened = pack.open('img/orc.gif')
+    pack.close()
+    with pytest.raises(ValueError):
+        bytes(view)
+    # A slice taken of a view keeps its bytes until it is let go of
+    assert bytes(header) == b'GIF89a'
+    assert opened.read() == b'GIF89a orc'
+    del header
+    gc.collect()
+
+
+def test_missing_images_compares_full_paths(pack_path, tmp_path):
+    db_path = str(tmp_path / 'monsters.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE images (monster_id INTEGER, image_url TEXT)')
+    conn.executemany('INSERT INTO images VALUES (?, ?)', [(1, 'beh.gif'), (2, 'map.gif'), (3, 'gone.gif'), (4, None)])
+    conn.commit()
+    conn.close()
+    pack = assetpack.AssetPack(pack_path)
+    # map.gif is packed, but under grf/ rather than img/
+    assert sorted(assetpack.missing_images(pack, db_path)) == ['gone.gif', 'map.gif']
+    pack.close()
@@ -0,0 +1,20 @@
+import json
+import os
+
+from benchmarks import suite
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_suite_runs_with_few_runs(tmp_path, monkeypatch, capsys):
+    # The suite reads img/ and the asset pack relative to the repository
+    monkeypatch.chdir(ROOT)
+    output = tmp_path / 'results.json'
+    status = suite.main(['--scales', '0.02', '--runs', '3', '--workdir', str(tmp_path),
+                         '--only', 'list', 'search', 'detail', 'filtered', 'encounter', 'engen',
+                         '--output', str(output)])
+    assert status == 0
+    report = json.loads(output.read_text(encoding='utf-8'))
+    names = {result['benchmark'] for result in report['results']}
+    assert names == {'list', 'search', 'detail', 'filtered', 'encounter', 'engen'}
+    assert report['runs'] == 3
@@ -0,0 +1,194 @@
+import copy
+import json
+import sqlite3
+
+import pytest
+
+import dbinsert
+
+MONSTERS = [
+    {'title': 'Aarakocra', 'monster_data': {'statblock': {'Hit Dice': '1+2', 'THAC0': '19'}}},
+    {'title': 'Beholder', 'monster_data': {'description': 'x' * 300}},
+    {'title': 'Caterwaul, "the" cat', 'monster_data': {}},
+]
+
+
+def write(tmp_path, text):
+    path = tmp_path / 'monsters.json'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64, 1 << 16])
+def test_iter_monster_data_across_chunks(tmp_path, chunk_size):
+    path = write(tmp_path, json.dumps(MONSTERS, indent=2))
+    assert list(dbinsert.iter_monster_data(path, chunk_size=chunk_size)) == MONSTERS
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 5])
+def test_iter_monster_data_numbers_split_by_chunks(tmp_path, chunk_size):
+    path = write(tmp_path, '[12345, 678 ,\n9]')
+    assert list(dbinsert.iter_monster_data(path, chunk_size=chunk_size)) == [12345, 678, 9]
+
+
+@pytest.mark.parametrize('text', ['[]', '  [ ]\n', ''])
+def test_iter_monster_data_empty(tmp_path, text):
+    path = write(tmp_path, text)
+    if text:
+        assert list(dbinsert.iter_monster_data(path, chunk_size=2)) == []
+    else:
+        with pytest.raises(ValueError, match='top-level JSON array'):
+            list(dbinsert.iter_monster_data(path))
+
+
+def test_iter_monster_data_streams(tmp_path):
+    path = write(tmp_path, json.dumps(MONSTERS) + 'not JSON')
+    monsters = dbinsert.iter_monster_data(path, chunk_size=4)
+    assert next(monsters) == MONSTERS[0]
+
+
+@pytest.mark.parametrize('cut', [1, 20, -40, -2, -1])
+def test_iter_monster_data_truncated(tmp_path, cut):
+    text = json.dumps(MONSTERS)
+    path = write(tmp_path, text[:cut])
+    with pytest.raises(ValueError):
+        list(dbinsert.iter_monster_data(path, chunk_size=8))
+
+
+def test_iter_monster_data_missing_comma(tmp_path):
+    path = write(tmp_path, '[{"title": "A"} {"title": "B"}]')
+    with pytest.raises(ValueError, match="expected ','"):
+        list(dbinsert.iter_monster_data(path, chunk_size=4))
+
+
+def test_iter_monster_data_not_an_array(tmp_path):
+    path = write(tmp_path, '{"title": "A"}')
+    with pytest.raises(ValueError, match='top-level JSON array'):
+        list(dbinsert.iter_monster_data(path))
+
+
+def load(conn, monsters, workers=1):
+    dbinsert.create_schema(conn)
+    return dbinsert.bulk_load(conn, iter(monsters), batch_size=2, workers=workers)
+
+
+def ids_by_key(conn):
+    return dict(conn.execute('SELECT monster_key, id FROM monsters'))
+
+
+def child_rows(conn, monster_id):
+    return {
+        'statblocks': conn.execute('SELECT COUNT(*) FROM statblocks WHERE monster_id = ?', (monster_id,)).fetchone()[0],
+        'statblock_terrains': conn.execute('''
+            SELECT COUNT(*) FROM statblock_terrains
+            WHERE statblock_id NOT IN (SELECT id FROM statblocks)
+        ''').fetchone()[0],
+        'images': conn.execute('SELECT COUNT(*) FROM images WHERE monster_id = ?', (monster_id,)).fetchone()[0],
+        'monsters_fts': conn.execute('SELECT COUNT(*) FROM monsters_fts WHERE rowid = ?', (monster_id,)).fetchone()[0],
+        'rendered_pages': conn.execute('SELECT COUNT(*) FROM rendered_pages WHERE monster_id = ?',
+                                       (monster_id,)).fetchone()[0],
+        'monster_bodies': conn.execute('SELECT COUNT(*) FROM monster_bodies WHERE monster_id = ?',
+                                       (monster_id,)).fetchone()[0],
+    }
+
+
+def test_sync_counts_and_cleanup(monsters):
+    conn = sqlite3.connect(':memory:')
+    count, _, _ = load(conn, monsters)
+    assert count == len(monsters)
+    before = ids_by_key(conn)
+
+    edited = copy.deepcopy(monsters)
+    edited[1]['title'] = 'Beholder, Lesser'
+    del edited[1]['monster_data']['statblock']['Elder orb']
+    deleted = edited.pop(2)
+    edited.append(dict(copy.deepcopy(monsters[0]), monster_key='kenku', title='Kenku'))
+
+    counts = dbinsert.sync_monsters(conn, iter(edited), batch_size=2)
+    assert {key: counts[key] for key in ('inserted', 'updated', 'deleted', 'unchanged', 'skipped')} == {
+        'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': len(monsters) - 2, 'skipped': 0,
+    }
+
+    after = ids_by_key(conn)
+    assert deleted['monster_key'] not in after
+    assert after['beholder'] == before['beholder']
+    assert after['kenku'] > max(before.values())
+    assert child_rows(conn, before[deleted['monster_key']]) == dict.fromkeys(
+        ('statblocks', 'statblock_terrains', 'images', 'monsters_fts', 'rendered_pages', 'monster_bodies'), 0)
+
+    beholder = after['beholder']
+    assert conn.execute('SELECT title FROM monsters WHERE id = ?', (beholder,)).fetchone() == ('Beholder, Lesser',)
+    assert conn.execute('SELECT name FROM statblocks WHERE monster_id = ?', (beholder,)).fetchall() == [('Beholder',)]
+    assert child_rows(conn, beholder)['images'] == 2
+
+    counts = dbinsert.sync_monsters(conn, iter(edited))
+    assert counts['unchanged'] == len(edited)
+    assert counts['inserted'] == counts['updated'] == counts['deleted'] == 0
+
+
+def test_duplicate_keys_are_skipped(monsters, capsys):
+    repeated = monsters + [dict(copy.deepcopy(monsters[3]), title='Orc, again')]
+    conn = sqlite3.connect(':memory:')
+    count, _, _ = load(conn, repeated)
+    assert count == len(monsters)
+    assert "duplicate monster_key 'orc'" in capsys.readouterr().out
+
+    repeated.append(dict(copy.deepcopy(monsters[0]), monster_key='kenku', title='Kenku'))
+    repeated.append(dict(copy.deepcopy(monsters[0]), monster_key='kenku', title='Kenku, again'))
+    counts = dbinsert.sync_monsters(conn, iter(repeated), batch_size=2)
+    assert (counts['inserted'], counts['skipped'], counts['unchanged']) == (1, 2, len(monsters))
+    assert conn.execute("SELECT title FROM monsters WHERE monster_key IN ('orc', 'kenku') ORDER BY id").fetchall() == [
+        ('Orc',), ('Kenku',)]
+
+
+# table -> (columns, order)
+TABLES = {
+    'monsters': ('*', 'id'),
+    'statblocks': ('*', 'id'),
+    'statblock_terrains': ('*', 'statblock_id, token'),
+    'images': ('*', 'monster_id, image_url'),
+    'monster_bodies': ('*', 'monster_id'),
+    'rendered_pages': ('*', 'monster_id'),
+    'monsters_fts': ('rowid, *', 'rowid'),
+}
+
+
+def dump(conn):
+    return {table: conn.execute(f'SELECT {columns} FROM {table} ORDER BY {order}').fetchall()
+            for table, (columns, order) in TABLES.items()}
+
+
+def test_parallel_load_matches_serial(monsters, monkeypatch):
+    # Several jobs per batch, so the merge order of worker results counts
+    monkeypatch.setattr(dbinsert, 'TRANSFORM_CHUNK_SIZE', 1)
+    many = monsters + [dict(copy.deepcopy(monster), monster_key=f"{monster['monster_key']}-2")
+                       for monster in monsters]
+    serial, parallel = sqlite3.connect(':memory:'), sqlite3.connect(':memory:')
+    load(serial, many, workers=1)
+    load(parallel, many, workers=2)
+    assert dump(parallel) == dump(serial)
+    assert all(dump(serial).values())
+
+    edited = copy.deepcopy(many)
+    edited[0]['title'] = 'Aarakocra, Elder'
+    del edited[5]
+    for conn, workers in ((serial, 1), (parallel, 2)):
+        dbinsert.sync_monsters(conn, iter(edited), batch_size=2, workers=workers)
+    assert dump(parallel) == dump(serial)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_bad_record_is_named_and_nothing_is_written(monsters, workers):
+    monsters.append({'monster_key': 'broken', 'title': 'Broken'})
+    conn = sqlite3.connect(':memory:')
+    dbinsert.create_schema(conn)
+    with pytest.raises(ValueError, match=r"cannot load monster 7 \('Broken'\): KeyError: 'monster_data'"):
+        dbinsert.bulk_load(conn, iter(monsters), batch_size=2, workers=workers)
+    assert conn.execute('SELECT COUNT(*) FROM monsters').fetchone() == (0,)
+    assert conn.execute('SELECT COUNT(*) FROM statblocks').fetchone() == (0,)
+
+
+def test_main_reports_a_bad_record(tmp_path, monsters):
+    json_path = write(tmp_path, json.dumps(monsters + [{'monster_key': 'broken', 'title': 'Broken'}]))
+    with pytest.raises(SystemExit, match="cannot load monster 7 .* was not changed"):
+        dbinsert.main([json_path, '--db', str(tmp_path / 'monsters.db'), '--workers', '2'])
@@ -0,0 +1,91 @@
+import pytest
+
+from dice import DiceParseError, numpy_module, parse_ast, parse_dice
+
+
+def moments(expression):
+    mean = sum(value * p for value, p in expression.distribution)
+    variance = sum((value - mean) ** 2 * p for value, p in expression.distribution)
+    return mean, variance
+
+
+@pytest.mark.parametrize('text, mean, variance, low, high', [
+    ('d6', 3.5, 35 / 12, 1, 6),
+    ('3d6', 10.5, 35 / 4, 3, 18),
+    ('3d4+2', 9.5, 15 / 4, 5, 14),
+    ('1d6-1', 2.5, 35 / 12, 0, 5),
+    ('2d10 x 5', 55, 25 * 33 / 2, 10, 100),
+    ('2-12', 7, 10, 2, 12),
+    ('1d6 (in lair)', 3.5, 35 / 12, 1, 6),
+    ('1,000', 1000, 0, 1000, 1000),
+])
+def test_exact_moments(text, mean, variance, low, high):
+    expression = parse_dice(text)
+    assert moments(expression) == pytest.approx((mean, variance))
+    assert expression.mean == pytest.approx(mean)
+    assert (expression.minimum, expression.maximum) == (low, high)
+    assert sum(p for _, p in expression.distribution) == pytest.approx(1)
+
+
+def test_range_is_uniform():
+    expression = parse_dice('2-5')
+    assert expression.distribution == pytest.approx([(2, 0.25), (3, 0.25), (4, 0.25), (5, 0.25)])
+
+
+def test_alternatives_are_equally_likely():
+    # Half 1-4, half 2d6
+    assert parse_dice('1-4 or 2d6').mean == pytest.approx((2.5 + 7) / 2)
+    assert parse_dice('2d4/1d6').mean == pytest.approx((5 + 3.5) / 2)
+
+
+def test_one_minus_one_is_a_subtraction():
+    assert parse_ast('1-1') == ['+', ['c', 1], ['c', -1]]
+    assert parse_dice('1-1').distribution == [(0, 1.0)]
+
+
+@pytest.mark.parametrize('text, mean, low, high', [
+    ('1-1', 3.5, 0, 7),
+    ('4+1', 19, 5, 33),
+    ('3', 13.5, 3, 24),
+    ('1/2', 2.5, 1, 4),
+    ('1-3', 9, 1, 24),
+])
+def test_hit_dice(text, mean, low, high):
+    expression = parse_dice(text, 'hit_dice')
+    assert expression.mean == pytest.approx(mean)
+    assert (expression.minimum, expression.maximum) == (low, high)
+
+
+def test_damage_attacks():
+    expression = parse_dice('1d6/1d6/2d8', 'damage')
+    assert [attack.mean for attack in expression.attacks()] == pytest.approx([3.5, 3.5, 9])
+    assert expression.mean == pytest.approx(16)
+    assert parse_dice('1d6/1d6/2d8').attacks() == [parse_dice('1d6/1d6/2d8')]
+
+
+@pytest.mark.parametrize('text', ['by weapon', 'Nil', '', None, '1d9999'])
+def test_no_dice(text):
+    assert parse_dice(text) is None
+
+
+def test_parse_errors():
+    with pytest.raises(DiceParseError):
+        parse_ast('1d0')
+    with pytest.raises(DiceParseError):
+        parse_ast('1-5000')
+
+
+def test_json_round_trip():
+    expression = parse_dice('1-4 or 2d6+1')
+    assert type(expression).from_json(expression.to_json()).distribution == expression.distribution
+
+
+def test_bulk_rolls_follow_the_distribution():
+    np = numpy_module()
+    if np is None:
+        pytest.skip("needs NumPy")
+    expression = parse_dice('3d6')
+    rolls = expression.roll(200_000, np.random.default_rng(1))
+    assert rolls.min() >= 3 and rolls.max() <= 18
+    assert rolls.mean() == pytest.approx(10.5, abs=0.05)
+    assert rolls.var() == pytest.approx(35 / 4, rel=0.02)
@@ -0,0 +1,37 @@
+import engen
+
+
+def record(statblock_id, climate_terrain, setting=None):
+    return engen.StatblockRecord(statblock_id, statblock_id, f"Monster {statblock_id}", '', '5', '2', '1', '19',
+                                 '35', setting, climate_terrain)
+
+
+RECORDS = [
+    record(1, "Tropical/Hills and Forests"),
+    record(2, "Any desert", "Dark Sun"),
+    record(3, "Temperate hill"),
+    record(4, "Deserted ruins"),
+    record(5, None),
+]
+
+
+def ids(records):
+    return [record.statblock_id for record in records]
+
+
+def test_records_keep_their_terrain_words():
+    assert RECORDS[0].terrain_keys == {'tropical', 'hill', 'forest'}
+    assert RECORDS[4].terrain_keys == frozenset()
+
+
+def test_environment_matches_whole_normalized_words():
+    assert ids(engen.filter_monsters(RECORDS, 'hills')) == [1, 3]
+    assert ids(engen.filter_monsters(RECORDS, 'Tropical hill')) == [1]
+    # A word inside another one is not a match
+    assert ids(engen.filter_monsters(RECORDS, 'desert')) == [2]
+    assert ids(engen.filter_monsters(RECORDS, 'sert')) == []
+
+
+def test_no_environment_and_setting():
+    assert ids(engen.filter_monsters(RECORDS)) == [1, 2, 3, 4, 5]
+    assert ids(engen.filter_monsters(RECORDS, 'the', 'dark sun')) == [2]
@@ -0,0 +1,42 @@
+import pytest
+
+import monsterdb
+
+
+@pytest.fixture
+def db(fixture_db):
+    db = monsterdb.MonsterDB(fixture_db)
+    yield db
+    db.close()
+
+
+def by_title(rows):
+    return {title: snippet for _, title, snippet in rows}
+
+
+def test_snippets_mark_body_matches(db):
+    snippets = by_title(db.get_monster_list('notes'))
+    assert list(snippets) == ['Aarakocra']
+    # The match is highlighted; the brackets already in the text stay as they are
+    assert '[notes]' in snippets['Aarakocra'] and '[see' in snippets['Aarakocra']
+
+
+def test_no_snippet_without_a_body_match(db):
+    # One-letter searches only look at titles and sources, and the body's own
+    # brackets are not mistaken for a highlighted match
+    snippets = by_title(db.get_monster_list('a'))
+    assert 'Aarakocra' in snippets
+    assert set(snippets.values()) == {None}
+
+
+def test_snippets_only_for_the_first_rows(db, monkeypatch):
+    monkeypatch.setattr(monsterdb, 'SNIPPET_ROWS', 2)
+    rows = db.get_monster_list('hills')
+    assert len(rows) == 3
+    assert [snippet is not None for _, _, snippet in rows] == [True, True, False]
+
+
+def test_unfiltered_list(db):
+    rows = db.get_monster_list('')
+    assert [title for _, title, _ in rows] == sorted(title for _, title, _ in rows)
+    assert {snippet for _, _, snippet in rows} == {None}
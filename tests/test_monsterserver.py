@@ -0,0 +1,83 @@
+import asyncio
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import monsterdb
+import monsterserver
+
+
+@pytest.fixture
+def service(fixture_db):
+    db = monsterdb.MonsterDB(fixture_db)
+    yield monsterserver.MonsterService(db)
+    db.close()
+
+
+def page_target(service):
+    monster_id = service.db.get_monster_list()[0][0]
+    return f'/monsters/{monster_id}/page'
+
+
+def test_gzip_has_its_own_etag(service, monkeypatch):
+    # The fixture's pages are short
+    monkeypatch.setattr(monsterserver, 'MIN_COMPRESS_SIZE', 0)
+    target = page_target(service)
+    plain = service.handle('GET', target, {})
+    packed = service.handle('GET', target, {'accept-encoding': 'gzip, deflate'})
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(packed.body) == plain.body
+    assert plain.etag and packed.etag == plain.etag[:-1] + '-gz"'
+
+    # Each tag only revalidates its own encoding
+    assert service.handle('GET', target, {'if-none-match': plain.etag}).status == 304
+    assert service.handle('GET', target, {'if-none-match': packed.etag}).status == 200
+    revalidated = service.handle('GET', target, {'if-none-match': packed.etag, 'accept-encoding': 'gzip'})
+    assert (revalidated.status, revalidated.etag) == (304, packed.etag)
+    assert service.handle('GET', target, {'if-none-match': plain.etag, 'accept-encoding': 'gzip'}).status == 200
+
+
+def test_concurrent_encounters(service):
+    def encounters(seed):
+        response = service.handle('GET', f'/encounters?level=3&count=20&seed={seed % 5}', {})
+        return response.status, response.body
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(encounters, range(200)))
+    assert {status for status, _ in results} == {200}
+    # The same seed gives the same encounters, whatever else runs at once
+    for seed in range(5):
+        assert len({body for (_, body), i in zip(results, range(200)) if i % 5 == seed}) == 1
+    assert json.loads(results[0][1])
+
+
+@pytest.mark.parametrize('length', ['abc', '-5'])
+def test_bad_content_length(service, length):
+    async def exchange():
+        server = monsterserver.MonsterServer(service, workers=1)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET /monsters HTTP/1.1\r\nContent-Length: {length}\r\n\r\n'.encode('latin-1'))
+        await writer.drain()
+        reply = await reader.read()
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        server.close()
+        return reply
+
+    reply = asyncio.run(exchange())
+    assert reply.startswith(b'HTTP/1.1 400 ')
+    assert b'Connection: close' in reply
+
+
+def test_cached_list_is_not_gzipped_in_place(service, monkeypatch):
+    monkeypatch.setattr(monsterserver, 'MIN_COMPRESS_SIZE', 0)
+    packed = service.handle('GET', '/monsters', {'accept-encoding': 'gzip'})
+    plain = service.handle('GET', '/monsters', {})
+    assert 'Content-Encoding' not in plain.headers
+    assert json.loads(plain.body) == json.loads(gzip.decompress(packed.body))
+    assert service.handle('GET', '/monsters', {'accept-encoding': 'gzip'}).etag == packed.etag
@@ -0,0 +1,39 @@
+import pytest
+
+import dbinsert
+import statparse
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('13 (11)', (13,)),
+    ('-1', (-1,)),
+    ('Nil', None),
+    ('', None),
+    ('12 HD: 9', (9,)),
+    ('2 HD: 19', (19,)),
+    ('25 HD: 1', (1,)),
+    ('9+ HD: 11', (11,)),
+])
+def test_parse_thac0(text, expected):
+    assert statparse.parse_thac0(text) == expected
+
+
+@pytest.mark.parametrize('text, hit_dice, expected', [
+    ('1-2 HD: 19; 3-4 HD: 17', '2', (19,)),
+    ('1-2 HD: 19; 3-4 HD: 17', '3+1', (17,)),
+    ('1-2 HD: 19; 3-4 HD: 17', '9', None),
+    ('1-2 HD: 19; 3-4 HD: 17', '2-4', None),
+    ('1-2 HD: 19; 3-4 HD: 17', None, None),
+    ('1/2 HD: 20; 1 HD: 19; 2-3 HD: 17', '1/2', (20,)),
+    ('1/2 HD: 20; 1 HD: 19; 2-3 HD: 17', '1+1', (19,)),
+    ('1/2 HD: 20; 1 HD: 19; 2-3 HD: 17', '3', (17,)),
+])
+def test_parse_thac0_by_hit_dice(text, hit_dice, expected):
+    assert statparse.parse_thac0(text, hit_dice) == expected
+
+
+def test_derived_values_pass_hit_dice_to_thac0():
+    column = dbinsert.DERIVED_STATBLOCK_COLUMNS.index('thac0_value')
+    statblock = {'THAC0': '1-2 HD: 19; 3-4 HD: 17', 'Hit Dice': '4'}
+    assert dbinsert.derived_values(statblock)[column] == 17
+    assert dbinsert.derived_values({'THAC0': '12 HD: 9'})[column] == 9
@@ -0,0 +1,200 @@
+"""Pre-sized thumbnails for the monster pictures in img/.
+
+Thumbnails are PNGs in a cache directory, one per source image, stamped with
+the source file's mtime so a changed source is noticed and redone. Build them
+all up front with
+
+    python thumbnails.py --workers 8
+
+and the browser only ever loads the small PNGs, keeping the most recent ones
+as PhotoImages in an in-memory LRU. With an asset pack (assetpack.py) the
+sources are read from the pack instead of img/.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+import tkinter as tk
+from collections import OrderedDict
+
+import instrument
+
+log = logging.getLogger('thumbnails')
+
+IMAGE_DIR = 'img'
+THUMBNAIL_DIR = 'thumbs'
+THUMBNAIL_SIZE = (150, 150)
+IMAGE_EXTENSIONS = ('.gif', '.png', '.jpg', '.jpeg')
+
+def thumbnail_path(image_name, thumbnail_dir=THUMBNAIL_DIR):
+    return os.path.join(thumbnail_dir, os.path.splitext(image_name)[0] + '.png')
+
+def is_fresh(source_path, target_path, source_mtime_ns=None):
+    """True if target_path was made from the current version of source_path.
+    source_mtime_ns stands in for the source's mtime when it is packed."""
+    try:
+        if source_mtime_ns is None:
+            source_mtime_ns = os.stat(source_path).st_mtime_ns
+        return os.stat(target_path).st_mtime_ns == source_mtime_ns
+    except FileNotFoundError:
+        return False
+
+@instrument.traced('image.thumbnail', 'image')
+def make_thumbnail(source, target_path, size=THUMBNAIL_SIZE, source_mtime_ns=None):
+    """Resize one image into a PNG thumbnail carrying the source's mtime.
+    source is a path, or a file object given with source_mtime_ns."""
+    # PIL is only needed once a thumbnail has to be made, so the browser
+    # does not pay for importing it at startup
+    from PIL import Image
+
+    with Image.open(source) as image:
+        thumbnail = image.convert('RGBA').resize(size, Image.LANCZOS)
+    # Unique per writer, so two threads or processes never share a temp file
+    temporary_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    thumbnail.save(temporary_path, 'PNG', optimize=False)
+    source_mtime = source_mtime_ns if source_mtime_ns is not None else os.stat(source).st_mtime_ns
+    os.utime(temporary_path, ns=(source_mtime, source_mtime))
+    os.replace(temporary_path, target_path)
+
+# Process-pool entry point; returns an error message instead of raising so one
+# bad file does not abort the whole run
+def _thumbnail_job(job):
+    source_path, target_path, size = job
+    try:
+        make_thumbnail(source_path, target_path, size)
+        return None
+    except Exception as e:
+        return f"{source_path}: {e}"
+
+def generate_thumbnails(image_dir=IMAGE_DIR, thumbnail_dir=THUMBNAIL_DIR, size=THUMBNAIL_SIZE,
+                        workers=None, force=False):
+    """Bring the thumbnail cache up to date across a pool of processes.
+
+    Returns (made, skipped, errors).
+    """
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    jobs = []
+    skipped = 0
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        source_path = os.path.join(image_dir, name)
+        target_path = thumbnail_path(name, thumbnail_dir)
+        if not force and is_fresh(source_path, target_path):
+            skipped += 1
+        else:
+            jobs.append((source_path, target_path, size))
+
+    errors = []
+    if jobs:
+        # Imported here: multiprocessing is slow to import and the browser never needs it
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for error in pool.map(_thumbnail_job, jobs, chunksize=32):
+                if error:
+                    errors.append(error)
+    return len(jobs) - len(errors), skipped, errors
+
+class ThumbnailCache:
+    """LRU of PhotoImage thumbnails keyed by image file name.
+
+    A miss loads the cached PNG, making it first if it is missing or stale, so
+    the browser works even if generate_thumbnails was never run. Given an
+    AssetPack, source images are read from it rather than from image_dir.
+    """
+
+    def __init__(self, master, max_images=256, image_dir=IMAGE_DIR, thumbnail_dir=THUMBNAIL_DIR,
+                 size=THUMBNAIL_SIZE, pack=None):
+        self.master = master
+        self.pack = pack
+        self.max_images = max_images
+        self.image_dir = image_dir
+        self.thumbnail_dir = thumbnail_dir
+        self.size = size
+        self.images = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def prepare(self, image_name):
+        """Make sure the thumbnail PNG for an image exists and is fresh, and
+        return its path (or None). Only touches files, so it is safe to call
+        from a worker thread ahead of get()."""
+        if self.pack is not None:
+            return self._prepare_packed(image_name)
+        source_path = os.path.join(self.image_dir, image_name)
+        if not os.path.exists(source_path):
+            log.warning("Image path does not exist: %s", source_path)
+            return None
+        target_path = thumbnail_path(image_name, self.thumbnail_dir)
+        try:
+            if not is_fresh(source_path, target_path):
+                os.makedirs(self.thumbnail_dir, exist_ok=True)
+                make_thumbnail(source_path, target_path, self.size)
+        except Exception as e:
+            log.warning("Error loading image %s: %s", source_path, e)
+            return None
+        return target_path
+
+    def _prepare_packed(self, image_name):
+        packed_name = self.pack.resolve(f"{IMAGE_DIR}/{image_name}")
+        if packed_name is None:
+            log.warning("Image is not in the asset pack: %s", image_name)
+            return None
+        target_path = thumbnail_path(image_name, self.thumbnail_dir)
+        source_mtime = self.pack.mtime_ns(packed_name)
+        try:
+            if not is_fresh(None, target_path, source_mtime):
+                os.makedirs(self.thumbnail_dir, exist_ok=True)
+                make_thumbnail(self.pack.open(packed_name), target_path, self.size, source_mtime)
+        except Exception as e:
+            log.warning("Error loading image %s: %s", packed_name, e)
+            return None
+        return target_path
+
+    def get(self, image_name, prepared_path=None):
+        """Return the PhotoImage thumbnail for an image in image_dir, or None.
+
+        Must be called on the Tk thread. prepared_path is the result of an
+        earlier prepare() call, which saves re-checking the files.
+        """
+        image = self.images.get(image_name)
+        if image is not None:
+            self.images.move_to_end(image_name)
+            self.hits += 1
+            return image
+
+        self.misses += 1
+        target_path = prepared_path or self.prepare(image_name)
+        if target_path is None:
+            return None
+        try:
+            with instrument.span('image.decode', 'image'):
+                image = tk.PhotoImage(master=self.master, file=target_path)
+        except Exception as e:
+            log.warning("Error loading image %s: %s", target_path, e)
+            return None
+
+        self.images[image_name] = image
+        if len(self.images) > self.max_images:
+            self.images.popitem(last=False)
+        return image
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the thumbnail cache for img/.")
+    parser.add_argument('--images', default=IMAGE_DIR)
+    parser.add_argument('--thumbnails', default=THUMBNAIL_DIR)
+    parser.add_argument('--workers', type=int, default=None, help="processes to use (default: one per CPU)")
+    parser.add_argument('--force', action='store_true', help="rebuild thumbnails even if they are fresh")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    made, skipped, errors = generate_thumbnails(args.images, args.thumbnails, workers=args.workers,
+                                                force=args.force)
+    elapsed = time.perf_counter() - start
+    for error in errors:
+        print(f"Error: {error}")
+    print(f"{made} thumbnails made, {skipped} already fresh, {len(errors)} failed in {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import tkinter as tk
+from tkinter import ttk
+import tkinter.font as tkfont
+
+# Rows to scroll for a <MouseWheel> delta. Windows reports 120 per notch;
+# macOS reports small deltas of a few units, which still move at least a row
+def wheel_rows(delta):
+    if delta == 0:
+        return 0
+    rows = int(-delta / 120 * 3)
+    return rows or (-1 if delta > 0 else 1)
+
+class VirtualList(ttk.Frame):
+    """A scrolling list that only materializes the rows currently on screen.
+
+    The full list of strings lives in Python; the inner tk.Listbox only ever
+    holds one screenful of it, so replacing thousands of rows costs the same as
+    replacing thirty. Offers the handful of Listbox methods the apps use
+    (curselection, get, size, select_set, select_clear, see) with absolute row
+    indexes, and generates <<ListboxSelect>> on itself when the user picks a row.
+    """
+
+    def __init__(self, master, **listbox_options):
+        super().__init__(master)
+        self.rows = []
+        self.top = 0
+        self.selected = None
+
+        self.listbox = tk.Listbox(self, exportselection=False, **listbox_options)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.listbox.pack(side="left", fill="both", expand=True)
+
+        self.row_height = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace") + 1
+
+        self.listbox.bind("<Configure>", lambda event: self.refresh())
+        self.listbox.bind("<<ListboxSelect>>", self._on_listbox_select)
+        self.listbox.bind("<MouseWheel>", lambda event: self._scroll_by(wheel_rows(event.delta)))
+        self.listbox.bind("<Button-4>", lambda event: self._scroll_by(-3))
+        self.listbox.bind("<Button-5>", lambda event: self._scroll_by(3))
+        self.listbox.bind("<Up>", lambda event: self._move_selection(-1))
+        self.listbox.bind("<Down>", lambda event: self._move_selection(1))
+        self.listbox.bind("<Prior>", lambda event: self._move_selection(-self.visible_count()))
+        self.listbox.bind("<Next>", lambda event: self._move_selection(self.visible_count()))
+        self.listbox.bind("<Home>", lambda event: self._move_selection(-len(self.rows)))
+        self.listbox.bind("<End>", lambda event: self._move_selection(len(self.rows)))
+
+    def set_rows(self, rows):
+        """Replace the contents of the list and scroll back to the top."""
+        self.rows = rows
+        self.top = 0
+        self.selected = None
+        self.refresh()
+
+    def visible_count(self):
+        return max(1, self.listbox.winfo_height() // self.row_height)
+
+    def refresh(self):
+        """Redraw the visible window of rows."""
+        visible = self.visible_count()
+        self.top = max(0, min(self.top, len(self.rows) - visible))
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *self.rows[self.top:self.top + visible])
+        if self.selected is not None and self.top <= self.selected < self.top + visible:
+            self.listbox.selection_set(self.selected - self.top)
+            self.listbox.activate(self.selected - self.top)
+
+        if self.rows:
+            self.scrollbar.set(self.top / len(self.rows), min(1.0, (self.top + visible) / len(self.rows)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def yview(self, *args):
+        """Scrollbar command: ("moveto", fraction) or ("scroll", n, "units"/"pages")."""
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.rows))
+            self.refresh()
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self._scroll_by(step * self.visible_count() if args[2] == "pages" else step)
+
+    def _scroll_by(self, rows):
+        self.top += rows
+        self.refresh()
+        return "break"
+
+    def see(self, index):
+        """Scroll so the row at index is visible."""
+        visible = self.visible_count()
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + visible:
+            self.top = index - visible + 1
+        self.refresh()
+
+    def _on_listbox_select(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.top + selection[0]
+            self.event_generate("<<ListboxSelect>>")
+
+    def _move_selection(self, step):
+        if self.rows:
+            current = self.selected if self.selected is not None else self.top - (1 if step > 0 else 0)
+            self.select_set(max(0, min(len(self.rows) - 1, current + step)))
+            self.event_generate("<<ListboxSelect>>")
+        return "break"
+
+    def curselection(self):
+        return () if self.selected is None else (self.selected,)
+
+    def get(self, index):
+        return self.rows[index]
+
+    def size(self):
+        return len(self.rows)
+
+    def select_clear(self, first=0, last=None):
+        self.selected = None
+        self.listbox.selection_clear(0, tk.END)
+
+    def select_set(self, index):
+        self.selected = index
+        self.listbox.selection_clear(0, tk.END)
+        self.see(index)